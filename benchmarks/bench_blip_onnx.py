@@ -0,0 +1,92 @@
+'''
+BLIP 캡션 생성의 HF(PyTorch eager) 경로와 ONNX Runtime 경로를 비교하는 벤치마크
+같은 이미지에 대해 두 경로의 캡션이 같은지 확인하고, 이미지 1장 / 배치 단위 지연시간을 잼
+ONNX 모델이 없으면 로컬에 캐시된 체크포인트로부터 먼저 내보냄 (네트워크 불필요)
+
+실행: python benchmarks/bench_blip_onnx.py [--images 이미지_폴더] [--onnx-dir 폴더] [--batch 4] [--beams 1] [--repeat 5]
+'''
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+from transformers import BlipForConditionalGeneration, BlipProcessor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recever.utils.ImageCaption.image_caption import BLIP_MODEL_NAME
+from recever.utils.ImageCaption.onnx_blip import CONFIG_FILE, DEFAULT_ONNX_DIR, OnnxBlipCaptioner, export_onnx
+
+
+def load_images(directory: str | None, count: int = 8) -> list[Image.Image]:
+    if directory:
+        files = sorted(os.listdir(directory))[:count]
+        return [Image.open(os.path.join(directory, f)).convert("RGB") for f in files]
+
+    # 샘플 이미지가 없으면 부드러운 그라디언트 이미지를 사용함
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        base = rng.integers(0, 256, (4, 4, 3), dtype=np.uint8)
+        images.append(Image.fromarray(base).resize((384, 384), Image.Resampling.BICUBIC))
+    return images
+
+
+def hf_captions(processor, model, images, num_beams) -> list[str]:
+    with torch.no_grad():
+        out = model.generate(**processor(images=images, return_tensors="pt"), num_beams=num_beams)
+    return processor.batch_decode(out, skip_special_tokens=True)
+
+
+def latency(function, repeat: int) -> float:
+    function()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-m", "--model", default=BLIP_MODEL_NAME, help="모델 이름 또는 로컬 체크포인트 경로")
+    ap.add_argument("--images", help="샘플 이미지 폴더")
+    ap.add_argument("--onnx-dir", default=DEFAULT_ONNX_DIR)
+    ap.add_argument("--batch", type=int, default=4)
+    ap.add_argument("--beams", type=int, default=1)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    if not os.path.isfile(os.path.join(args.onnx_dir, CONFIG_FILE)):
+        print(f"exporting {args.model} to {args.onnx_dir}")
+        export_onnx(args.model, args.onnx_dir)
+
+    processor = BlipProcessor.from_pretrained(args.model, local_files_only=True)
+    model = BlipForConditionalGeneration.from_pretrained(args.model, local_files_only=True).eval()
+    captioner = OnnxBlipCaptioner(args.onnx_dir)
+    images = load_images(args.images)
+
+    expected = hf_captions(processor, model, images, args.beams)
+    actual = captioner.caption(images, num_beams=args.beams)
+    matches = sum(a == b for a, b in zip(expected, actual))
+    print(f"parity: {matches}/{len(images)} captions identical")
+    for hf, onnx in zip(expected, actual):
+        if hf != onnx:
+            print(f"  hf:   {hf}\n  onnx: {onnx}")
+
+    batch = images[:args.batch]
+    print(f"{'backend':>8} {'1 image(ms)':>12} {f'{len(batch)} images(ms)':>14}")
+    for name, function in (
+            ("hf", lambda xs: hf_captions(processor, model, xs, args.beams)),
+            ("onnx", lambda xs: captioner.caption(xs, num_beams=args.beams))):
+        single = latency(lambda: function(images[:1]), args.repeat)
+        batched = latency(lambda: function(batch), args.repeat)
+        print(f"{name:>8} {single * 1000:>12.1f} {batched * 1000:>14.1f}")
+
+    sys.exit(0 if matches == len(images) else 1)
+
+
+if __name__ == "__main__":
+    main()
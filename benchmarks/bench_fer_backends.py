@@ -0,0 +1,102 @@
+'''
+Face_Emotion_CNN 의 추론 백엔드별 정확도와 속도를 비교하는 벤치마크
+고정된 48x48 얼굴 이미지 집합에 대해 각 백엔드의 emotion_probs 를 float(eager) 결과와 비교함
+
+static_int8 은 --calibration 의 얼굴 이미지로 보정하고, 보정에 쓰지 않은 --crops 의 얼굴 이미지로 평가함
+(--calibration 이 없으면 static_int8 은 건너뜀. --crops 가 없으면 무작위 입력으로 속도만 잼)
+
+실행: python benchmarks/bench_fer_backends.py [--crops 평가용_얼굴이미지_폴더] [--calibration 보정용_얼굴이미지_폴더]
+                                             [--batch 16] [--repeat 50]
+'''
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recever.utils.FER.FER_image import get_abs_path, load_trained_model
+from recever.utils.FER.backends import BACKENDS, load_calibration, load_face_crops, to_backend
+from recever.utils.FER.model import Face_Emotion_CNN
+
+
+def load_model() -> Face_Emotion_CNN:
+    path = get_abs_path('./models/FER_trained_model.pt')
+    if os.path.isfile(path):
+        return load_trained_model(path).eval()
+
+    # 학습된 가중치가 없으면 임의의 가중치로 비교함 (정확도 비교는 참고용)
+    print("trained weights not found, using random weights")
+    torch.manual_seed(0)
+    model = Face_Emotion_CNN().eval()
+    for module in model.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            module.running_mean.uniform_(-0.1, 0.1)
+            module.running_var.uniform_(0.5, 1.5)
+    return model
+
+
+def load_crops(directory: str | None, count: int = 64) -> torch.Tensor:
+    if directory:
+        return load_face_crops(directory, count)
+
+    crops = np.random.default_rng(0).integers(0, 256, (count, 48, 48), dtype=np.uint8)
+    return torch.from_numpy(crops).unsqueeze(1).float().div_(255)
+
+
+def probs(model, X: torch.Tensor) -> np.ndarray:
+    with torch.no_grad():
+        return torch.exp(model(X)).numpy() * 100
+
+
+def latency(model, X: torch.Tensor, repeat: int) -> float:
+    with torch.no_grad():
+        model(X)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            model(X)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--crops", help="48x48 로 줄여서 평가에 사용할 얼굴 이미지 폴더 (보정에 쓰지 않은 이미지)")
+    ap.add_argument("--calibration", help="static_int8 보정에 사용할 얼굴 이미지 폴더 (--crops 와 다른 폴더)")
+    ap.add_argument("--batch", type=int, default=16)
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+
+    if args.crops and args.calibration and os.path.realpath(args.crops) == os.path.realpath(args.calibration):
+        ap.error("--crops 와 --calibration 은 다른 폴더여야 함 (보정한 이미지로 평가하면 정확도가 높게 나옴)")
+
+    model = load_model()
+    crops = load_crops(args.crops)
+    calibration = load_calibration(args.calibration, batch_size=args.batch) if args.calibration else None
+    baseline = probs(model, crops)
+    if not args.crops:
+        print("no --crops given: random input, accuracy columns are not reported")
+
+    print(f"{'backend':>13} {'1 face(ms)':>11} {f'{args.batch} faces(ms)':>13} {'max diff(%p)':>13} {'argmax agree':>13}")
+    for backend in BACKENDS:
+        if backend == "static_int8" and calibration is None:
+            print(f"{backend:>13} skipped: requires real calibration face crops (--calibration)")
+            continue
+
+        converted = to_backend(model, backend, calibration)
+        single = latency(converted, crops[:1], args.repeat)
+        batch = latency(converted, crops[:args.batch], args.repeat)
+        if not args.crops:
+            print(f"{backend:>13} {single * 1000:>11.3f} {batch * 1000:>13.3f} {'-':>13} {'-':>13}")
+            continue
+
+        result = probs(converted, crops)
+        diff = np.abs(result - baseline).max()
+        agree = (result.argmax(axis=1) == baseline.argmax(axis=1)).mean()
+        print(f"{backend:>13} {single * 1000:>11.3f} {batch * 1000:>13.3f} {diff:>13.4f} {agree:>13.1%}")
+
+
+if __name__ == "__main__":
+    main()
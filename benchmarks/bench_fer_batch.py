@@ -0,0 +1,98 @@
+'''
+facial_expression_recognition 의 얼굴 단위 추론과 배치 추론을 비교하는 벤치마크
+얼굴 1개, 10개, 50개가 있는 이미지에 대해 실행 시간을 측정함
+
+실행: python benchmarks/bench_fer_batch.py [--repeat 20]
+'''
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recever.utils.FER.FER_image import EMOTION_DICT, facial_expression_recognition, get_abs_path, pil2opencv
+from recever.utils.FER.model import Face_Emotion_CNN
+from recever.utils.model_registry import registry
+
+
+def use_random_model_if_missing():
+    # 학습된 가중치가 없는 환경에서도 속도는 측정할 수 있도록 임의의 가중치를 사용함
+    if not os.path.isfile(get_abs_path('./models/FER_trained_model.pt')):
+        torch.manual_seed(0)
+        registry.register("fer", Face_Emotion_CNN)
+
+
+def make_image(face_count: int, face_size: int = 64) -> tuple[Image.Image, list[tuple[int, int, int, int]]]:
+    columns = 10
+    rows = (face_count + columns - 1) // columns
+    rng = np.random.default_rng(face_count)
+    array = rng.integers(0, 256, (rows * face_size, columns * face_size, 3), dtype=np.uint8)
+
+    boxes = []
+    for i in range(face_count):
+        x1, y1 = (i % columns) * face_size, (i // columns) * face_size
+        boxes.append((x1, y1, x1 + face_size, y1 + face_size))
+
+    return Image.fromarray(array), boxes
+
+
+def per_face_reference(image: Image.Image, face_pos_list: list) -> list[dict]:
+    '''
+    배치 추론 도입 전의 얼굴 단위 추론 (비교용)
+    '''
+    model = registry.get("fer")
+    gray = cv2.cvtColor(pil2opencv(image), cv2.COLOR_BGR2GRAY)
+
+    json = []
+    for (x1, y1, x2, y2) in face_pos_list:
+        resize_frame = cv2.resize(gray[y1:y2, x1:x2], (48, 48))
+        X = torch.from_numpy(resize_frame).float().div(255).unsqueeze(0).unsqueeze(0)
+        with torch.no_grad():
+            model.eval()
+            ps = torch.exp(model.cpu()(X))
+        json.append({
+            "emotion": EMOTION_DICT[int(ps.argmax())],
+            "emotion_probs": {e: float(p) * 100 for e, p in zip(EMOTION_DICT.values(), ps.numpy().flatten())},
+        })
+    return json
+
+
+def measure(func, repeat: int) -> float:
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    use_random_model_if_missing()
+
+    print(f"{'faces':>5} {'per-face(ms)':>13} {'batched(ms)':>12} {'speedup':>8} {'max diff':>9}")
+    for face_count in (1, 10, 50):
+        image, boxes = make_image(face_count)
+
+        reference = per_face_reference(image, boxes)
+        batched = facial_expression_recognition(image, boxes)
+        diff = max(
+            abs(r["emotion_probs"][e] - b["emotion_probs"][e])
+            for r, b in zip(reference, batched) for e in EMOTION_DICT.values()
+        )
+
+        per_face = measure(lambda: per_face_reference(image, boxes), args.repeat)
+        batch = measure(lambda: facial_expression_recognition(image, boxes), args.repeat)
+        print(f"{face_count:>5} {per_face * 1000:>13.2f} {batch * 1000:>12.2f} {per_face / batch:>7.1f}x {diff:>9.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+'''
+FER 파이프라인의 이미지 처리 단계(검출 입력 생성, 얼굴 자르기, 박스 그리기)에서
+PIL <-> OpenCV 변환을 반복하던 방식과 FaceFrame 을 공유하는 방식의 메모리 할당량을 비교하는 벤치마크
+모델 추론은 제외하고 이미지 배열 할당만 측정함 (tracemalloc)
+
+실행: python benchmarks/bench_fer_frame.py [--width 1920 --height 1080]
+'''
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recever.utils.FER.FER_image import draw_box_image, pil2opencv
+from recever.utils.FER.frame import FaceFrame
+
+
+def make_image(width: int, height: int, face_count: int) -> tuple[Image.Image, list[tuple[int, int, int, int]]]:
+    rng = np.random.default_rng(face_count)
+    image = Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+    face_size = min(width, height) // 8
+    columns = max(1, width // face_size)
+    boxes = []
+    for i in range(face_count):
+        x1, y1 = (i % columns) * face_size, (i // columns) * face_size
+        boxes.append((x1, y1, x1 + face_size, y1 + face_size))
+
+    return image, boxes
+
+
+def detection_input(bgr: np.ndarray) -> np.ndarray:
+    return cv2.dnn.blobFromImage(cv2.resize(bgr, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+
+
+def repeated_conversion(image: Image.Image, boxes: list) -> Image.Image:
+    # face_detection, facial_expression_recognition, draw_box_image_list 가 각각 변환하던 방식
+    detection_input(pil2opencv(image))
+
+    gray = cv2.cvtColor(pil2opencv(image), cv2.COLOR_BGR2GRAY)
+    np.stack([cv2.resize(gray[y1:y2, x1:x2], (48, 48)) for (x1, y1, x2, y2) in boxes])
+
+    for index, box in enumerate(boxes):
+        image = draw_box_image(image, box, f"face {index}")
+    return image
+
+
+def shared_frame(image: Image.Image, boxes: list) -> Image.Image:
+    frame = FaceFrame.from_pil(image)
+    detection_input(frame.bgr)
+    frame.crop_batch(boxes, 48)
+    return frame.annotate(boxes, "face", copy=False).to_pil()
+
+
+def measure(func, image, boxes, repeat: int) -> tuple[float, int]:
+    func(image, boxes)
+
+    tracemalloc.start()
+    func(image, boxes)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(image, boxes)
+
+    return (time.perf_counter() - start) / repeat, peak
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--width", type=int, default=1920)
+    ap.add_argument("--height", type=int, default=1080)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    print(f"{'faces':>5} {'method':>20} {'time(ms)':>9} {'peak(MB)':>9}")
+    for face_count in (1, 20):
+        image, boxes = make_image(args.width, args.height, face_count)
+        for name, func in (("repeated conversion", repeated_conversion), ("shared FaceFrame", shared_frame)):
+            elapsed, peak = measure(func, image, boxes, args.repeat)
+            print(f"{face_count:>5} {name:>20} {elapsed * 1000:>9.2f} {peak / 1024 / 1024:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+'''
+get_image_info 의 캡션 + FER 을 순차 실행한 경우와 StageGraph 로 동시에 실행한 경우를 비교하는 벤치마크
+캐시 효과를 빼기 위해 캐시(결과 캐시, 캡션의 image embedding 캐시)를 거치지 않는 캡션/FER 함수로
+같은 모양의 graph 를 만들어 비교함
+모델은 시작할 때 미리 불러오므로 모델 로딩 시간은 포함되지 않음
+
+실행: python benchmarks/bench_image_info_pipeline.py -p 이미지_경로_또는_url [-p ...] [--repeat 5] [--executor thread]
+'''
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recever.utils.FER.FER_image import fer_json
+from recever.utils.ImageCaption.image_caption import decode_captions, encode_images
+from recever.utils.image_util import get_image_from_url
+from recever.utils.model_registry import registry
+from recever.utils.pipeline import StageGraph
+
+
+def warm_up():
+    registry.warm_up()
+
+
+def caption_without_cache(image):
+    # embedding 캐시에 걸리면 caption 단계가 decoder 시간만 재게 되므로 캐시를 거치지 않음
+    # (process 워커의 캐시는 여기서 비울 수 없으므로 clear 대신 캐시를 사용하지 않음)
+    return decode_captions(encode_images([image], use_cache=False))[0]
+
+
+def sequential(path: str) -> dict:
+    timings = {}
+    start = time.perf_counter()
+    for name, function in (
+            ("image", lambda: get_image_from_url(path)),
+            ("caption", lambda: caption_without_cache(image)),
+            ("emotions", lambda: fer_json(image))):
+        stage_start = time.perf_counter()
+        result = function()
+        if name == "image":
+            image = result
+        timings[name] = time.perf_counter() - stage_start
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-p", "--path", action="append", required=True, help="이미지 경로 또는 url")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--executor", default="thread", choices=("thread", "process"))
+    ap.add_argument("--workers", type=int, default=2)
+    args = ap.parse_args()
+
+    warm_up()
+    graph = (
+        StageGraph("bench_image_info", args.executor, args.workers,
+                   initializer=warm_up if args.executor == "process" else None)
+        .stage("image", get_image_from_url, deps=("url",))
+        .stage("caption", caption_without_cache, deps=("image",))
+        .stage("emotions", fer_json, deps=("image",))
+    )
+    graph.start()
+
+    runs = {"sequential": [], "graph": []}
+    for _ in range(args.repeat):
+        for path in args.path:
+            runs["sequential"].append(sequential(path))
+            _, timings = graph.run(url=path)
+            runs["graph"].append({
+                name: timing["seconds"] if isinstance(timing, dict) else timing for name, timing in timings.items()
+            })
+    graph.close()
+
+    stages = ("image", "caption", "emotions", "total")
+    print(f"{'mode':>10} " + " ".join(f"{f'{stage}(ms)':>14}" for stage in stages))
+    for mode, results in runs.items():
+        medians = [statistics.median(result[stage] for result in results) * 1000 for stage in stages]
+        print(f"{mode:>10} " + " ".join(f"{median:>14.1f}" for median in medians))
+
+    speedup = statistics.median(r["total"] for r in runs["sequential"]) / statistics.median(r["total"] for r in runs["graph"])
+    print(f"speedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+'''
+요청 처리 경로의 주요 함수들을 각각 반복 실행하는 마이크로벤치마크 (네트워크 불필요)
+get_image_from_url, face_detection, facial_expression_recognition, get_image_caption,
+RPC 메시지의 msgpack frame 인코딩/디코딩, extract_json 의 p50/p95/p99 와 처리량을 잼
+모델 파일이 없는 단계는 건너뛰고(FER 은 임의의 가중치 사용) 결과에 skipped 로 남김
+
+실행: python benchmarks/bench_micro.py [--repeat 30] [--only get_image_from_url ...] [--output micro.json]
+비교: python benchmarks/report.py 기준.json micro.json
+'''
+import argparse
+import io
+import os
+import struct
+import sys
+import tempfile
+
+import numpy as np
+import torch
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+# sender 의 routes 패키지는 sender 폴더에서 실행하는 것을 전제로 routes.* 를 import 함
+sys.path.append(os.path.join(ROOT, "sender"))
+
+from benchmarks.report import measure, print_results, write_report
+from recever.core.pipline.rpc.transport import pack, unpack
+from recever.utils.FER.FER_image import face_detection, facial_expression_recognition, get_abs_path
+from recever.utils.FER.model import Face_Emotion_CNN
+from recever.utils.ImageCaption.image_caption import get_image_caption
+from recever.utils.image_util import get_image_from_url
+from recever.utils.model_registry import registry
+from sender.routes.task_router import extract_json
+
+SAMPLE_RESPONSE = """
+```
+{
+   "고객의 특성" : "조용한 바닷가 풍경을 좋아하는 고객",
+   "추천 어코드" : "마린, 시트러스",
+   "선호도" : {
+""" + ",\n".join(
+    f'      "{note}" : {{"Level" : {level}, "Reason" : "{note} 향은 사진의 분위기와 {"잘 맞음" if level == 2 else "보통임"}"}}'
+    for note, level in zip(
+        ("시트러스", "스파이시", "그린", "허브", "발사믹", "파우더리", "애니멀", "우디", "프루티", "알데하이드", "플로럴", "마린"),
+        (2, 0, 1, 1, 0, 1, 0, 1, 2, 0, 1, 2),
+    )
+) + """
+   }
+}
+```
+"""
+
+
+def make_image(width: int, height: int, seed: int = 0) -> Image.Image:
+    # 잡음을 섞은 그라디언트 (JPEG 압축률이 실제 사진과 비슷하도록)
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None, None]
+    array = (x * 0.6 + y * 0.4) + rng.normal(0, 12, (height, width, 3))
+    return Image.fromarray(np.clip(array, 0, 255).astype(np.uint8))
+
+
+def jpeg_bytes(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def bench_get_image_from_url(args) -> dict:
+    data = jpeg_bytes(make_image(1920, 1080))
+    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as f:
+        f.write(data)
+
+    try:
+        return {
+            "get_image_from_url[path 1920x1080]": measure(lambda: get_image_from_url(f.name), args.repeat),
+            "get_image_from_url[bytes 1920x1080]": measure(lambda: get_image_from_url(data), args.repeat),
+        }
+    finally:
+        os.unlink(f.name)
+
+
+def bench_face_detection(args) -> dict:
+    image = get_image_from_url(jpeg_bytes(make_image(1920, 1080)))
+    return {"face_detection[1920x1080]": measure(lambda: face_detection(image), args.repeat)}
+
+
+def bench_facial_expression_recognition(args) -> dict:
+    if not os.path.isfile(get_abs_path('./models/FER_trained_model.pt')):
+        # 학습된 가중치가 없어도 속도는 측정할 수 있도록 임의의 가중치를 사용함
+        torch.manual_seed(0)
+        registry.register("fer", Face_Emotion_CNN)
+
+    image = make_image(640, 640)
+    results = {}
+    for faces in (1, 10):
+        boxes = [((i % 10) * 64, (i // 10) * 64, (i % 10) * 64 + 64, (i // 10) * 64 + 64) for i in range(faces)]
+        results[f"facial_expression_recognition[{faces} faces]"] = measure(
+            lambda: facial_expression_recognition(image, boxes), args.repeat
+        )
+    return results
+
+
+def bench_get_image_caption(args) -> dict:
+    # 같은 이미지는 embedding 캐시에 걸리므로 매번 다른 이미지를 사용함
+    images = iter([make_image(640, 480, seed) for seed in range(args.repeat + 2)])
+    return {"get_image_caption[640x480]": measure(lambda: get_image_caption(next(images)), args.repeat)}
+
+
+def bench_msgpack_framing(args) -> dict:
+    header = struct.Struct("!I")
+
+    def round_trip(body):
+        # UnixSocketProducer / UnixSocketListener 와 같은 frame: 4byte 길이 + msgpack([key, msgpack(body)])
+        frame = pack([b"digest", pack(body)])
+        data = header.pack(len(frame)) + frame
+        key, value = unpack(data[header.size:])
+        return unpack(value)
+
+    small = {
+        "jsonrpc": "2.0", "id": "0" * 32, "method": "get_gpt_response", "params": ["이야기", "a photo of a beach"],
+        "reply_to": {"topic": "method_results", "partition": 0},
+        "trace": {"trace_id": "0" * 32, "parent_id": "0" * 16, "sent_at": 0.0},
+    }
+    image = {**small, "method": "get_image_info", "params": [jpeg_bytes(make_image(800, 600))]}
+    return {
+        "msgpack_frame[small]": measure(lambda: round_trip(small), args.repeat * 100),
+        f"msgpack_frame[image {len(image['params'][0]) // 1024}KB]": measure(lambda: round_trip(image), args.repeat * 10),
+    }
+
+
+def bench_extract_json(args) -> dict:
+    assert extract_json(SAMPLE_RESPONSE)["추천 어코드"]
+    return {"extract_json": measure(lambda: extract_json(SAMPLE_RESPONSE), args.repeat * 100)}
+
+
+BENCHMARKS = {
+    "get_image_from_url": bench_get_image_from_url,
+    "face_detection": bench_face_detection,
+    "facial_expression_recognition": bench_facial_expression_recognition,
+    "get_image_caption": bench_get_image_caption,
+    "msgpack_framing": bench_msgpack_framing,
+    "extract_json": bench_extract_json,
+}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=30)
+    ap.add_argument("--only", nargs="+", choices=tuple(BENCHMARKS), help="실행할 벤치마크")
+    ap.add_argument("--output", help="결과 JSON 파일")
+    args = ap.parse_args()
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        try:
+            results.update(BENCHMARKS[name](args))
+        except Exception as e:
+            # 모델 파일이 없는 환경 등
+            results[name] = {"skipped": f"{type(e).__name__}: {str(e).strip().splitlines()[-1][:120]}"}
+
+    print_results(results)
+    write_report(args.output, "micro", results, repeat=args.repeat, torch_threads=torch.get_num_threads())
+    if args.output:
+        print(f"saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
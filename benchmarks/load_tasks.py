@@ -0,0 +1,190 @@
+'''
+FastAPI /api/tasks 라우트에 동시에 요청을 보내는 end-to-end 부하 테스트 (네트워크, Kafka 불필요)
+sender 앱을 httpx ASGITransport 로 직접 호출하고, RPC 는 in-process transport 로 같은 프로세스의 receiver 스레드가 처리함
+OpenAI 호출은 OPENAI_BASE_URL 로 로컬 stub 서버(recever/utils/openai_stub.py)에 보내서 GPT 쪽 지연을 일정하게 만듦
+(--gpt-base-url 을 주면 이미 실행 중인 OpenAI 호환 서버를 사용함)
+
+요청 지연시간의 p50/p95/p99, 처리량과 함께 span 이름별 평균 시간(업로드, RPC, 캡션, FER, GPT 등)을 JSON 으로 저장함
+sender 의 결과 캐시에 걸리지 않도록 요청마다 story 를 다르게 보냄 (--distinct-images 를 주면 이미지도 매번 다르게 만듦)
+
+실행: python benchmarks/load_tasks.py [--route tasks] [--requests 200] [--concurrency 8] [--image 이미지]
+                                      [--gpt-profile fast] [--gpt-latency-ms 300] [--gpt-tokens-per-second 50]
+                                      [--gpt-replay responses.jsonl] [--output e2e.json]
+'''
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "sender"))
+
+# sender_main 과 receiver 의 설정은 import 할 때 읽으므로 먼저 정해둠 (환경 변수로 덮어쓸 수 있음)
+os.environ.setdefault("RPC_TRANSPORT", "inprocess")
+os.environ.setdefault("TOPIC_NAME", "bench")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "bench_uploads"))
+
+from benchmarks.report import print_results, summarize, write_report
+from recever.utils.openai_stub import PROFILES, OpenAIStub, ResponseBook
+
+ROUTES = ("tasks", "img", "gpt", "stream", "gpt-stream")
+
+
+def make_image_bytes(seed: int, width: int = 1280, height: int = 960) -> bytes:
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None, None]
+    array = (x * rng.uniform(0.2, 0.8) + y * rng.uniform(0.2, 0.8)) + rng.normal(0, 12, (height, width, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(array, 0, 255).astype(np.uint8)).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def make_request(route: str, index: int, image: bytes, story: str) -> dict:
+    story = f"{story} #{index}"
+    files = {"file": ("image.jpg", image, "image/jpeg")}
+    caption = "a photo of a beach at sunset"
+
+    if route == "tasks":
+        return {"url": "/api/tasks/", "params": {"story": story}, "files": files}
+    if route == "img":
+        return {"url": "/api/tasks/img", "files": files}
+    if route == "gpt":
+        return {"url": "/api/tasks/gpt", "params": {"story": story, "img_caption": caption}}
+    if route == "stream":
+        return {"url": "/api/tasks/stream", "params": {"story": story}, "files": files}
+    return {"url": "/api/tasks/gpt/stream", "params": {"story": story, "img_caption": caption}}
+
+
+def span_means(*registries) -> dict:
+    '''
+    span_<이름>_seconds 히스토그램의 평균(ms)
+    '''
+    means = {}
+    for registry in registries:
+        for name, values in registry.snapshot().items():
+            if name.startswith("span_") and name.endswith("_seconds") and values.get("count"):
+                means[name[len("span_"):-len("_seconds")]] = values["sum"] / values["count"] * 1000
+    return means
+
+
+async def run(args, app) -> tuple[dict, dict]:
+    image = open(args.image, "rb").read() if args.image else make_image_bytes(0)
+    images = {}
+
+    def image_for(index):
+        if not args.distinct_images:
+            return image
+        if index not in images:
+            images[index] = make_image_bytes(index + 1)
+        return images.pop(index)
+
+    samples, statuses = [], {}
+
+    async def worker(client, indexes, record=True):
+        for index in indexes:
+            request = make_request(args.route, index, image_for(index), args.story)
+            start = time.perf_counter()
+            try:
+                response = await client.post(**request)
+                status = response.status_code
+                if args.route.endswith("stream") and "event: error" in response.text:
+                    status = "stream-error"
+            except Exception as e:
+                status = type(e).__name__
+            seconds = time.perf_counter() - start
+
+            if not record:
+                continue
+            statuses[status] = statuses.get(status, 0) + 1
+            if status in (200, 201):
+                samples.append(seconds)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            # 첫 요청들은 모델 로딩, 스레드 생성 등을 포함하므로 하나씩 보내고 결과에서 뺌
+            await worker(client, range(args.warmup), record=False)
+
+            # worker 들이 같은 iterator 에서 다음 요청 번호를 가져감 (closed loop)
+            indexes = iter(range(args.warmup, args.warmup + args.requests))
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(client, indexes) for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - start
+
+    errors = sum(count for status, count in statuses.items() if status not in (200, 201))
+    return summarize(samples, elapsed, errors), statuses
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--route", default="tasks", choices=ROUTES)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--warmup", type=int, default=2)
+    ap.add_argument("--image", help="업로드할 이미지 (없으면 합성 이미지)")
+    ap.add_argument("--distinct-images", action="store_true", help="요청마다 다른 이미지를 보냄 (receiver 캐시를 피함)")
+    ap.add_argument("--story", default="바다와 햇살을 좋아하고 상쾌한 향을 찾고 있어요")
+    ap.add_argument("--gpt-base-url", help="사용할 OpenAI 호환 서버 (없으면 stub 서버를 띄움)")
+    ap.add_argument("--gpt-profile", default="fast", choices=tuple(PROFILES), help="stub 서버의 지연시간 profile")
+    ap.add_argument("--gpt-latency-ms", type=float, help="stub 의 첫 토큰까지의 지연시간 (profile 값을 덮어씀)")
+    ap.add_argument("--gpt-tokens-per-second", type=float, help="stub 의 토큰 생성 속도 (profile 값을 덮어씀)")
+    ap.add_argument("--gpt-jitter", type=float, default=0.0, help="stub 지연시간의 무작위 변동 비율")
+    ap.add_argument("--gpt-replay", help="stub 이 돌려줄 응답 기록 파일 (JSON lines)")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--output", help="결과 JSON 파일")
+    args = ap.parse_args()
+
+    gpt = {"base_url": args.gpt_base_url}
+    if not args.gpt_base_url:
+        stub = OpenAIStub(
+            args.gpt_profile,
+            latency=None if args.gpt_latency_ms is None else args.gpt_latency_ms / 1000,
+            tokens_per_second=args.gpt_tokens_per_second,
+            jitter=args.gpt_jitter,
+            book=ResponseBook(args.gpt_replay),
+        )
+        server = stub.serve(port=0)
+        gpt = {
+            "base_url": f"http://127.0.0.1:{server.server_port}/v1", "profile": args.gpt_profile,
+            "latency_ms": stub.latency * 1000, "tokens_per_second": stub.tokens_per_second,
+            "jitter": args.gpt_jitter, "replay": args.gpt_replay,
+        }
+    # receiver 의 OpenAI client 는 import 할 때 만들어지므로 sender_main 보다 먼저 정함
+    os.environ["OPENAI_BASE_URL"] = gpt["base_url"]
+
+    import sender_main
+    from recever.utils import metrics as receiver_metrics
+    from sender.utils import metrics as sender_metrics
+
+    result, statuses = asyncio.run(run(args, sender_main.app))
+    name = f"POST {make_request(args.route, 0, b'', '')['url']}"
+    results = {name: result}
+
+    print_results(results)
+    print(f"status: {statuses}")
+    stages = span_means(sender_metrics, receiver_metrics)
+    for stage, mean in sorted(stages.items(), key=lambda item: -item[1]):
+        print(f"  {stage:<36} {mean:>9.2f} ms")
+
+    write_report(
+        args.output, "e2e", results,
+        route=args.route, requests=args.requests, concurrency=args.concurrency,
+        distinct_images=args.distinct_images, gpt=gpt, statuses=statuses, span_means_ms=stages,
+        transport=os.environ["RPC_TRANSPORT"],
+    )
+    if args.output:
+        print(f"saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+'''
+벤치마크 결과를 p50/p95/p99, 처리량과 함께 JSON 으로 저장하고, 다른 커밋의 결과와 비교하는 도구
+bench_micro.py 와 load_tasks.py 가 같은 형식으로 결과를 저장함
+
+비교: python benchmarks/report.py 기준.json 새결과.json [--threshold 0.1]
+      p95 가 threshold 비율 이상 느려진 항목이 있으면 종료 코드 1 을 반환함
+'''
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+
+def percentile(samples: list[float], q: float) -> float:
+    '''
+    정렬된 표본의 q 분위수 (선형 보간)
+    :param samples: 정렬된 표본
+    :param q: 0 ~ 1
+    '''
+    if not samples:
+        return float("nan")
+    position = (len(samples) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(samples) - 1)
+    return samples[lower] + (samples[upper] - samples[lower]) * (position - lower)
+
+
+def summarize(samples: list[float], elapsed: float | None = None, errors: int = 0, unit: str = "ms") -> dict:
+    '''
+    실행 시간 표본(초)을 요약함
+    :param samples: 성공한 실행의 시간(초)
+    :param elapsed: 전체 실행 시간(초). 동시에 실행한 경우 처리량 계산에 사용함 (없으면 표본 합계)
+    :param errors: 실패한 실행 수
+    :return: count, errors, p50/p95/p99/mean/min/max(ms), throughput(초당 실행 수)
+    '''
+    ordered = sorted(samples)
+    scale = 1000 if unit == "ms" else 1
+    elapsed = elapsed if elapsed is not None else sum(ordered)
+
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "unit": unit,
+        "p50": percentile(ordered, 0.50) * scale,
+        "p95": percentile(ordered, 0.95) * scale,
+        "p99": percentile(ordered, 0.99) * scale,
+        "mean": (statistics.fmean(ordered) if ordered else float("nan")) * scale,
+        "min": (ordered[0] if ordered else float("nan")) * scale,
+        "max": (ordered[-1] if ordered else float("nan")) * scale,
+        "throughput": len(ordered) / elapsed if elapsed > 0 else float("nan"),
+    }
+
+
+def measure(function, repeat: int = 20, warmup: int = 2) -> dict:
+    '''
+    function 을 warmup 번 실행한 뒤 repeat 번 실행하고 요약함
+    '''
+    for _ in range(warmup):
+        function()
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(path: str | None, suite: str, results: dict, **meta) -> dict:
+    '''
+    결과를 커밋, 실행 환경과 함께 JSON 으로 저장함 (path 가 없으면 저장하지 않음)
+    :param suite: 벤치마크 이름
+    :param results: 항목 이름별 summarize 결과
+    :param meta: 실행 옵션 등 추가로 남길 정보
+    '''
+    report = {
+        "suite": suite,
+        "commit": git_commit(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "meta": meta,
+        "results": results,
+    }
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def print_results(results: dict) -> None:
+    print(f"{'name':<40} {'count':>6} {'err':>4} {'p50':>9} {'p95':>9} {'p99':>9} {'ops/s':>9}")
+    for name, result in results.items():
+        if "skipped" in result:
+            print(f"{name:<40} skipped: {result['skipped']}")
+            continue
+        print(
+            f"{name:<40} {result['count']:>6} {result['errors']:>4} "
+            f"{result['p50']:>9.2f} {result['p95']:>9.2f} {result['p99']:>9.2f} {result['throughput']:>9.1f}"
+        )
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> list[str]:
+    '''
+    두 결과의 같은 항목을 비교하고 p95 가 threshold 비율 이상 늘어난 항목 이름을 반환함
+    '''
+    regressions = []
+    print(f"{baseline.get('commit')} -> {current.get('commit')}")
+    print(f"{'name':<40} {'p50':>16} {'p95':>16} {'p95 change':>11}")
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or "skipped" in base or "skipped" in result:
+            continue
+
+        change = result["p95"] / base["p95"] - 1 if base["p95"] else 0.0
+        mark = " !" if change >= threshold else ""
+        print(
+            f"{name:<40} {base['p50']:>7.2f}->{result['p50']:<7.2f} "
+            f"{base['p95']:>7.2f}->{result['p95']:<7.2f} {change * 100:>+10.1f}%{mark}"
+        )
+        if change >= threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("baseline")
+    ap.add_argument("current")
+    ap.add_argument("--threshold", type=float, default=0.1, help="회귀로 볼 p95 증가 비율")
+    args = ap.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
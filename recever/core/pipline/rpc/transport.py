@@ -0,0 +1,432 @@
+import collections
+import os
+import queue
+import socket
+import struct
+import threading
+
+import msgpack
+from kafka import KafkaAdminClient, KafkaProducer, KafkaConsumer, TopicPartition
+from kafka.admin import NewPartitions, NewTopic
+from kafka.errors import TopicAlreadyExistsError
+
+TRANSPORTS = ("kafka", "inprocess", "unix")
+
+Record = collections.namedtuple("Record", ["topic", "partition", "key", "value", "offset"])
+
+
+def pack(value):
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def unpack(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+class DeliveryFuture:
+    '''
+    KafkaProducer.send 가 반환하는 future 와 같은 add_callback / add_errback 인터페이스
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.done = False
+        self.value = None
+        self.exception = None
+        self.callbacks = []
+        self.errbacks = []
+
+    def __finish__(self, value=None, exception=None):
+        with self.lock:
+            if self.done:
+                return
+            self.done, self.value, self.exception = True, value, exception
+            callbacks = self.errbacks if exception is not None else self.callbacks
+
+        for callback in callbacks:
+            callback(exception if exception is not None else value)
+
+    def set_result(self, value):
+        self.__finish__(value=value)
+
+    def set_exception(self, exception):
+        self.__finish__(exception=exception)
+
+    def add_callback(self, callback):
+        with self.lock:
+            if not self.done:
+                self.callbacks.append(callback)
+                return self
+        if self.exception is None:
+            callback(self.value)
+        return self
+
+    def add_errback(self, errback):
+        with self.lock:
+            if not self.done:
+                self.errbacks.append(errback)
+                return self
+        if self.exception is not None:
+            errback(self.exception)
+        return self
+
+
+class KafkaTransport:
+    '''
+    Kafka broker 를 사용하는 transport
+    '''
+
+    def __init__(self, bootstrap_servers):
+        self.bootstrap_servers = bootstrap_servers
+
+    def producer(self, **producer_config):
+        return KafkaProducer(
+            bootstrap_servers=self.bootstrap_servers,
+            value_serializer=pack,
+            **producer_config,
+        )
+
+    def request_consumer(self, topic_name, group_id, partition=None, listener=None):
+        consumer = KafkaConsumer(
+            bootstrap_servers=self.bootstrap_servers,
+            auto_offset_reset="earliest",
+            enable_auto_commit=False,
+            group_id=group_id,
+            value_deserializer=unpack,
+        )
+
+        if partition is not None:
+            consumer.assign([TopicPartition(topic_name, partition)])
+        else:
+            # consumer group 으로 구독하면 topic 의 partition 들이 같은 group 의 receiver 들에게 나뉨
+            consumer.subscribe([topic_name], listener=listener)
+        return consumer
+
+    def reply_consumer(self, topic_name, partition):
+        consumer = KafkaConsumer(
+            bootstrap_servers=self.bootstrap_servers,
+            enable_auto_commit=False,
+            group_id=None,
+            value_deserializer=unpack,
+        )
+        partition = TopicPartition(topic_name, partition)
+        consumer.assign([partition])
+        # 시작 시점 이후의 응답만 읽음. position 을 미리 확정해서 첫 요청의 응답을 놓치지 않도록 함
+        consumer.seek_to_end(partition)
+        consumer.position(partition)
+        return consumer
+
+    def ensure_topic(self, topic_name, num_partitions=1, replication_factor=1):
+        '''
+        토픽이 없으면 만들고, partition 수가 num_partitions 보다 적으면 늘림
+        (partition 수는 줄일 수 없으므로 더 많으면 그대로 둠)
+        :return: 토픽의 partition 수
+        '''
+        admin = KafkaAdminClient(bootstrap_servers=self.bootstrap_servers)
+        try:
+            try:
+                admin.create_topics([NewTopic(topic_name, num_partitions, replication_factor)])
+                return num_partitions
+            except TopicAlreadyExistsError:
+                pass
+
+            metadata = admin.describe_topics([topic_name])[0]
+            current = len(metadata["partitions"])
+            if current < num_partitions:
+                admin.create_partitions({topic_name: NewPartitions(num_partitions)})
+                return num_partitions
+            return current
+        finally:
+            admin.close()
+
+
+class QueueConsumer:
+    '''
+    thread-safe queue 에서 메시지를 읽는 consumer (KafkaConsumer 의 poll 인터페이스)
+    offset 을 저장할 곳이 없으므로 commit 은 아무것도 하지 않음
+    '''
+
+    def __init__(self, topic_name, partition, messages: queue.Queue, on_close=None):
+        self.topic_partition = TopicPartition(topic_name, partition)
+        self.messages = messages
+        self.on_close = on_close
+        self.offset = 0
+
+    def poll(self, timeout_ms=0, max_records=None):
+        max_records = max_records or 500
+        try:
+            first = self.messages.get(timeout=timeout_ms / 1000) if timeout_ms else self.messages.get_nowait()
+        except queue.Empty:
+            return {}
+
+        frames = [first]
+        while len(frames) < max_records:
+            try:
+                frames.append(self.messages.get_nowait())
+            except queue.Empty:
+                break
+
+        records = []
+        for key, data in frames:
+            records.append(Record(self.topic_partition.topic, self.topic_partition.partition, key, unpack(data), self.offset))
+            self.offset += 1
+        return {self.topic_partition: records}
+
+    def assignment(self):
+        return {self.topic_partition}
+
+    def commit_async(self, offsets=None, callback=None):
+        if callback is not None:
+            callback(offsets, None)
+
+    def commit(self, offsets=None):
+        pass
+
+    def close(self):
+        if self.on_close is not None:
+            self.on_close()
+
+
+class InProcessHub:
+    '''
+    같은 프로세스 안의 sender 와 receiver 가 공유하는 메시지 저장소
+    요청 토픽은 consumer group 마다 queue 하나를 두어 같은 group 의 consumer 들이 나눠 읽고,
+    응답 토픽은 (토픽, partition) 마다 queue 하나를 둠
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.groups = collections.defaultdict(dict)
+        # consumer group 이 생기기 전에 보낸 요청
+        self.backlog = collections.defaultdict(collections.deque)
+        self.replies = collections.defaultdict(queue.Queue)
+        self.reply_topics = set()
+
+    def publish(self, topic_name, key, data, partition=None):
+        with self.lock:
+            if topic_name in self.reply_topics or partition is not None:
+                self.replies[(topic_name, partition or 0)].put((key, data))
+            elif self.groups[topic_name]:
+                for messages in self.groups[topic_name].values():
+                    messages.put((key, data))
+            else:
+                self.backlog[topic_name].append((key, data))
+
+    def group_queue(self, topic_name, group_id):
+        with self.lock:
+            messages = self.groups[topic_name].get(group_id)
+            if messages is None:
+                messages = self.groups[topic_name][group_id] = queue.Queue()
+                while self.backlog[topic_name]:
+                    messages.put(self.backlog[topic_name].popleft())
+            return messages
+
+    def reply_queue(self, topic_name, partition):
+        with self.lock:
+            self.reply_topics.add(topic_name)
+            return self.replies[(topic_name, partition)]
+
+
+_hub = InProcessHub()
+
+
+class InProcessProducer:
+    def __init__(self, hub):
+        self.hub = hub
+
+    def send(self, topic, value=None, key=None, partition=None):
+        # 직렬화를 거쳐서 Kafka 와 같이 sender 와 receiver 가 같은 객체를 공유하지 않도록 함
+        self.hub.publish(topic, key, pack(value), partition)
+        future = DeliveryFuture()
+        future.set_result(None)
+        return future
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class InProcessTransport:
+    '''
+    sender 와 receiver 가 같은 프로세스에서 실행될 때 사용하는 transport (개발, 테스트, 벤치마크용)
+    receiver 의 poll 은 워커 스레드에서 실행되므로 asyncio.Queue 대신 thread-safe queue 를 사용함
+    메시지는 메모리에만 있으므로 프로세스가 종료되면 사라짐
+    '''
+
+    def __init__(self, hub: InProcessHub | None = None):
+        self.hub = hub or _hub
+
+    def producer(self, **producer_config):
+        return InProcessProducer(self.hub)
+
+    def request_consumer(self, topic_name, group_id, partition=None, listener=None):
+        return QueueConsumer(topic_name, partition or 0, self.hub.group_queue(topic_name, group_id))
+
+    def reply_consumer(self, topic_name, partition):
+        return QueueConsumer(topic_name, partition, self.hub.reply_queue(topic_name, partition))
+
+    def ensure_topic(self, topic_name, num_partitions=1):
+        return 1
+
+
+_HEADER = struct.Struct("!I")
+
+
+def _read_exact(connection, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+class UnixSocketListener:
+    '''
+    Unix domain socket 하나를 열고, 연결된 producer 들이 보낸 frame 을 queue 에 넣음
+    frame: 4byte 길이 + msgpack([key, 메시지])
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.messages = queue.Queue()
+        self.stopped = threading.Event()
+
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen()
+        self.server.settimeout(0.1)
+
+        self.thread = threading.Thread(target=self.__accept__, name=f"unix-listener:{path}", daemon=True)
+        self.thread.start()
+
+    def __accept__(self):
+        while not self.stopped.is_set():
+            try:
+                connection, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self.__read__, args=(connection,), daemon=True).start()
+
+    def __read__(self, connection):
+        with connection:
+            while not self.stopped.is_set():
+                header = _read_exact(connection, _HEADER.size)
+                if header is None:
+                    return
+                frame = _read_exact(connection, _HEADER.unpack(header)[0])
+                if frame is None:
+                    return
+                self.messages.put(tuple(unpack(frame)))
+
+    def close(self):
+        self.stopped.set()
+        self.server.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class UnixSocketProducer:
+    '''
+    토픽(과 partition)마다 정해진 socket 경로로 frame 을 보냄
+    연결은 경로마다 하나를 만들어 재사용하고, 끊어지면 다음 전송에서 다시 연결함
+    '''
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def send(self, topic, value=None, key=None, partition=None):
+        future = DeliveryFuture()
+        path = self.transport.socket_path(topic, partition)
+        frame = pack([key, pack(value)])
+
+        try:
+            with self.lock:
+                for attempt in range(2):
+                    connection = self.connections.get(path)
+                    try:
+                        if connection is None:
+                            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                            connection.connect(path)
+                            self.connections[path] = connection
+                        connection.sendall(_HEADER.pack(len(frame)) + frame)
+                        break
+                    except OSError:
+                        self.connections.pop(path, None)
+                        if connection is not None:
+                            connection.close()
+                        if attempt == 1:
+                            raise
+        except OSError as e:
+            future.set_exception(ConnectionError(f"cannot send to {path}: {e}"))
+            return future
+
+        future.set_result(None)
+        return future
+
+    def flush(self):
+        pass
+
+    def close(self):
+        with self.lock:
+            for connection in self.connections.values():
+                connection.close()
+            self.connections.clear()
+
+
+class UnixSocketTransport:
+    '''
+    같은 호스트의 sender 와 receiver 가 Unix domain socket 으로 메시지를 주고받는 transport
+    consumer 가 socket_dir 아래에 토픽(응답은 토픽과 partition)마다 socket 을 열고, producer 가 그 socket 으로 보냄
+    요청 토픽의 socket 은 하나이므로 토픽 당 receiver 는 하나만 실행할 수 있음
+    '''
+
+    def __init__(self, socket_dir="/tmp/rpc"):
+        self.socket_dir = socket_dir
+        os.makedirs(socket_dir, exist_ok=True)
+
+    def socket_path(self, topic_name, partition=None):
+        name = topic_name if partition is None else f"{topic_name}.{partition}"
+        return os.path.join(self.socket_dir, f"{name}.sock")
+
+    def producer(self, **producer_config):
+        return UnixSocketProducer(self)
+
+    def __consumer__(self, topic_name, partition, socket_partition):
+        listener = UnixSocketListener(self.socket_path(topic_name, socket_partition))
+        return QueueConsumer(topic_name, partition, listener.messages, on_close=listener.close)
+
+    def request_consumer(self, topic_name, group_id, partition=None, listener=None):
+        return self.__consumer__(topic_name, partition or 0, None)
+
+    def reply_consumer(self, topic_name, partition):
+        return self.__consumer__(topic_name, partition, partition)
+
+    def ensure_topic(self, topic_name, num_partitions=1):
+        return 1
+
+
+def make_transport(name="kafka", bootstrap_servers=("localhost:9092",), socket_dir="/tmp/rpc"):
+    '''
+    이름으로 transport 를 만듦
+    :param name: "kafka", "inprocess", "unix" 중 하나
+    :param bootstrap_servers: kafka 주소
+    :param socket_dir: unix socket 을 만들 폴더
+    '''
+    if name == "kafka":
+        return KafkaTransport(bootstrap_servers)
+    elif name == "inprocess":
+        return InProcessTransport()
+    elif name == "unix":
+        return UnixSocketTransport(socket_dir)
+    else:
+        raise ValueError(f"Unknown transport: {name} (available: {', '.join(TRANSPORTS)})")
@@ -3,14 +3,59 @@ import sys
 
 from starlette.config import Config
 
-from core.pipline.rpc.message_broker import MessageBroker
-
 config = Config('../.env')
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from recever.utils import methods
+# utils 의 span 과 broker 의 span 이 같은 tracing 모듈(같은 context)을 사용하도록 recever 패키지 경로로 import 함
+from recever.core.pipline.rpc import tracing
+from recever.core.pipline.rpc.message_broker import MessageBroker
+from recever.utils import methods, metrics
+from recever.utils.model_registry import registry
+
+tracing.configure(config('TRACE_FILE', default=None), service="recever")
+tracing.add_listener(metrics.observe_span)
+if config('METRICS_PORT', cast=int, default=8001):
+    # Prometheus 가 http://<receiver>:METRICS_PORT/metrics 를 수집함 (0 이면 끔)
+    try:
+        metrics.start_http_server(config('METRICS_PORT', cast=int, default=8001))
+    except OSError as e:
+        # 같은 호스트에 receiver 를 여러 개 띄우면 port 가 겹침. 메트릭 없이 RPC 는 계속 처리함
+        # (receiver 마다 METRICS_PORT 를 다르게 주거나 0 으로 끔)
+        print(f"metrics server disabled: cannot bind port {config('METRICS_PORT', cast=int, default=8001)}: {e}")
+
+if config('PRELOAD_MODELS', cast=bool, default=True):
+    # 첫 메시지를 받기 전에 모든 모델을 불러와서 첫 요청의 지연을 없앰
+    for name, seconds in registry.warm_up().items():
+        print(f"model {name} loaded in {seconds:.2f}s")
+    print(f"model memory usage(byte): {registry.memory_usage()}")
+
+broker = MessageBroker(
+    "localhost:9092",
+    linger_ms=config('KAFKA_LINGER_MS', cast=int, default=5),
+    batch_size=config('KAFKA_BATCH_SIZE', cast=int, default=16384),
+    compression_type=config('KAFKA_COMPRESSION', default=None),
+    acks=config('KAFKA_ACKS', cast=lambda v: v if v == "all" else int(v), default=1),
+    transport=config('RPC_TRANSPORT', default="kafka"),
+    socket_dir=config('RPC_SOCKET_DIR', default="/tmp/rpc"),
+)
+# receiver 를 여러 개 띄우면 같은 group 의 receiver 들이 요청 토픽의 partition 을 나눠 읽음
+broker.ensure_topic(f"{config('TOPIC_NAME')}_method_requests", config('RPC_PARTITIONS', cast=int, default=1))
 
-broker = MessageBroker("localhost:9092")
 # methods 모듈은 내부에 echo 함수를 가지고 있음
-broker.serve(methods, config('TOPIC_NAME'))
+try:
+    broker.serve(
+        methods,
+        config('TOPIC_NAME'),
+        group_id=config('RPC_GROUP_ID', default="default"),
+        workers=config('RPC_WORKERS', cast=int, default=4),
+        executor=config('RPC_EXECUTOR', default="thread"),
+        max_in_flight=config('RPC_MAX_IN_FLIGHT', cast=int, default=None),
+        batch_size=config('RPC_BATCH_SIZE', cast=int, default=32),
+        poll_timeout_ms=config('RPC_POLL_TIMEOUT_MS', cast=int, default=100),
+        partition=config('RPC_PARTITION', cast=int, default=None),
+        ordered=config('RPC_ORDERED', cast=bool, default=False),
+    )
+finally:
+    # linger_ms 동안 모아둔 응답을 보내고, consumer group 에서 나가서 partition 을 바로 다른 receiver 에 넘김
+    broker.close()
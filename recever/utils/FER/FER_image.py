@@ -1,13 +1,32 @@
 import argparse
 import os
+import threading
 
 import cv2
 import numpy as np
-import torchvision.transforms as transforms
 from PIL import Image
+from starlette.config import Config
 
+from recever.core.pipline.rpc import tracing
+from recever.utils.FER.backends import load_calibration, to_backend
+from recever.utils.FER.frame import FaceFrame
 from recever.utils.FER.model import *
 from recever.utils.image_util import get_image_from_url
+from recever.utils.model_registry import registry
+
+EMOTION_DICT = {0: 'neutral', 1: 'happiness', 2: 'surprise', 3: 'sadness',
+                4: 'anger', 5: 'disguest', 6: 'fear'}
+
+config = Config('../.env')
+
+# 한 이미지에서 감정 인식을 할 최대 얼굴 수
+MAX_FACES = config('FER_MAX_FACES', cast=int, default=50)
+# 얼굴로 판단할 최소 확률과 겹치는 박스를 같은 얼굴로 볼 IoU 기준
+FACE_CONFIDENCE_MINIMUM = config('FER_FACE_CONFIDENCE', cast=float, default=0.5)
+FACE_NMS_THRESHOLD = config('FER_FACE_NMS_THRESHOLD', cast=float, default=0.4)
+
+# opencv dnn 모델은 여러 스레드에서 동시에 setInput/forward 할 수 없음
+_face_detector_lock = threading.Lock()
 
 
 def get_abs_path(target: str) -> str:
@@ -26,6 +45,37 @@ def load_trained_model(model_path: str) -> Face_Emotion_CNN:
     return model
 
 
+def load_inference_model(model_path: str, backend: str = "eager", calibration_dir: str | None = None) -> torch.nn.Module:
+    '''
+    학습된 모델을 불러와서 추론 백엔드(eager, torchscript, dynamic_int8, static_int8)로 변환함
+    :param model_path: 모델 경로
+    :param backend: 추론 백엔드
+    :param calibration_dir: static_int8 보정에 사용할 얼굴 이미지 폴더 (static_int8 에서는 필수)
+    :return: 추론용 모델
+    '''
+    calibration = load_calibration(calibration_dir) if backend == "static_int8" and calibration_dir else None
+    return to_backend(load_trained_model(model_path), backend, calibration)
+
+
+def load_face_detector() -> cv2.dnn.Net:
+    '''
+    SSD, ResNet 기반의 300x300 얼굴 검출 caffe 모델을 불러옴
+    :return: 얼굴 검출 모델
+    '''
+    prototxt_path = get_abs_path("./models/weights-prototxt.txt")
+    caffe_model_path = get_abs_path("models/res_ssd_300Dim.caffeModel")
+
+    return cv2.dnn.readNetFromCaffe(prototxt_path, caffe_model_path)
+
+
+registry.register("face_detector", load_face_detector)
+registry.register("fer", lambda: load_inference_model(
+    get_abs_path('./models/FER_trained_model.pt'),
+    config('FER_BACKEND', default="eager"),
+    config('FER_CALIBRATION_DIR', default=None),
+))
+
+
 def draw_box_image(
         image: Image,
         box: tuple[int, int, int, int],
@@ -53,25 +103,27 @@ def draw_box_image(
 
 
 def draw_box_image_list(
-        image: Image,
+        image: Image.Image | FaceFrame,
         box: list[tuple[int, int, int, int]],
         msg: str = "",
         color: tuple[int, int, int] = (0, 0, 255),
         thick: int = 2) -> Image:
     '''
     박스 좌표 리스트를 받아 이미지에 박스를 그리고, 박스에 메시지를 추가하여 반환함
-    :param image: 이미지
+    :param image: 이미지 또는 FaceFrame
     :param box: 박스 좌표 리스트
     :param msg: 박스에 추가할 메시지
     :param color: 박스 색깔
     :param thick: 박스 두께
     :return: 박스가 그려진 이미지
     '''
+    # 박스마다 PIL <-> OpenCV 변환을 하지 않고 한 배열에 모두 그린 뒤 한 번만 변환함
+    if isinstance(image, FaceFrame):
+        frame = image.annotate(box, msg, color, thick)
+    else:
+        frame = FaceFrame.from_pil(image).annotate(box, msg, color, thick, copy=False)
 
-    for box, index in zip(box, range(len(box))):
-        image = draw_box_image(image, box, f"{msg} {index}", color, thick)
-
-    return image
+    return frame.to_pil()
 
 
 def pil2opencv(image: Image) -> np.ndarray:
@@ -92,85 +144,123 @@ def opencv2pil(image: np.ndarray) -> Image:
     return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
 
 
-def face_detection(image: Image, confidence_minimum: float = 0.5) -> list[tuple[int, int, int, int]]:
+def non_max_suppression(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
     '''
-    이미지에서 얼굴을 찾아서 얼굴의 좌표를 반환함
-    :param image: 이미지
+    겹치는 박스 중 확률이 가장 높은 박스만 남김
+    :param boxes: N x 4 (x1, y1, x2, y2) 배열
+    :param scores: N 개의 확률
+    :param iou_threshold: 이 값보다 많이 겹치면 같은 얼굴로 봄
+    :return: 남길 박스의 인덱스 (확률이 높은 순)
+    '''
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+
+        rest = order[1:]
+        w = np.clip(np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0]), 0, None)
+        h = np.clip(np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1]), 0, None)
+        intersection = w * h
+        iou = intersection / (areas[i] + areas[rest] - intersection)
+
+        order = rest[iou <= iou_threshold]
+
+    return np.array(keep, dtype=int)
+
+
+def postprocess_detections(
+        detections: np.ndarray,
+        width: int,
+        height: int,
+        confidence_minimum: float = FACE_CONFIDENCE_MINIMUM,
+        nms_threshold: float = FACE_NMS_THRESHOLD,
+        max_faces: int = MAX_FACES) -> list[tuple[int, int, int, int]]:
+    '''
+    SSD 출력(1 x 1 x N x 7)을 한 번에 처리하여 얼굴 좌표 리스트로 만듦
+    확률로 거르고, 이미지 크기로 변환하고, 이미지 밖으로 나간 부분을 잘라내고, 겹치는 박스를 제거함
+    :param detections: SSD 출력
+    :param width: 이미지 너비
+    :param height: 이미지 높이
     :param confidence_minimum: 얼굴로 판단할 최소 확률
+    :param nms_threshold: 겹침(IoU) 기준
+    :param max_faces: 반환할 최대 얼굴 수 (확률이 높은 순)
     :return: 얼굴 좌표 리스트
     '''
-    # Get the directory of the current script
-    current_dir = os.path.dirname(os.path.abspath(__file__))
+    detections = detections.reshape(-1, 7)
+    detections = detections[detections[:, 2] > confidence_minimum]
 
-    # Construct paths relative to the current script's directory
-    prototxt_path = get_abs_path("./models/weights-prototxt.txt")
-    caffe_model_path = get_abs_path("models/res_ssd_300Dim.caffeModel")
+    boxes = detections[:, 3:7] * np.array([width, height, width, height], dtype=np.float32)
+    boxes = np.clip(boxes, 0, [width, height, width, height]).astype(int)
+
+    # 잘라낸 뒤 크기가 없어진 박스는 제외함
+    valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    boxes, scores = boxes[valid], detections[valid, 2]
+
+    keep = non_max_suppression(boxes, scores, nms_threshold)[:max_faces]
 
+    return [tuple(box) for box in boxes[keep].tolist()]
+
+
+def face_detection(
+        image: Image.Image | FaceFrame,
+        confidence_minimum: float = FACE_CONFIDENCE_MINIMUM,
+        nms_threshold: float = FACE_NMS_THRESHOLD,
+        max_faces: int = MAX_FACES) -> list[tuple[int, int, int, int]]:
+    '''
+    이미지에서 얼굴을 찾아서 얼굴의 좌표를 반환함
+    :param image: 이미지 또는 FaceFrame
+    :param confidence_minimum: 얼굴로 판단할 최소 확률
+    :param nms_threshold: 겹치는 박스를 같은 얼굴로 볼 IoU 기준
+    :param max_faces: 반환할 최대 얼굴 수
+    :return: 얼굴 좌표 리스트
+    '''
     # load SSD and ResNet network based caffe model for 300x300 dim imgs
-    net = cv2.dnn.readNetFromCaffe(prototxt_path, caffe_model_path)
-    image = pil2opencv(image)
+    net = registry.get("face_detector")
+    image = FaceFrame.of(image).bgr
 
     (height, width) = image.shape[:2]
     blob = cv2.dnn.blobFromImage(cv2.resize(image, (300, 300)), 1.0,
                                  (300, 300), (104.0, 177.0, 123.0))
 
     # pass the blob into the network
-    net.setInput(blob)
-    detections = net.forward()
-
-    faces = []
-    for i in range(0, detections.shape[2]):
-        # extract the confidence (i.e., probability) associated with the
-        # prediction
-        confidence = detections[0, 0, i, 2]
+    with _face_detector_lock:
+        net.setInput(blob)
+        detections = net.forward()
 
-        # greater than the minimum confidence
-        if confidence > confidence_minimum:
-            box = detections[0, 0, i, 3:7] * np.array([width, height, width, height])
-            (x1, y1, x2, y2) = box.astype("int")
-            faces.append((x1, y1, x2, y2))
+    return postprocess_detections(detections, width, height, confidence_minimum, nms_threshold, max_faces)
 
-    return faces
 
-
-def facial_expression_recognition(image: Image, face_pos_list: list[tuple[int, int, int, int]]) -> list[dict]:
+def facial_expression_recognition(image: Image.Image | FaceFrame, face_pos_list: list[tuple[int, int, int, int]]) -> list[dict]:
     '''
     이미지에서 얼굴의 좌표를 받아서 감정을 인식하고, 감정과 감정 확률을 반환함
-    :param image: 이미지
+    :param image: 이미지 또는 FaceFrame
     :param face_pos_list: 얼굴 좌표 리스트
     :return: 감정과 감정 확률 리스트(JSON 형태)
     '''
-    model = load_trained_model(get_abs_path('./models/FER_trained_model.pt'))
+    if len(face_pos_list) == 0:
+        return []
 
-    emotion_dict = {0: 'neutral', 1: 'happiness', 2: 'surprise', 3: 'sadness',
-                    4: 'anger', 5: 'disguest', 6: 'fear'}
+    model = registry.get("fer")
 
-    val_transform = transforms.Compose([
-        transforms.ToTensor()])
+    # 모든 얼굴을 48x48 로 잘라서 N x 1 x 48 x 48 텐서 하나로 만들어 한 번에 추론함
+    crops = FaceFrame.of(image).crop_batch(face_pos_list, 48)
+    X = torch.from_numpy(crops).unsqueeze(1).float().div_(255)
 
-    image = pil2opencv(image)
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    with torch.no_grad():
+        ps = torch.exp(model(X))
 
-    json = []
+    probs = ps.numpy()
+    preds = probs.argmax(axis=1)
 
-    for (x1, y1, x2, y2) in face_pos_list:
-        resize_frame = cv2.resize(gray[y1:y2, x1:x2], (48, 48))
-        X = resize_frame / 256
-        X = Image.fromarray((resize_frame))
-        X = val_transform(X).unsqueeze(0)
-        with torch.no_grad():
-            model.eval()
-            log_ps = model.cpu()(X)
-            ps = torch.exp(log_ps)
-            top_p, top_class = ps.topk(1, dim=1)
-            pred = emotion_dict[int(top_class.numpy().item())]
-
-            emotion_probs = {emotion: float(prob) * 100 for emotion, prob in
-                             zip(emotion_dict.values(), ps.numpy().flatten())}
+    json = []
 
+    for (x1, y1, x2, y2), pred, prob in zip(face_pos_list, preds, probs):
         json.append({
-            "emotion": pred,
-            "emotion_probs": emotion_probs,
+            "emotion": EMOTION_DICT[int(pred)],
+            "emotion_probs": {emotion: float(p) * 100 for emotion, p in zip(EMOTION_DICT.values(), prob)},
             "box": {
                 "x1": x1,
                 "y1": y1,
@@ -182,14 +272,33 @@ def facial_expression_recognition(image: Image, face_pos_list: list[tuple[int, i
     return json
 
 
-def fer_json(image: Image) -> list:
+@tracing.traced("fer_json")
+def fer_json(
+        image: Image.Image | FaceFrame,
+        confidence_minimum: float = FACE_CONFIDENCE_MINIMUM,
+        nms_threshold: float = FACE_NMS_THRESHOLD,
+        max_faces: int = MAX_FACES) -> list:
     '''
     이미지를 입력받아 감정을 인식하고, 감정과 감정 확률을 반환함
-    :param image: 이미지
+    :param image: 이미지 또는 FaceFrame
+    :param confidence_minimum: 얼굴로 판단할 최소 확률 (FER_FACE_CONFIDENCE)
+    :param nms_threshold: 겹치는 박스를 같은 얼굴로 볼 IoU 기준 (FER_FACE_NMS_THRESHOLD)
+    :param max_faces: 감정 인식을 할 최대 얼굴 수 (FER_MAX_FACES)
     :return: 감정과 감정 확률 리스트(JSON 형태)
     '''
-    face_list = face_detection(image)
-    json = facial_expression_recognition(image, face_list)
+    # 검출과 감정 인식이 같은 BGR/gray 배열을 사용함
+    frame = FaceFrame.of(image)
+    face_list = face_detection(frame, confidence_minimum, nms_threshold, max_faces)
+    json = facial_expression_recognition(frame, face_list)
+
+    # 줄여서 불러온 이미지라면 얼굴 좌표를 원본 이미지 기준으로 변환함
+    (width, height) = frame.original_size
+    if (width, height) != frame.size:
+        sx, sy = width / frame.width, height / frame.height
+        for face in json:
+            box = face["box"]
+            box["x1"], box["x2"] = int(box["x1"] * sx), int(box["x2"] * sx)
+            box["y1"], box["y2"] = int(box["y1"] * sy), int(box["y2"] * sy)
 
     return json
 
@@ -200,10 +309,10 @@ if __name__ == "__main__":
     args = vars(ap.parse_args())
     path = args['path']
 
-    image = get_image_from_url(path)
-    face_list = face_detection(image)
-    json = facial_expression_recognition(image, face_list)
+    frame = FaceFrame.from_pil(get_image_from_url(path, max_side=None))
+    face_list = face_detection(frame)
+    json = facial_expression_recognition(frame, face_list)
 
     # show the output image
     print(json)
-    draw_box_image_list(image, face_list, "face").show()
+    draw_box_image_list(frame, face_list, "face").show()
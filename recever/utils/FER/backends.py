@@ -0,0 +1,127 @@
+import copy
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+from PIL import Image
+
+from recever.utils.FER.model import Face_Emotion_CNN
+
+BACKENDS = ("eager", "torchscript", "dynamic_int8", "static_int8")
+
+CONV_BN_PAIRS = [(f"cnn{i}", f"cnn{i}_bn") for i in range(1, 8)]
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".pgm")
+
+
+def example_input(batch_size: int = 1) -> torch.Tensor:
+    return torch.rand(batch_size, 1, 48, 48)
+
+
+def fold_batch_norm(model: Face_Emotion_CNN) -> Face_Emotion_CNN:
+    '''
+    BatchNorm 을 앞의 Conv 가중치에 합쳐서 BatchNorm 연산을 없앤 모델을 반환함
+    eval 모드에서 Conv 와 BatchNorm 사이의 Dropout 은 항등 함수이므로 합쳐도 결과가 같음
+    :param model: 원본 모델 (변경하지 않음)
+    :return: BatchNorm 이 합쳐진 모델
+    '''
+    fused = copy.deepcopy(model).eval()
+    for conv_name, bn_name in CONV_BN_PAIRS:
+        conv, bn = getattr(fused, conv_name), getattr(fused, bn_name)
+        setattr(fused, conv_name, fuse_conv_bn_eval(conv, bn))
+        setattr(fused, bn_name, nn.Identity())
+
+    return fused
+
+
+def to_torchscript(model: Face_Emotion_CNN) -> torch.jit.ScriptModule:
+    '''
+    BatchNorm 을 합친 뒤 trace 하고 freeze 한 TorchScript 모델을 반환함
+    '''
+    with torch.no_grad():
+        traced = torch.jit.trace(fold_batch_norm(model), example_input(2))
+    return torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+
+def to_dynamic_int8(model: Face_Emotion_CNN) -> nn.Module:
+    '''
+    Linear 층의 가중치를 int8 로 양자화하고 활성값은 실행 시 양자화하는 모델을 반환함
+    (동적 양자화는 Conv 를 지원하지 않으므로 Conv 는 BatchNorm 만 합친 float 으로 남음)
+    '''
+    return quantize_dynamic(fold_batch_norm(model), {nn.Linear}, dtype=torch.qint8)
+
+
+def load_face_crops(directory: str, max_images: int = 512) -> torch.Tensor:
+    '''
+    폴더의 얼굴 이미지들을 facial_expression_recognition 의 입력과 같이 흑백 48x48, 0~1 범위로 불러옴
+    이미지가 아닌 파일(README 등)은 건너뜀
+    :param directory: 얼굴 이미지(잘라낸 얼굴) 폴더
+    :param max_images: 사용할 최대 이미지 수
+    :return: N x 1 x 48 x 48 입력
+    '''
+    files = sorted(f for f in os.listdir(directory) if f.lower().endswith(IMAGE_EXTENSIONS))[:max_images]
+    if not files:
+        raise ValueError(f"No face images in {directory}")
+
+    crops = np.stack([
+        np.asarray(Image.open(os.path.join(directory, f)).convert("L").resize((48, 48))) for f in files
+    ])
+    return torch.from_numpy(crops).unsqueeze(1).float().div_(255)
+
+
+def load_calibration(directory: str, max_images: int = 512, batch_size: int = 32) -> list[torch.Tensor]:
+    '''
+    폴더의 얼굴 이미지들을 static_int8 보정 입력으로 불러옴
+    :param directory: 얼굴 이미지(잘라낸 얼굴) 폴더
+    :param max_images: 사용할 최대 이미지 수
+    :param batch_size: 보정 batch 크기
+    :return: N x 1 x 48 x 48 입력 리스트
+    '''
+    return list(load_face_crops(directory, max_images).split(batch_size))
+
+
+def to_static_int8(model: Face_Emotion_CNN, calibration: list[torch.Tensor] | None = None) -> nn.Module:
+    '''
+    Conv 와 Linear 를 모두 int8 로 실행하는 정적 양자화 모델을 반환함 (FX graph mode)
+    활성값 범위가 보정 입력으로 정해지므로 실제 얼굴 이미지로 보정해야 함
+    :param model: 원본 모델
+    :param calibration: 활성값 범위를 측정할 N x 1 x 48 x 48 입력 리스트 (load_calibration)
+    '''
+    if not calibration:
+        raise ValueError("static_int8 backend requires calibration face crops (set FER_CALIBRATION_DIR)")
+
+    engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "qnnpack"
+    torch.backends.quantized.engine = engine
+
+    float_model = copy.deepcopy(model).eval()
+    prepared = prepare_fx(float_model, get_default_qconfig_mapping(engine), example_inputs=(example_input(),))
+    with torch.no_grad():
+        for batch in calibration:
+            prepared(batch)
+
+    return convert_fx(prepared)
+
+
+def to_backend(model: Face_Emotion_CNN, backend: str = "eager", calibration: list[torch.Tensor] | None = None) -> nn.Module:
+    '''
+    학습된 모델을 선택한 추론 백엔드로 변환함
+    :param model: 학습된 float 모델
+    :param backend: "eager", "torchscript", "dynamic_int8", "static_int8" 중 하나
+    :param calibration: static_int8 에서 사용할 보정 입력
+    :return: 추론용 모델 (입력/출력 형태는 원본과 같음)
+    '''
+    model = model.eval()
+    if backend == "eager":
+        return model
+    elif backend == "torchscript":
+        return to_torchscript(model)
+    elif backend == "dynamic_int8":
+        return to_dynamic_int8(model)
+    elif backend == "static_int8":
+        return to_static_int8(model, calibration)
+    else:
+        raise ValueError(f"Unknown FER backend: {backend} (available: {', '.join(BACKENDS)})")
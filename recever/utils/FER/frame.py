@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+from PIL import Image
+
+from recever.utils.image_util import original_size
+
+
+class FaceFrame:
+    '''
+    FER 파이프라인(얼굴 검출, 얼굴 자르기, 박스 그리기)이 함께 사용하는 이미지 컨테이너
+    BGR ndarray 하나를 가지고, gray 이미지는 처음 필요할 때 한 번만 만듦
+    단계마다 PIL <-> OpenCV 변환을 반복하지 않도록 함
+    '''
+
+    def __init__(self, bgr: np.ndarray, original_size: tuple[int, int] | None = None):
+        self.bgr = bgr
+        self.original_size = original_size or (bgr.shape[1], bgr.shape[0])
+        self._gray = None
+
+    @classmethod
+    def from_pil(cls, image: Image) -> "FaceFrame":
+        '''
+        PIL 이미지를 한 번만 복사하고, 그 배열 위에서 RGB -> BGR 변환을 함
+        '''
+        array = np.array(image)
+        cv2.cvtColor(array, cv2.COLOR_RGB2BGR, dst=array)
+        return cls(array, original_size(image))
+
+    @classmethod
+    def of(cls, image) -> "FaceFrame":
+        return image if isinstance(image, FaceFrame) else cls.from_pil(image)
+
+    @property
+    def width(self) -> int:
+        return self.bgr.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.bgr.shape[0]
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.width, self.height
+
+    @property
+    def gray(self) -> np.ndarray:
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    def crop_batch(self, boxes: list[tuple[int, int, int, int]], size: int = 48) -> np.ndarray:
+        '''
+        얼굴 영역을 잘라 size x size 로 줄인 gray 이미지 배치를 만듦
+        미리 할당한 N x size x size 배열에 바로 resize 하여 중간 배열을 만들지 않음
+        :param boxes: 얼굴 좌표 리스트
+        :param size: 잘라낸 얼굴의 크기
+        :return: N x size x size uint8 배열
+        '''
+        batch = np.empty((len(boxes), size, size), dtype=np.uint8)
+        gray = self.gray
+        for i, (x1, y1, x2, y2) in enumerate(boxes):
+            cv2.resize(gray[y1:y2, x1:x2], (size, size), dst=batch[i])
+        return batch
+
+    def annotate(
+            self,
+            boxes: list[tuple[int, int, int, int]],
+            msg: str = "",
+            color: tuple[int, int, int] = (0, 0, 255),
+            thick: int = 2,
+            copy: bool = True) -> "FaceFrame":
+        '''
+        박스와 메시지를 그림
+        :param copy: False 이면 현재 frame 에 바로 그림 (다른 단계에서 같은 frame 을 쓰지 않을 때)
+        :return: 박스가 그려진 frame
+        '''
+        frame = FaceFrame(self.bgr.copy(), self.original_size) if copy else self
+        for index, (x1, y1, x2, y2) in enumerate(boxes):
+            y = y1 - 10 if y1 - 10 > 10 else y1 + 10
+            text = f"{msg} {index} ( {str(x1)}, {str(y1)} )"
+            cv2.rectangle(frame.bgr, (x1, y1), (x2, y2), color, thick)
+            cv2.putText(frame.bgr, text, (x1, y), cv2.LINE_AA, 0.45, color, thick)
+        frame._gray = None
+        return frame
+
+    def to_pil(self) -> Image:
+        return Image.fromarray(cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB))
@@ -37,7 +37,7 @@ class Face_Emotion_CNN(nn.Module):
         x = self.relu(self.pool2(self.cnn6_bn(self.dropout(self.cnn6(x)))))
         x = self.relu(self.pool2(self.cnn7_bn(self.dropout(self.cnn7(x)))))
 
-        x = x.view(x.size(0), -1)
+        x = x.reshape(x.size(0), -1)
 
         x = self.relu(self.dropout(self.fc1(x)))
         x = self.relu(self.dropout(self.fc2(x)))
@@ -0,0 +1,101 @@
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+from PIL import Image
+
+from recever.core.pipline.rpc import tracing
+from recever.utils import metrics
+from recever.utils.ImageCaption.image_caption import get_image_captions
+
+
+class CaptionEngine:
+    '''
+    동시에 들어온 캡션 요청을 모아서 한 번의 BLIP generate 호출로 처리하는 엔진
+    첫 요청이 들어온 뒤 max_wait_ms 동안 또는 max_batch_size 개가 모일 때까지 기다렸다가 배치로 실행함
+    '''
+
+    def __init__(self, max_batch_size: int = 8, max_wait_ms: float = 20):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+
+        self.batch_size_histogram = metrics.histogram(
+            "caption_batch_size", "BLIP generate 호출 당 이미지 수",
+            buckets=(1, 2, 4, 8, 16, 32, 64),
+        )
+        self.queue_time_histogram = metrics.histogram(
+            "caption_queue_seconds", "캡션 요청이 배치에 들어가기까지 기다린 시간",
+        )
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="caption-engine", daemon=True)
+                self._thread.start()
+
+    def submit(self, image: Image) -> Future:
+        '''
+        캡션 요청을 큐에 넣음
+        :param image: 이미지
+        :return: 캡션을 결과로 가지는 Future
+        '''
+        self._ensure_started()
+
+        future = Future()
+        self._queue.put((image, future, time.perf_counter(), tracing.inject()))
+        return future
+
+    def caption(self, image: Image, timeout: float | None = None) -> str:
+        '''
+        이미지 캡션을 반환함 (다른 요청과 묶여서 처리될 수 있음)
+        :param image: 이미지
+        :param timeout: 최대 대기 시간(초)
+        :return: 이미지 캡션
+        '''
+        with tracing.span("caption_engine.caption"):
+            return self.submit(image).result(timeout)
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+
+            start = time.perf_counter()
+            self.batch_size_histogram.observe(len(batch))
+            for _, _, enqueued, _ in batch:
+                self.queue_time_histogram.observe(start - enqueued)
+
+            # 배치는 여러 요청의 trace 에 걸치므로 첫 요청의 trace 에 기록하고 나머지 trace id 는 속성으로 남김
+            carriers = [carrier for _, _, _, carrier in batch if carrier]
+            try:
+                with tracing.child_of(
+                        carriers[0] if carriers else None, "caption_engine.batch",
+                        size=len(batch), traces=[carrier["trace_id"] for carrier in carriers]):
+                    captions = get_image_captions([image for image, _, _, _ in batch])
+                for (_, future, _, _), caption in zip(batch, captions):
+                    future.set_result(caption)
+            except Exception as e:
+                traceback.print_exc()
+                for _, future, _, _ in batch:
+                    future.set_exception(e)
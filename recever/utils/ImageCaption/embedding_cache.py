@@ -0,0 +1,90 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from PIL import Image
+
+from recever.utils import metrics
+
+
+def content_hash(image: Image.Image) -> str:
+    '''
+    디코딩된 픽셀 내용으로 이미지 해시를 계산함
+    같은 픽셀이면 파일 형식이나 메타데이터가 달라도 같은 값이 나옴
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.mode}:{image.width}x{image.height}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def _nbytes(value: Any) -> int:
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    return value.numel() * value.element_size()
+
+
+class EmbeddingCache:
+    '''
+    BLIP vision encoder 출력(image embedding)을 이미지 해시로 저장하는 LRU 캐시
+    저장된 embedding 의 전체 크기가 max_bytes 를 넘거나 항목 수가 max_entries 를 넘으면 오래된 것부터 지움
+    '''
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, max_entries: int = 1024):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+        self.hits = metrics.counter("caption_embedding_cache_hits", "image embedding 캐시 적중 수")
+        self.misses = metrics.counter("caption_embedding_cache_misses", "image embedding 캐시 미스 수")
+        self.evictions = metrics.counter("caption_embedding_cache_evictions", "image embedding 캐시에서 지운 수")
+
+        self._entries: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses.inc()
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits.inc()
+            return entry[0]
+
+    def set(self, key: str, embedding: Any) -> None:
+        size = _nbytes(embedding)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._entries[key] = (embedding, size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions.inc()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits.value + self.misses.value
+        return {
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits.value,
+            "misses": self.misses.value,
+            "evictions": self.evictions.value,
+            "hit_rate": self.hits.value / total if total else 0.0,
+        }
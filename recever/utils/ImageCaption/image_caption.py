@@ -1,9 +1,58 @@
 import argparse
 
+import numpy as np
+import torch
 from PIL import Image, ImageDraw, ImageFont
+from starlette.config import Config
 from transformers import BlipProcessor, BlipForConditionalGeneration
 
+from recever.core.pipline.rpc import tracing
+from recever.utils.ImageCaption.embedding_cache import EmbeddingCache, content_hash
 from recever.utils.image_util import get_image_from_url
+from recever.utils.model_registry import registry
+
+BLIP_MODEL_NAME = "Salesforce/blip-image-captioning-base"
+CAPTION_BACKENDS = ("hf", "onnx")
+
+config = Config('../.env')
+CAPTION_BACKEND = config('CAPTION_BACKEND', default="hf")
+CAPTION_ONNX_DIR = config('CAPTION_ONNX_DIR', default=None)
+CAPTION_NUM_BEAMS = config('CAPTION_NUM_BEAMS', cast=int, default=1)
+
+embedding_cache = EmbeddingCache(
+    max_bytes=config('CAPTION_EMBEDDING_CACHE_BYTES', cast=int, default=256 * 1024 * 1024),
+    max_entries=config('CAPTION_EMBEDDING_CACHE_SIZE', cast=int, default=1024),
+)
+
+if CAPTION_BACKEND not in CAPTION_BACKENDS:
+    raise ValueError(f"Unknown caption backend: {CAPTION_BACKEND} (available: {', '.join(CAPTION_BACKENDS)})")
+
+
+def load_blip() -> tuple[BlipProcessor, BlipForConditionalGeneration]:
+    '''
+    BLIP 프로세서와 모델을 불러옴
+    :return: (프로세서, 모델)
+    '''
+    processor = BlipProcessor.from_pretrained(BLIP_MODEL_NAME)
+    model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_NAME)
+
+    return processor, model
+
+
+def load_blip_onnx():
+    '''
+    onnx_blip.export_onnx 로 내보낸 BLIP 모델을 ONNX Runtime 으로 불러옴
+    :return: OnnxBlipCaptioner
+    '''
+    from recever.utils.ImageCaption.onnx_blip import DEFAULT_ONNX_DIR, OnnxBlipCaptioner
+
+    return OnnxBlipCaptioner(CAPTION_ONNX_DIR or DEFAULT_ONNX_DIR)
+
+
+if CAPTION_BACKEND == "onnx":
+    registry.register("blip_onnx", load_blip_onnx)
+else:
+    registry.register("blip", load_blip)
 
 
 def print_caption_on_img(image: Image, caption: str, font_name: str = 'arial.ttf', size: int = 24) -> Image:
@@ -22,20 +71,107 @@ def print_caption_on_img(image: Image, caption: str, font_name: str = 'arial.ttf
     return image
 
 
-def get_image_caption(image: Image) -> str:
+def encode_images(images: list[Image], use_cache: bool = True) -> list:
+    '''
+    이미지를 BLIP vision encoder 에 넣어 image embedding 을 만듦
+    같은 이미지의 embedding 은 캐시에서 꺼내고, 캐시에 없는 이미지만 한 번에 계산함
+    :param images: 이미지 리스트
+    :param use_cache: embedding 캐시 사용 여부
+    :return: 이미지 순서와 같은 순서의 embedding 리스트 (hf: torch.Tensor, onnx: np.ndarray)
+    '''
+    keys = [content_hash(image) for image in images] if use_cache else [None] * len(images)
+    embeddings = [embedding_cache.get(key) if use_cache else None for key in keys]
+
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        batch = [images[i] for i in missing]
+        if CAPTION_BACKEND == "onnx":
+            computed = registry.get("blip_onnx").encode(batch)
+        else:
+            processor, model = registry.get("blip")
+            with torch.no_grad():
+                computed = model.vision_model(pixel_values=processor(images=batch, return_tensors="pt")["pixel_values"])[0]
+
+        for i, embedding in zip(missing, computed):
+            embeddings[i] = embedding
+            if use_cache:
+                # 배치 결과의 한 행(view)을 그대로 저장하면 배치 전체의 메모리가 남으므로 복사해서 저장함
+                embedding_cache.set(keys[i], embedding.clone() if isinstance(embedding, torch.Tensor) else embedding.copy())
+
+    return embeddings
+
+
+def decode_captions(
+        embeddings: list,
+        prompt: str | None = None,
+        num_beams: int | None = None,
+        max_length: int | None = None) -> list[str]:
+    '''
+    image embedding 으로 캡션을 생성함
+    :param embeddings: encode_images 의 결과
+    :param prompt: 캡션의 시작 문장 (예: "a photography of")
+    :param num_beams: beam 수 (없으면 CAPTION_NUM_BEAMS)
+    :param max_length: 최대 토큰 수 (없으면 모델 기본값)
+    :return: 캡션 리스트
+    '''
+    num_beams = num_beams or CAPTION_NUM_BEAMS
+    if not embeddings:
+        return []
+
+    if CAPTION_BACKEND == "onnx":
+        return registry.get("blip_onnx").decode(np.stack(embeddings), prompt, num_beams, max_length)
+
+    processor, model = registry.get("blip")
+    image_embeds = torch.stack(embeddings)
+    batch_size = image_embeds.shape[0]
+    text_config = model.config.text_config
+
+    # BlipForConditionalGeneration.generate 에서 vision encoder 부분만 뺀 것과 같음
+    if prompt:
+        inputs = processor.tokenizer([prompt] * batch_size, return_tensors="pt")
+        input_ids, attention_mask = inputs["input_ids"][:, :-1], inputs["attention_mask"][:, :-1]
+    else:
+        input_ids, attention_mask = torch.zeros(batch_size, 1, dtype=torch.long), None
+    input_ids[:, 0] = text_config.bos_token_id
+
+    generate_kwargs = {"num_beams": num_beams}
+    if max_length:
+        generate_kwargs["max_length"] = max_length
+
+    with torch.no_grad():
+        out = model.text_decoder.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            eos_token_id=text_config.sep_token_id,
+            pad_token_id=text_config.pad_token_id,
+            encoder_hidden_states=image_embeds,
+            encoder_attention_mask=torch.ones(image_embeds.shape[:-1], dtype=torch.long),
+            **generate_kwargs,
+        )
+
+    return processor.batch_decode(out, skip_special_tokens=True)
+
+
+@tracing.traced("get_image_caption")
+def get_image_caption(image: Image, **kwargs) -> str:
     '''
     이미지를 입력받아 이미지 캡션을 반환함
     :param image: 이미지
+    :param kwargs: decode_captions 의 prompt, num_beams, max_length
     :return: 이미지 캡션
     '''
-    processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-    model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
+    return get_image_captions([image], **kwargs)[0]
 
-    inputs = processor(image, return_tensors="pt")
-    out = model.generate(**inputs)
-    caption = processor.decode(out[0], skip_special_tokens=True)
 
-    return caption
+@tracing.traced("get_image_captions")
+def get_image_captions(images: list[Image], **kwargs) -> list[str]:
+    '''
+    여러 이미지를 한 번의 encoder / decoder 호출로 캡션을 생성함
+    :param images: 이미지 리스트
+    :param kwargs: decode_captions 의 prompt, num_beams, max_length
+    :return: 이미지 순서와 같은 순서의 캡션 리스트
+    '''
+    return decode_captions(encode_images(images), **kwargs)
 
 
 if __name__ == '__main__':
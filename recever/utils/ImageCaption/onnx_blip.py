@@ -0,0 +1,393 @@
+import argparse
+import inspect
+import json
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image
+from transformers import BlipForConditionalGeneration, BlipProcessor
+
+DEFAULT_ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx")
+
+# torch 2.5 부터 dynamo 인자가 생겼고 최근 버전은 기본값이 dynamo exporter 이므로,
+# 인자가 있는 버전에서만 TorchScript exporter 를 명시함 (requirements 의 torch 2.3 에는 인자가 없음)
+_EXPORT_KWARGS = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+
+VISION_ENCODER_FILE = "vision_encoder.onnx"
+DECODER_FILE = "text_decoder.onnx"
+DECODER_WITH_PAST_FILE = "text_decoder_with_past.onnx"
+CONFIG_FILE = "caption_config.json"
+
+
+class _VisionEncoder(nn.Module):
+    def __init__(self, model: BlipForConditionalGeneration):
+        super().__init__()
+        self.vision_model = model.vision_model
+
+    def forward(self, pixel_values):
+        return self.vision_model(pixel_values=pixel_values)[0]
+
+
+class _TextDecoder(nn.Module):
+    '''
+    BLIP text decoder 를 (마지막 토큰 logits, self-attention key/value) 를 내보내는 형태로 감쌈
+    past 가 주어지면 이전 단계의 key/value 를 이어서 사용함
+    '''
+
+    def __init__(self, model: BlipForConditionalGeneration):
+        super().__init__()
+        self.text_decoder = model.text_decoder
+
+    def forward(self, input_ids, attention_mask, encoder_hidden_states, *past):
+        past_key_values = None
+        if past:
+            past_key_values = tuple((past[i], past[i + 1]) for i in range(0, len(past), 2))
+
+        outputs = self.text_decoder(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            encoder_hidden_states=encoder_hidden_states,
+            past_key_values=past_key_values,
+            use_cache=True,
+            return_dict=True,
+        )
+
+        presents = [tensor for layer in outputs.past_key_values for tensor in layer[:2]]
+        return (outputs.logits[:, -1, :], *presents)
+
+
+def _past_names(prefix: str, num_layers: int) -> list[str]:
+    return [f"{prefix}.{i}.{kind}" for i in range(num_layers) for kind in ("key", "value")]
+
+
+def export_onnx(model_name: str, output_dir: str = DEFAULT_ONNX_DIR, opset: int = 17, local_files_only: bool = True) -> str:
+    '''
+    BLIP 캡션 모델을 vision encoder, text decoder, key/value 캐시를 사용하는 text decoder 세 개의 ONNX 파일로 내보냄
+    기본적으로 로컬에 캐시된 체크포인트만 사용하므로 네트워크 없이 실행할 수 있음
+    :param model_name: Hugging Face 모델 이름 또는 로컬 경로
+    :param output_dir: 저장할 폴더
+    :param opset: ONNX opset 버전
+    :param local_files_only: 로컬 캐시만 사용할지 여부
+    :return: 저장한 폴더
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+
+    processor = BlipProcessor.from_pretrained(model_name, local_files_only=local_files_only)
+    model = BlipForConditionalGeneration.from_pretrained(model_name, local_files_only=local_files_only).eval()
+    model.config.use_cache = True
+    text_config = model.config.text_config
+    num_layers = text_config.num_hidden_layers
+
+    image_size = model.config.vision_config.image_size
+    pixel_values = torch.zeros(1, 3, image_size, image_size)
+
+    with torch.no_grad():
+        torch.onnx.export(
+            _VisionEncoder(model),
+            (pixel_values,),
+            os.path.join(output_dir, VISION_ENCODER_FILE),
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=opset,
+            **_EXPORT_KWARGS,
+        )
+
+        image_embeds = _VisionEncoder(model)(pixel_values).repeat(2, 1, 1)
+        input_ids = torch.full((2, 2), text_config.bos_token_id, dtype=torch.long)
+        attention_mask = torch.ones_like(input_ids)
+
+        decoder = _TextDecoder(model)
+        logits, *past = decoder(input_ids, attention_mask, image_embeds)
+
+        past_axes = {0: "batch", 2: "past_sequence"}
+        present_axes = {0: "batch", 2: "sequence"}
+        torch.onnx.export(
+            decoder,
+            (input_ids, attention_mask, image_embeds),
+            os.path.join(output_dir, DECODER_FILE),
+            input_names=["input_ids", "attention_mask", "encoder_hidden_states"],
+            output_names=["logits", *_past_names("present", num_layers)],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "encoder_hidden_states": {0: "batch", 1: "image_sequence"},
+                "logits": {0: "batch"},
+                **{name: present_axes for name in _past_names("present", num_layers)},
+            },
+            opset_version=opset,
+            **_EXPORT_KWARGS,
+        )
+
+        next_ids = input_ids[:, -1:]
+        torch.onnx.export(
+            decoder,
+            (next_ids, torch.ones(2, 3, dtype=torch.long), image_embeds, *past),
+            os.path.join(output_dir, DECODER_WITH_PAST_FILE),
+            input_names=["input_ids", "attention_mask", "encoder_hidden_states", *_past_names("past", num_layers)],
+            output_names=["logits", *_past_names("present", num_layers)],
+            dynamic_axes={
+                "input_ids": {0: "batch"},
+                "attention_mask": {0: "batch", 1: "total_sequence"},
+                "encoder_hidden_states": {0: "batch", 1: "image_sequence"},
+                "logits": {0: "batch"},
+                **{name: past_axes for name in _past_names("past", num_layers)},
+                **{name: present_axes for name in _past_names("present", num_layers)},
+            },
+            opset_version=opset,
+            **_EXPORT_KWARGS,
+        )
+
+    processor.save_pretrained(output_dir)
+    # BlipForConditionalGeneration.generate 는 text decoder 의 generation config 로 생성함
+    generation_config = model.text_decoder.generation_config
+    with open(os.path.join(output_dir, CONFIG_FILE), "w") as f:
+        json.dump({
+            "model_name": model_name,
+            "num_layers": num_layers,
+            "bos_token_id": text_config.bos_token_id,
+            "sep_token_id": text_config.sep_token_id,
+            "pad_token_id": text_config.pad_token_id,
+            "max_length": generation_config.max_length,
+            "length_penalty": generation_config.length_penalty,
+            "early_stopping": generation_config.early_stopping,
+        }, f, indent=2)
+
+    return output_dir
+
+
+def _log_softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    return logits - np.log(np.exp(logits).sum(axis=-1, keepdims=True))
+
+
+class _BeamHypotheses:
+    '''
+    이미지 하나에 대해 완성된 문장 중 점수가 높은 num_beams 개를 유지함 (transformers 의 BeamHypotheses 와 같음)
+    점수는 log 확률의 합을 (생성한 토큰 수 ** length_penalty) 로 나눈 값임
+    '''
+
+    def __init__(self, num_beams: int, length_penalty: float, early_stopping: bool | str, max_new_tokens: int):
+        self.num_beams = num_beams
+        self.length_penalty = length_penalty
+        self.early_stopping = early_stopping
+        self.max_new_tokens = max_new_tokens
+        self.beams = []
+        self.worst_score = 1e9
+
+    def add(self, sum_logprobs: float, sequence: np.ndarray, generated_length: int):
+        score = sum_logprobs / generated_length ** self.length_penalty
+        if len(self.beams) < self.num_beams or score > self.worst_score:
+            self.beams.append((score, sequence))
+            if len(self.beams) > self.num_beams:
+                ranked = sorted((s, i) for i, (s, _) in enumerate(self.beams))
+                del self.beams[ranked[0][1]]
+                self.worst_score = ranked[1][0]
+            else:
+                self.worst_score = min(score, self.worst_score)
+
+    def is_done(self, best_sum_logprobs: float, generated_length: int) -> bool:
+        if len(self.beams) < self.num_beams:
+            return False
+        if self.early_stopping is True:
+            return True
+        # "never" 이고 length_penalty 가 양수이면 최대 길이까지 생성했을 때의 점수가 가장 높음
+        if self.early_stopping == "never" and self.length_penalty > 0.0:
+            generated_length = self.max_new_tokens
+        return self.worst_score >= best_sum_logprobs / generated_length ** self.length_penalty
+
+    def best(self) -> np.ndarray:
+        return sorted(self.beams, key=lambda item: item[0])[-1][1]
+
+
+class OnnxBlipCaptioner:
+    '''
+    export_onnx 로 내보낸 BLIP 모델을 ONNX Runtime(CPU)으로 실행하는 캡션 생성기
+    text decoder 는 이전 단계의 self-attention key/value 를 캐시하여 매 단계 새 토큰 하나만 계산함
+    '''
+
+    def __init__(self, model_dir: str = DEFAULT_ONNX_DIR, intra_op_num_threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_num_threads
+        providers = ["CPUExecutionProvider"]
+
+        def session(file_name):
+            return ort.InferenceSession(os.path.join(model_dir, file_name), options, providers=providers)
+
+        self.vision_encoder = session(VISION_ENCODER_FILE)
+        self.decoder = session(DECODER_FILE)
+        self.decoder_with_past = session(DECODER_WITH_PAST_FILE)
+        self.processor = BlipProcessor.from_pretrained(model_dir, local_files_only=True)
+
+        with open(os.path.join(model_dir, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        self.past_names = _past_names("past", self.config["num_layers"])
+
+    def encode(self, images: list[Image.Image]) -> np.ndarray:
+        '''
+        이미지를 vision encoder 에 넣어 image embedding(B x S x D)을 만듦
+        '''
+        pixel_values = self.processor(images=images, return_tensors="np")["pixel_values"].astype(np.float32)
+        return self.vision_encoder.run(None, {"pixel_values": pixel_values})[0]
+
+    def __prompt_ids__(self, batch_size: int, prompt: str | None) -> np.ndarray:
+        # BlipForConditionalGeneration.generate 와 같이 첫 토큰을 bos 로 바꾸고 마지막 [SEP] 을 뺌
+        if prompt:
+            input_ids = self.processor.tokenizer([prompt] * batch_size, return_tensors="np")["input_ids"][:, :-1]
+        else:
+            input_ids = np.zeros((batch_size, 1), dtype=np.int64)
+        input_ids = input_ids.astype(np.int64)
+        input_ids[:, 0] = self.config["bos_token_id"]
+        return input_ids
+
+    def __step__(self, input_ids, attention_mask, image_embeds, past=None):
+        feeds = {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "encoder_hidden_states": image_embeds,
+        }
+        if past is None:
+            outputs = self.decoder.run(None, feeds)
+        else:
+            feeds.update(zip(self.past_names, past))
+            outputs = self.decoder_with_past.run(None, feeds)
+        return outputs[0], outputs[1:]
+
+    def greedy(self, image_embeds: np.ndarray, prompt: str | None = None, max_length: int | None = None) -> np.ndarray:
+        max_length = max_length or self.config["max_length"]
+        batch_size = image_embeds.shape[0]
+        sep, pad = self.config["sep_token_id"], self.config["pad_token_id"]
+
+        sequences = self.__prompt_ids__(batch_size, prompt)
+        logits, past = self.__step__(sequences, np.ones_like(sequences), image_embeds)
+        finished = np.zeros(batch_size, dtype=bool)
+
+        while sequences.shape[1] < max_length:
+            next_ids = np.where(finished, pad, logits.argmax(axis=-1)).astype(np.int64)
+            sequences = np.concatenate([sequences, next_ids[:, None]], axis=1)
+            finished |= next_ids == sep
+            if finished.all() or sequences.shape[1] >= max_length:
+                break
+
+            attention_mask = np.ones(sequences.shape, dtype=np.int64)
+            logits, past = self.__step__(next_ids[:, None], attention_mask, image_embeds, past)
+
+        return sequences
+
+    def beam_search(
+            self,
+            image_embeds: np.ndarray,
+            num_beams: int,
+            prompt: str | None = None,
+            max_length: int | None = None,
+            length_penalty: float | None = None,
+            early_stopping: bool | str | None = None) -> np.ndarray:
+        '''
+        transformers 의 BeamSearchScorer 와 같은 규칙으로 beam search 를 함
+        상위 num_beams 안에 든 [SEP] 만 완성된 문장으로 받고, 진행 중인 후보가
+        완성된 문장 중 가장 나쁜 점수를 넘을 수 없을 때 멈춤
+        '''
+        max_length = max_length or self.config["max_length"]
+        if length_penalty is None:
+            length_penalty = self.config.get("length_penalty", 1.0)
+        if early_stopping is None:
+            early_stopping = self.config.get("early_stopping", False)
+        sep, pad = self.config["sep_token_id"], self.config["pad_token_id"]
+
+        results = []
+        for embeds in image_embeds:
+            # 이미지 하나에 대해 num_beams 개의 후보를 유지함
+            embeds = np.repeat(embeds[None], num_beams, axis=0)
+            sequences = self.__prompt_ids__(num_beams, prompt)
+            prompt_length = sequences.shape[1]
+            logits, past = self.__step__(sequences, np.ones_like(sequences), embeds)
+
+            scores = np.full(num_beams, -1e9, dtype=np.float32)
+            scores[0] = 0.0
+            hypotheses = _BeamHypotheses(num_beams, length_penalty, early_stopping, max_length - prompt_length)
+
+            while True:
+                candidates = (scores[:, None] + _log_softmax(logits)).reshape(-1)
+                top = np.argpartition(-candidates, 2 * num_beams)[:2 * num_beams]
+                top = top[np.argsort(-candidates[top], kind="stable")]
+                vocab_size = logits.shape[-1]
+                generated_length = sequences.shape[1] + 1 - prompt_length
+
+                beams, tokens, new_scores = [], [], []
+                for rank, index in enumerate(top):
+                    beam, token = divmod(int(index), vocab_size)
+                    if token == sep:
+                        # 상위 num_beams 밖의 [SEP] 은 완성된 문장으로 받지 않음
+                        if rank < num_beams:
+                            hypotheses.add(float(candidates[index]), np.append(sequences[beam], token), generated_length)
+                    else:
+                        beams.append(beam)
+                        tokens.append(token)
+                        new_scores.append(candidates[index])
+                    if len(beams) == num_beams:
+                        break
+
+                done = hypotheses.is_done(float(candidates[top[0]]), generated_length)
+
+                beams = np.array(beams)
+                next_ids = np.array(tokens, dtype=np.int64)
+                sequences = np.concatenate([sequences[beams], next_ids[:, None]], axis=1)
+                scores = np.array(new_scores, dtype=np.float32)
+
+                if done:
+                    break
+                if sequences.shape[1] >= max_length:
+                    # 최대 길이에 닿으면 진행 중인 후보도 완성된 문장으로 넣음
+                    for score, sequence in zip(scores, sequences):
+                        hypotheses.add(float(score), sequence, len(sequence) - prompt_length)
+                    break
+
+                past = [tensor[beams] for tensor in past]
+                attention_mask = np.ones(sequences.shape, dtype=np.int64)
+                logits, past = self.__step__(next_ids[:, None], attention_mask, embeds, past)
+
+            results.append(hypotheses.best())
+
+        width = max(len(sequence) for sequence in results)
+        return np.stack([np.pad(s, (0, width - len(s)), constant_values=pad) for s in results])
+
+    def decode(
+            self,
+            image_embeds: np.ndarray,
+            prompt: str | None = None,
+            num_beams: int = 1,
+            max_length: int | None = None) -> list[str]:
+        '''
+        image embedding 으로 캡션을 생성함
+        :param image_embeds: encode 의 결과
+        :param prompt: 캡션의 시작 문장 (예: "a photography of")
+        :param num_beams: 1 이면 greedy, 2 이상이면 beam search
+        :param max_length: 최대 토큰 수 (prompt 포함)
+        :return: 캡션 리스트
+        '''
+        if num_beams > 1:
+            sequences = self.beam_search(image_embeds, num_beams, prompt, max_length)
+        else:
+            sequences = self.greedy(image_embeds, prompt, max_length)
+
+        return self.processor.batch_decode(sequences, skip_special_tokens=True)
+
+    def caption(self, images: list[Image.Image], **kwargs) -> list[str]:
+        return self.decode(self.encode(images), **kwargs)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="BLIP 캡션 모델을 ONNX 로 내보냄")
+    ap.add_argument("-m", "--model", default="Salesforce/blip-image-captioning-base",
+                    help="모델 이름 또는 로컬 체크포인트 경로")
+    ap.add_argument("-o", "--output", default=DEFAULT_ONNX_DIR, help="저장할 폴더")
+    ap.add_argument("--opset", type=int, default=17)
+    ap.add_argument("--allow-download", action="store_true", help="로컬 캐시에 없으면 내려받음")
+    args = ap.parse_args()
+
+    print(export_onnx(args.model, args.output, args.opset, local_files_only=not args.allow_download))
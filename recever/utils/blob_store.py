@@ -0,0 +1,91 @@
+import threading
+import time
+
+from starlette.config import Config
+
+config = Config('../.env')
+
+
+class BlobNotFoundError(FileNotFoundError):
+    pass
+
+
+class BlobStore:
+    '''
+    RPC 로 조각(chunk)을 나눠 받은 큰 이미지 데이터를 모으는 메모리 저장소
+    요청 메시지보다 조각이 늦게 처리될 수 있으므로, get 은 모든 조각이 도착할 때까지 기다림
+    ttl 이 지나도록 가져가지 않은 blob 과 전체 크기가 max_bytes 를 넘는 오래된 blob 은 지움
+    '''
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl: float = 60):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        # blob_id -> [조각 리스트, 받은 조각 수, 크기(byte), 마지막 갱신 시각]
+        self._blobs = {}
+        self._bytes = 0
+        self._condition = threading.Condition()
+
+    def put_chunk(self, blob_id: str, seq: int, total: int, data: bytes) -> None:
+        with self._condition:
+            entry = self._blobs.get(blob_id)
+            if entry is None:
+                entry = self._blobs[blob_id] = [[None] * total, 0, 0, time.monotonic()]
+
+            chunks = entry[0]
+            if chunks[seq] is None:
+                chunks[seq] = data
+                entry[1] += 1
+                entry[2] += len(data)
+                self._bytes += len(data)
+            entry[3] = time.monotonic()
+
+            self.__evict__()
+            self._condition.notify_all()
+
+    def get(self, blob_id: str, timeout: float = 30) -> bytes:
+        '''
+        모든 조각이 도착하면 합친 데이터를 반환하고 저장소에서 지움
+        :param blob_id: blob 이름
+        :param timeout: 조각을 기다리는 최대 시간(초)
+        :return: 데이터
+        '''
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                entry = self._blobs.get(blob_id)
+                if entry is not None and entry[1] == len(entry[0]):
+                    del self._blobs[blob_id]
+                    self._bytes -= entry[2]
+                    return b"".join(entry[0])
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    received = 0 if entry is None else entry[1]
+                    total = "?" if entry is None else len(entry[0])
+                    raise BlobNotFoundError(f"blob {blob_id} incomplete ({received}/{total} chunks)")
+                self._condition.wait(remaining)
+
+    def resolve(self, value):
+        '''
+        blob 참조({"blob": id})이면 모인 데이터를 반환하고, 아니면 값을 그대로 반환함
+        '''
+        if isinstance(value, dict) and "blob" in value:
+            return self.get(value["blob"])
+        return value
+
+    def __evict__(self):
+        now = time.monotonic()
+        for blob_id in [blob_id for blob_id, entry in self._blobs.items() if now - entry[3] > self.ttl]:
+            self._bytes -= self._blobs.pop(blob_id)[2]
+
+        for blob_id in sorted(self._blobs, key=lambda blob_id: self._blobs[blob_id][3]):
+            if self._bytes <= self.max_bytes:
+                break
+            self._bytes -= self._blobs.pop(blob_id)[2]
+
+
+blob_store = BlobStore(
+    max_bytes=config('BLOB_STORE_MAX_BYTES', cast=int, default=256 * 1024 * 1024),
+    ttl=config('BLOB_STORE_TTL_SECONDS', cast=float, default=60),
+)
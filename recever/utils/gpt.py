@@ -2,16 +2,22 @@ import os
 import sys
 
 from openai import OpenAI
+from starlette.config import Config
+
+from recever.core.pipline.rpc import tracing
 
 sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
 
-from recever.utils.image_util import get_image_from_url
-from recever.utils.FER.FER_image import fer_json
-from recever.utils.ImageCaption.image_caption import get_image_caption
+config = Config('../.env')
+
+# OPENAI_BASE_URL 로 OpenAI 호환 서버(예: recever/utils/openai_stub.py)를 가리키면 네트워크 없이 실행할 수 있음
+OPENAI_MODEL = config('OPENAI_MODEL', default="gpt-3.5-turbo")
 
 client = OpenAI(
     # This is the default and can be omitted
     api_key=os.environ.get("OPENAI_API_KEY"),
+    base_url=config('OPENAI_BASE_URL', default=None),
+    timeout=config('OPENAI_TIMEOUT_SECONDS', cast=float, default=600),
 )
 
 
@@ -44,38 +50,58 @@ def make_prompt(caption: str, user_text: str) -> str:
     """)
 
 
+def make_messages(caption: str, user_text: str) -> list[dict]:
+    return [
+        {
+            "role": "system",
+            "content": "너는 향기에 처음 입문하여 자신의 취향을 잘 모르는 고객에게 향을 추천해주는 조향사야",
+        },
+        {
+            "role": "user",
+            "content": make_prompt(caption, user_text),
+        }
+    ]
+
+
+@tracing.traced("make_response")
 def make_response(caption: str, user_text: str):
     response = client.chat.completions.create(
-        messages=[
-            {
-                "role": "system",
-                "content": "너는 향기에 처음 입문하여 자신의 취향을 잘 모르는 고객에게 향을 추천해주는 조향사야",
-            },
-            {
-                "role": "user",
-                "content": make_prompt(caption, user_text),
-            }
-        ],
-        model="gpt-3.5-turbo",
+        messages=make_messages(caption, user_text),
+        model=OPENAI_MODEL,
     )
     return str(response.choices[0].message.content)
 
 
+@tracing.traced("make_response_stream")
+def make_response_stream(caption: str, user_text: str):
+    '''
+    GPT 응답을 생성되는 대로 조각(str) 단위로 반환함
+    :param caption: 이미지 캡션
+    :param user_text: 사용자 텍스트
+    :return: 응답 조각 generator
+    '''
+    stream = client.chat.completions.create(
+        messages=make_messages(caption, user_text),
+        model=OPENAI_MODEL,
+        stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
 if __name__ == "__main__":
     '''
-    병렬 처리 시도 결과 프로세스 생성 등에 따른 오버헤드가 발생하여 오히려 더 느려짐
-    따라서 순차 실행으로 변경
-    순차실행 결과 10초대, 병렬실행 결과 60-100초대
+    요청마다 프로세스를 만들던 병렬 처리는 생성 오버헤드 때문에 순차 실행보다 느렸음 (순차 10초대, 병렬 60-100초대)
+    image_info_pipeline 은 미리 만든 워커에서 캡션과 FER 을 동시에 실행하고 단계별 시간을 알려줌
     '''
-    path = input("이미지 경로 또는 Url을 입력해주세요: ")
-    img = get_image_from_url(path)
+    from recever.utils.methods import image_info_pipeline
 
-    json = fer_json(img)
-    caption = get_image_caption(img)
+    path = input("이미지 경로 또는 Url을 입력해주세요: ")
+    results, timings = image_info_pipeline.run(url=path)
+    print(timings)
 
     user_text = input("자신의 이야기를 전해주세요 : ")
 
-    stream = make_response(caption, json, user_text)
-
-    for chunk in stream:
-        print(chunk.choices[0].delta.content or "", end="")
+    for text in make_response_stream(f"{results['caption']}\n{results['emotions']}", user_text):
+        print(text, end="")
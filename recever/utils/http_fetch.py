@@ -0,0 +1,224 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from recever.utils import metrics
+
+CONNECT_TIMEOUT = 3.0
+READ_TIMEOUT = 10.0
+MAX_BYTES = 20 * 1024 * 1024
+MAX_CONNECTIONS = 32
+MAX_CONNECTIONS_PER_HOST = 4
+# 동시 요청 수 제한을 기억해둘 최대 호스트 수 (넘으면 요청 중이 아닌 오래된 호스트부터 지움)
+MAX_HOSTS = 256
+CHUNK_SIZE = 64 * 1024
+
+fetch_seconds_histogram = metrics.histogram("image_fetch_seconds", "원격 이미지를 받아오는 데 걸린 시간")
+fetch_bytes_histogram = metrics.histogram(
+    "image_fetch_bytes", "원격 이미지 크기(byte)",
+    buckets=(16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024),
+)
+fetch_errors_counter = metrics.counter("image_fetch_errors", "원격 이미지 받아오기 실패 수")
+
+
+class FetchError(Exception):
+    pass
+
+
+class ImageTooLargeError(FetchError):
+    pass
+
+
+class HostLimits:
+    '''
+    호스트별 동시 요청 수 제한 (호스트마다 semaphore 하나)
+    기억하는 호스트가 max_hosts 를 넘으면 요청 중이 아닌 호스트를 오래 사용하지 않은 것부터 지움
+    '''
+
+    def __init__(self, limit: int, max_hosts: int = MAX_HOSTS, semaphore=threading.BoundedSemaphore):
+        self.limit = limit
+        self.max_hosts = max_hosts
+        self.semaphore = semaphore
+
+        # host -> [semaphore, 요청 중인 수]
+        self._hosts = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, host: str):
+        '''
+        host 의 semaphore 를 반환함. with 블록이 끝날 때까지 host 를 지우지 않음
+        '''
+        with self._lock:
+            entry = self._hosts.pop(host, None) or [self.semaphore(self.limit), 0]
+            entry[1] += 1
+            self._hosts[host] = entry
+            self.__evict__()
+        try:
+            yield entry[0]
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                self.__evict__()
+
+    def __len__(self):
+        return len(self._hosts)
+
+    def __evict__(self):
+        for host in [host for host, entry in self._hosts.items() if entry[1] == 0]:
+            if len(self._hosts) <= self.max_hosts:
+                break
+            del self._hosts[host]
+
+
+_session = None
+_session_lock = threading.Lock()
+_host_limits = HostLimits(MAX_CONNECTIONS_PER_HOST)
+
+
+def get_session() -> requests.Session:
+    '''
+    프로세스 전체에서 공유하는 keep-alive 연결 풀 세션을 반환함
+    '''
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_CONNECTIONS, pool_maxsize=MAX_CONNECTIONS_PER_HOST)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def _check_length(url: str, content_length: str | None, max_bytes: int) -> None:
+    if content_length is not None and int(content_length) > max_bytes:
+        raise ImageTooLargeError(f"{url} is larger than {max_bytes} bytes")
+
+
+def fetch_bytes(url: str, max_bytes: int = MAX_BYTES, timeout: tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT)) -> bytes:
+    '''
+    url 의 내용을 최대 max_bytes 까지 받아옴
+    호스트 당 동시 요청 수는 MAX_CONNECTIONS_PER_HOST 로 제한됨
+    :param url: 주소
+    :param max_bytes: 최대 크기(byte). 넘으면 ImageTooLargeError
+    :param timeout: (연결, 읽기) 타임아웃(초)
+    :return: 받아온 내용
+    '''
+    start = time.perf_counter()
+    try:
+        with _host_limits.hold(urlsplit(url).netloc) as limit, limit:
+            with get_session().get(url, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                _check_length(url, response.headers.get("Content-Length"), max_bytes)
+
+                data = bytearray()
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    data += chunk
+                    if len(data) > max_bytes:
+                        raise ImageTooLargeError(f"{url} is larger than {max_bytes} bytes")
+    except Exception:
+        fetch_errors_counter.inc()
+        raise
+
+    fetch_seconds_histogram.observe(time.perf_counter() - start)
+    fetch_bytes_histogram.observe(len(data))
+    return bytes(data)
+
+
+_loop = None
+_loop_lock = threading.Lock()
+_async_client = None
+# 백그라운드 이벤트 루프에서만 사용하므로 asyncio.Semaphore 를 씀
+_async_host_limits = HostLimits(MAX_CONNECTIONS_PER_HOST, semaphore=asyncio.Semaphore)
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    '''
+    비동기 요청을 실행하는 백그라운드 이벤트 루프를 반환함
+    프로세스 동안 계속 실행되므로 AsyncClient 의 keep-alive 연결을 호출마다 다시 만들지 않음
+    '''
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="http-fetch", daemon=True).start()
+        return _loop
+
+
+def _reset_after_fork():
+    # fork 한 자식 프로세스에는 루프를 실행하는 스레드가 없으므로 처음 사용할 때 다시 만듦
+    global _loop, _loop_lock, _async_client, _async_host_limits
+    _loop, _loop_lock, _async_client = None, threading.Lock(), None
+    _async_host_limits = HostLimits(MAX_CONNECTIONS_PER_HOST, semaphore=asyncio.Semaphore)
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    '''
+    백그라운드 이벤트 루프에서 공유하는 비동기 연결 풀 클라이언트를 반환함 (백그라운드 루프에서만 호출함)
+    '''
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            follow_redirects=True,
+        )
+    return _async_client
+
+
+async def fetch_bytes_async(url: str, max_bytes: int = MAX_BYTES) -> bytes:
+    '''
+    fetch_bytes 의 비동기 버전 (백그라운드 이벤트 루프에서 실행됨)
+    '''
+    start = time.perf_counter()
+    try:
+        with _async_host_limits.hold(urlsplit(url).netloc) as limit:
+            async with limit, get_async_client().stream("GET", url) as response:
+                response.raise_for_status()
+                _check_length(url, response.headers.get("Content-Length"), max_bytes)
+
+                data = bytearray()
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    data += chunk
+                    if len(data) > max_bytes:
+                        raise ImageTooLargeError(f"{url} is larger than {max_bytes} bytes")
+    except Exception:
+        fetch_errors_counter.inc()
+        raise
+
+    fetch_seconds_histogram.observe(time.perf_counter() - start)
+    fetch_bytes_histogram.observe(len(data))
+    return bytes(data)
+
+
+async def _gather(urls: list[str], max_bytes: int) -> list[bytes | Exception]:
+    return await asyncio.gather(*(fetch_bytes_async(url, max_bytes) for url in urls), return_exceptions=True)
+
+
+async def fetch_many_async(urls: list[str], max_bytes: int = MAX_BYTES) -> list[bytes | Exception]:
+    '''
+    여러 url 을 동시에 받아옴. 실패한 url 은 결과 자리에 예외가 들어감
+    요청은 백그라운드 이벤트 루프에서 실행하므로 어느 이벤트 루프에서 호출해도 같은 연결 풀을 사용함
+    '''
+    loop = get_loop()
+    if asyncio.get_running_loop() is loop:
+        return await _gather(urls, max_bytes)
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_gather(urls, max_bytes), loop))
+
+
+def fetch_many(urls: list[str], max_bytes: int = MAX_BYTES) -> list[bytes | Exception]:
+    '''
+    fetch_many_async 의 동기 버전. 이벤트 루프가 실행 중인 스레드에서도 호출할 수 있음
+    '''
+    return asyncio.run_coroutine_threadsafe(_gather(urls, max_bytes), get_loop()).result()
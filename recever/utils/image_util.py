@@ -1,25 +1,119 @@
+import io
+import math
 import os
 
 import PIL
-import requests
 import validators
 from PIL import Image
 
+from recever.core.pipline.rpc import tracing
+from recever.utils.blob_store import blob_store
+from recever.utils.http_fetch import fetch_bytes, fetch_many
 
-def get_image_from_url(url: str) -> Image:
+
+# 각 단계가 사용하는 입력 해상도(긴 변 기준)
+# BLIP 은 384, 얼굴 검출은 300 으로 줄여서 사용하지만, FER 은 원본에서 얼굴을 잘라 48x48 로 만들기 때문에
+# 단체 사진의 작은 얼굴도 48px 이상이 되도록 더 큰 해상도를 남겨둠
+STAGE_IMAGE_SIDES = {
+    "blip": 384,
+    "face_detection": 300,
+    "fer": 960,
+}
+MAX_IMAGE_SIDE = max(STAGE_IMAGE_SIDES.values())
+
+
+def load_image(fp, max_side: int | None = MAX_IMAGE_SIDE) -> Image:
+    '''
+    이미지를 긴 변이 max_side 이하가 되도록 줄여서 RGB 로 불러옴
+    JPEG 은 draft 모드로 1/2, 1/4, 1/8 크기로 바로 디코딩하여 전체 해상도 디코딩을 피함
+    원본 크기는 image.info["original_size"] 에 남겨둠
+    :param fp: 파일 경로 또는 file object
+    :param max_side: 긴 변의 최대 길이 (None 이면 원본 크기)
+    :return: 이미지
+    '''
+    image = Image.open(fp)
+    size = image.size
+
+    if max_side is not None and max(size) > max_side:
+        ratio = max_side / max(size)
+        target = (math.ceil(size[0] * ratio), math.ceil(size[1] * ratio))
+        if image.format == "JPEG":
+            # target 보다 작아지지 않는 가장 작은 배율로 디코딩함
+            image.draft("RGB", target)
+        image = image.convert('RGB')
+        image.thumbnail(target, Image.Resampling.BICUBIC)
+    else:
+        image = image.convert('RGB')
+
+    image.info["original_size"] = size
+    return image
+
+
+def original_size(image: Image) -> tuple[int, int]:
+    '''
+    load_image 로 줄이기 전의 원본 크기를 반환함
+    '''
+    return image.info.get("original_size", image.size)
+
+
+def open_image(data: bytes, name: str = "image", max_side: int | None = MAX_IMAGE_SIDE) -> Image:
+    '''
+    메모리에 있는 이미지 데이터를 RGB 이미지로 변환함
+    :param data: 이미지 데이터
+    :param name: 에러 메시지에 사용할 이름
+    :param max_side: 긴 변의 최대 길이 (None 이면 원본 크기)
+    :return: 이미지
+    '''
+    try:
+        return load_image(io.BytesIO(data), max_side)
+    except PIL.UnidentifiedImageError:
+        raise FileNotFoundError(f"{name} is not an image")
+
+
+@tracing.traced("get_image_from_url")
+def get_image_from_url(url: str | bytes | dict, max_side: int | None = MAX_IMAGE_SIDE) -> Image:
     '''
     url이 주어지면 해당 url의 이미지를 가져오거나, 파일 경로가 주어지면 해당 파일의 이미지를 가져옴
-    :param url: 이미지의 url 또는 파일 경로
+    RPC 로 이미지 데이터(bytes)나 blob 참조({"blob": id})가 주어지면 파일을 거치지 않고 메모리에서 바로 디코딩함
+    :param url: 이미지의 url, 파일 경로, 이미지 데이터 또는 blob 참조
+    :param max_side: 긴 변의 최대 길이 (None 이면 원본 크기)
     :return: 이미지
     '''
+    if isinstance(url, (bytes, bytearray)):
+        return open_image(bytes(url), "image data", max_side)
+    if isinstance(url, dict):
+        return open_image(blob_store.get(url["blob"]), f"blob {url['blob']}", max_side)
+
     try:
         if validators.url(url):
-            return Image.open(requests.get(url, stream=True).raw).convert('RGB')
+            return open_image(fetch_bytes(url), url, max_side)
         else:
             if os.path.isfile(url):
-                return Image.open(url).convert('RGB')
+                return load_image(url, max_side)
             else:
                 raise FileNotFoundError(f"File {url} not found")
 
     except PIL.UnidentifiedImageError:
         raise FileNotFoundError(f"{url} is not an image")
+
+
+def get_images_from_urls(urls: list[str], max_side: int | None = MAX_IMAGE_SIDE) -> list[Image]:
+    '''
+    여러 이미지를 가져옴. 원격 이미지는 동시에 받아옴
+    :param urls: 이미지의 url 또는 파일 경로 리스트
+    :param max_side: 긴 변의 최대 길이 (None 이면 원본 크기)
+    :return: 이미지 리스트
+    '''
+    remote = [url for url in urls if isinstance(url, str) and validators.url(url)]
+    fetched = dict(zip(remote, fetch_many(remote))) if remote else {}
+
+    images = []
+    for url in urls:
+        if not isinstance(url, str) or url not in fetched:
+            images.append(get_image_from_url(url, max_side))
+        elif isinstance(fetched[url], Exception):
+            raise fetched[url]
+        else:
+            images.append(open_image(fetched[url], url, max_side))
+
+    return images
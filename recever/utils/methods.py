@@ -1,12 +1,120 @@
-from recever.utils.ImageCaption.image_caption import get_image_caption
-from recever.utils.gpt import make_response
-from recever.utils.image_util import get_image_from_url
+from starlette.config import Config
 
+from recever.utils import metrics
+from recever.utils.FER.FER_image import fer_json
+from recever.utils.ImageCaption.caption_engine import CaptionEngine
+from recever.utils.ImageCaption.image_caption import embedding_cache, get_image_caption
+from recever.utils.blob_store import blob_store
+from recever.utils.gpt import make_response, make_response_stream
+from recever.utils.image_util import get_image_from_url, get_images_from_urls, original_size
+from recever.utils.model_registry import registry
+from recever.utils.phash_cache import PerceptualCache, perceptual_hash
+from recever.utils.pipeline import StageGraph
 
-def get_image_info(img_path: str):
+config = Config('../.env')
+
+caption_engine = CaptionEngine(
+    max_batch_size=config('CAPTION_MAX_BATCH_SIZE', cast=int, default=8),
+    max_wait_ms=config('CAPTION_MAX_WAIT_MS', cast=float, default=20),
+)
+
+caption_cache = PerceptualCache(
+    "caption",
+    capacity=config('CAPTION_CACHE_SIZE', cast=int, default=4096),
+    threshold=config('PHASH_THRESHOLD', cast=int, default=4),
+    persist_path=config('CAPTION_CACHE_PATH', default=None),
+)
+fer_cache = PerceptualCache(
+    "fer",
+    capacity=config('FER_CACHE_SIZE', cast=int, default=4096),
+    threshold=config('PHASH_THRESHOLD', cast=int, default=4),
+    persist_path=config('FER_CACHE_PATH', default=None),
+)
+
+
+def cached_caption(image, key=None):
+    return caption_cache.get_or_compute(image, lambda: caption_engine.caption(image), key)
+
+
+def cached_fer_json(image, key=None):
+    # 비슷한 이미지라도 크기가 다를 수 있으므로 저장할 때의 원본 크기를 기준으로 얼굴 좌표를 변환함
+    size = original_size(image)
+    (width, height), json = fer_cache.get_or_compute(image, lambda: (size, fer_json(image)), key)
+    if (width, height) == size:
+        return json
+
+    sx, sy = size[0] / width, size[1] / height
+    return [
+        {
+            **face,
+            "box": {
+                "x1": int(face["box"]["x1"] * sx),
+                "y1": int(face["box"]["y1"] * sy),
+                "x2": int(face["box"]["x2"] * sx),
+                "y2": int(face["box"]["y2"] * sy),
+            },
+        }
+        for face in json
+    ]
+
+
+def warm_up_models():
+    # process 워커는 시작할 때 모델을 불러와서 요청마다 모델을 불러오지 않도록 함
+    registry.warm_up()
+
+
+def caption_stage(image, phash):
+    return cached_caption(image, phash)
+
+
+def emotion_stage(image, phash):
+    return cached_fer_json(image, phash)
+
+
+# 이미지 디코딩과 perceptual hash 는 한 번만 하고, 캡션과 FER 은 서로 의존하지 않으므로 동시에 실행함
+image_info_pipeline = (
+    StageGraph(
+        "image_info",
+        executor=config('PIPELINE_EXECUTOR', default="thread"),
+        workers=config('PIPELINE_WORKERS', cast=int, default=4),
+        initializer=warm_up_models if config('PIPELINE_EXECUTOR', default="thread") == "process" else None,
+    )
+    .stage("image", get_image_from_url, deps=("url",))
+    .stage("phash", perceptual_hash, deps=("image",))
+    .stage("caption", caption_stage, deps=("image", "phash"))
+    .stage("emotions", emotion_stage, deps=("image", "phash"))
+)
+
+
+def get_image_info(img_path: str, timings: bool = False):
+    # blob 조각은 이 프로세스의 blob_store 에만 있으므로 process 단계 워커에 넘기기 전에 데이터로 바꿈
+    results, stage_timings = image_info_pipeline.run(url=blob_store.resolve(img_path))
+
+    info = {"caption": results["caption"], "emotions": results["emotions"]}
+    if timings:
+        info["timings"] = stage_timings
+    return info
+
+
+def get_image_info_many(img_paths: list[str]):
+    # 원격 이미지는 동시에 받아오고, 캡션은 엔진에 한꺼번에 넣어 같은 배치로 처리되도록 함
+    images = get_images_from_urls(img_paths)
+    futures = [caption_engine.submit(image) for image in images]
+
+    return [{"caption": future.result()} for future in futures]
+
+
+def get_image_caption_with_prompt(img_path: str, prompt: str | None = None, num_beams: int | None = None, max_length: int | None = None):
+    # 같은 이미지의 vision encoder 출력은 embedding 캐시에서 재사용하고 decoder 만 다시 실행함
+    image = get_image_from_url(img_path)
+
+    return {"caption": get_image_caption(image, prompt=prompt, num_beams=num_beams, max_length=max_length)}
+
+
+def get_image_emotion(img_path: str):
     image = get_image_from_url(img_path)
 
-    return {"caption": get_image_caption(image)}
+    return cached_fer_json(image)
 
 
 def get_gpt_response(user_text: str, caption: str):
@@ -16,3 +124,42 @@ def get_gpt_response(user_text: str, caption: str):
 def get_gpt_response_from_image(img_path: str, user_text: str):
     data = get_gpt_response(user_text, get_image_info(img_path)).replace('`', '')
     return data
+
+
+def get_gpt_response_stream(user_text: str, caption: str):
+    yield from make_response_stream(caption, user_text)
+
+
+def get_gpt_response_from_image_stream(img_path: str, user_text: str):
+    for text in get_gpt_response_stream(user_text, get_image_info(img_path)):
+        yield text.replace('`', '')
+
+
+def put_blob_chunk(blob_id: str, seq: int, total: int, data: bytes):
+    # 큰 이미지는 조각으로 나뉘어 먼저 도착하고, 요청은 {"blob": blob_id} 로 이미지를 가리킴
+    blob_store.put_chunk(blob_id, seq, total, data)
+
+
+# blob_store 는 프로세스마다 따로 있으므로, RPC 를 프로세스 워커로 처리할 때도 serve 하는 프로세스에서 실행할 메소드
+LOCAL_METHODS = ("put_blob_chunk",)
+
+
+def resolve_params(params):
+    '''
+    RPC 요청을 프로세스 워커로 넘기기 전에 serve 하는 프로세스에서 실행되어, 인자의 blob 참조를 모인 데이터로 바꿈
+    '''
+    if isinstance(params, dict):
+        return {name: blob_store.resolve(value) for name, value in params.items()}
+    return [blob_store.resolve(value) for value in params]
+
+
+def get_metrics():
+    return metrics.snapshot()
+
+
+def get_cache_stats():
+    return {
+        "caption": caption_cache.stats(),
+        "fer": fer_cache.stats(),
+        "caption_embedding": embedding_cache.stats(),
+    }
@@ -0,0 +1,166 @@
+import bisect
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    '''
+    누적 버킷 방식의 히스토그램 (Prometheus histogram 과 같은 형태)
+    '''
+
+    def __init__(self, name: str, description: str = "", buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+
+        cumulative = 0
+        buckets = {}
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+
+        return {"buckets": buckets, "sum": total, "count": count}
+
+
+class Counter:
+    '''
+    증가만 하는 카운터
+    '''
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> dict:
+        return {"value": self._value}
+
+
+_metrics: dict[str, Histogram | Counter] = {}
+_metrics_lock = threading.Lock()
+
+
+def histogram(name: str, description: str = "", buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    '''
+    이름에 해당하는 히스토그램을 반환함. 없으면 새로 만들어 등록함
+    '''
+    with _metrics_lock:
+        if name not in _metrics:
+            _metrics[name] = Histogram(name, description, buckets)
+        return _metrics[name]
+
+
+def counter(name: str, description: str = "") -> Counter:
+    '''
+    이름에 해당하는 카운터를 반환함. 없으면 새로 만들어 등록함
+    '''
+    with _metrics_lock:
+        if name not in _metrics:
+            _metrics[name] = Counter(name, description)
+        return _metrics[name]
+
+
+def snapshot() -> dict[str, dict]:
+    '''
+    등록된 모든 메트릭의 현재 값을 반환함
+    '''
+    with _metrics_lock:
+        metrics = list(_metrics.values())
+    return {metric.name: metric.snapshot() for metric in metrics}
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+def render_prometheus() -> str:
+    '''
+    등록된 모든 메트릭을 Prometheus text exposition 형식으로 반환함
+    '''
+    with _metrics_lock:
+        metrics = list(_metrics.values())
+
+    lines = []
+    for metric in metrics:
+        name = _metric_name(metric.name)
+        if metric.description:
+            lines.append(f"# HELP {name} {metric.description}")
+
+        if isinstance(metric, Histogram):
+            values = metric.snapshot()
+            lines.append(f"# TYPE {name} histogram")
+            for bound, count in values["buckets"].items():
+                lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+            lines.append(f"{name}_sum {values['sum']}")
+            lines.append(f"{name}_count {values['count']}")
+        else:
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {metric.value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def observe_span(record: dict) -> None:
+    '''
+    끝난 trace span 의 실행 시간을 span 이름별 히스토그램에 기록함 (tracing.add_listener 에 등록해서 사용)
+    '''
+    name = record["name"].split(" ")[0]
+    histogram(f"span_{_metric_name(name)}_seconds", f"{name} span 실행 시간").observe(record["duration"])
+    queued = record["attrs"].get("queued")
+    if queued is not None:
+        histogram(f"span_{_metric_name(name)}_queued_seconds", f"{name} span 이 시작되기 전 대기 시간").observe(queued)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    '''
+    /metrics 를 제공하는 HTTP 서버를 daemon 스레드에서 실행함 (웹 서버가 없는 receiver 용)
+    '''
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
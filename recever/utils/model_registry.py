@@ -0,0 +1,119 @@
+import threading
+import time
+from typing import Any, Callable
+
+
+class ModelRegistry:
+    '''
+    프로세스 당 한 번만 모델을 불러와서 재사용하기 위한 저장소
+    모델은 처음 요청될 때 불러오며(lazy), torch 모델은 eval 모드로 유지함
+    '''
+
+    def __init__(self):
+        self._loaders: dict[str, Callable[[], Any]] = {}
+        self._models: dict[str, Any] = {}
+        self._load_times: dict[str, float] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        '''
+        모델 로더를 등록함
+        :param name: 모델 이름
+        :param loader: 모델을 불러오는 함수
+        '''
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str) -> Any:
+        '''
+        모델을 반환함. 아직 불러오지 않았다면 이때 불러옴
+        :param name: 모델 이름
+        :return: 모델
+        '''
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        if name not in self._loaders:
+            raise KeyError(f"Model {name} is not registered")
+
+        # 같은 모델을 여러 스레드가 동시에 불러오지 않도록 모델별로 잠금
+        with self._locks[name]:
+            model = self._models.get(name)
+            if model is None:
+                start = time.perf_counter()
+                model = _set_eval(self._loaders[name]())
+                self._load_times[name] = time.perf_counter() - start
+                self._models[name] = model
+
+        return model
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def names(self) -> list[str]:
+        return list(self._loaders)
+
+    def warm_up(self, names: list[str] | None = None) -> dict[str, float]:
+        '''
+        모델을 미리 불러옴
+        :param names: 불러올 모델 이름 리스트 (None 이면 등록된 모든 모델)
+        :return: 모델별 로딩 시간(초)
+        '''
+        for name in names if names is not None else self.names():
+            self.get(name)
+
+        return dict(self._load_times)
+
+    def unload(self, name: str | None = None) -> None:
+        '''
+        불러온 모델을 메모리에서 해제함
+        :param name: 해제할 모델 이름 (None 이면 전부)
+        '''
+        with self._lock:
+            targets = [name] if name is not None else list(self._models)
+            for target in targets:
+                self._models.pop(target, None)
+                self._load_times.pop(target, None)
+
+    def memory_usage(self) -> dict[str, int]:
+        '''
+        불러온 모델별 파라미터와 버퍼의 메모리 사용량(byte)을 반환함
+        '''
+        return {name: _model_bytes(model) for name, model in self._models.items()}
+
+
+def _iter_modules(model: Any):
+    if isinstance(model, (tuple, list)):
+        for item in model:
+            yield from _iter_modules(item)
+    elif hasattr(model, "parameters") and hasattr(model, "buffers"):
+        yield model
+
+
+def _set_eval(model: Any) -> Any:
+    for module in _iter_modules(model):
+        module.eval()
+    return model
+
+
+def _model_bytes(model: Any) -> int:
+    total = 0
+    for module in _iter_modules(model):
+        total += sum(p.numel() * p.element_size() for p in module.parameters())
+        total += sum(b.numel() * b.element_size() for b in module.buffers())
+
+    # opencv dnn 모델은 가중치 크기를 직접 알려줌
+    if hasattr(model, "getMemoryConsumption"):
+        try:
+            weights, _ = model.getMemoryConsumption((1, 3, 300, 300))
+            total += int(weights)
+        except Exception:
+            pass
+
+    return total
+
+
+registry = ModelRegistry()
@@ -0,0 +1,312 @@
+'''
+OpenAI chat completions API 와 같은 형식으로 응답하는 로컬 stub 서버
+OPENAI_BASE_URL=http://localhost:8002/v1 로 receiver 의 GPT 호출을 이 서버로 보내면 네트워크 없이
+정해진 지연시간(첫 토큰까지)과 토큰 생성 속도로 응답하므로 부하 테스트와 CI 를 같은 조건으로 반복할 수 있음
+
+응답 내용
+- 기본: make_prompt 의 양식에 맞는 고정된 JSON 응답
+- --replay 파일: 기록해둔 응답을 돌려줌. 같은 요청(model, messages)의 기록이 있으면 그 응답을,
+  없으면 기록들을 순서대로 돌려줌 (--strict 이면 404 오류)
+- --record 파일: --upstream 의 실제 API 로 요청을 넘기고 받은 응답을 replay 형식(JSON lines)으로 기록함
+
+실행: python -m recever.utils.openai_stub [--port 8002] [--profile gpt-3.5-turbo] [--latency-ms 500 --tokens-per-second 60]
+                                          [--replay responses.jsonl [--strict]] [--record responses.jsonl --upstream https://api.openai.com/v1]
+'''
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 이름: (첫 토큰까지의 지연시간(초), 초당 토큰 수)
+PROFILES = {
+    "instant": (0.0, float("inf")),
+    "fast": (0.1, 200.0),
+    "gpt-3.5-turbo": (0.5, 60.0),
+    "gpt-4": (1.0, 20.0),
+    "slow": (3.0, 10.0),
+}
+
+DEFAULT_RESPONSE = json.dumps({
+    "고객의 특성": "밝고 탁 트인 풍경을 좋아하는 고객",
+    "추천 어코드": "시트러스, 마린",
+    "선호도": {
+        note: {"Level": level, "Reason": f"{note} 향에 대한 stub 응답"}
+        for note, level in zip(
+            ("시트러스", "스파이시", "그린", "허브", "발사믹", "파우더리", "애니멀", "우디", "프루티", "알데하이드", "플로럴", "마린"),
+            (2, 0, 1, 1, 0, 1, 0, 1, 2, 0, 1, 2),
+        )
+    },
+}, ensure_ascii=False, indent=3)
+
+_TOKEN = re.compile(r"\s*\S+|\s+")
+
+
+def tokenize(text: str) -> list[str]:
+    '''
+    응답을 스트리밍할 조각으로 나눔 (앞의 공백을 포함한 단어 단위, 이어 붙이면 원문과 같음)
+    '''
+    return _TOKEN.findall(text)
+
+
+def request_key(model: str, messages: list[dict]) -> str:
+    payload = json.dumps({"model": model, "messages": messages}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseBook:
+    '''
+    replay 할 응답 기록 (JSON lines: {"key", "model", "messages", "response"})
+    '''
+
+    def __init__(self, path: str | None = None, strict: bool = False):
+        self.path = path
+        self.strict = strict
+        self.lock = threading.Lock()
+        self.responses = {}
+        self.order = []
+
+        if path and os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.responses[record["key"]] = record["response"]
+                        self.order.append(record["response"])
+        self._cycle = itertools.cycle(self.order) if self.order else None
+
+    def find(self, model: str, messages: list[dict]) -> str | None:
+        response = self.responses.get(request_key(model, messages))
+        if response is not None or self.strict:
+            return response
+        if self._cycle is None:
+            return DEFAULT_RESPONSE
+        with self.lock:
+            return next(self._cycle)
+
+    def record(self, model: str, messages: list[dict], response: str) -> None:
+        record = {"key": request_key(model, messages), "model": model, "messages": messages, "response": response}
+        with self.lock:
+            self.responses[record["key"]] = response
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class OpenAIStub:
+    '''
+    stub 서버 설정. latency / tokens_per_second 는 profile 의 값을 덮어씀
+    jitter 는 지연시간에 곱하는 무작위 비율의 범위 (예: 0.1 이면 ±10%), seed 로 반복 실행 결과를 고정함
+    '''
+
+    def __init__(
+            self,
+            profile: str = "gpt-3.5-turbo",
+            latency: float | None = None,
+            tokens_per_second: float | None = None,
+            jitter: float = 0.0,
+            seed: int = 0,
+            book: ResponseBook | None = None,
+            upstream: str | None = None):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile: {profile} (available: {', '.join(PROFILES)})")
+
+        default_latency, default_rate = PROFILES[profile]
+        self.latency = default_latency if latency is None else latency
+        self.tokens_per_second = default_rate if tokens_per_second is None else tokens_per_second
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.book = book or ResponseBook()
+        self.upstream = None
+
+        if upstream:
+            from openai import OpenAI
+
+            self.upstream = OpenAI(base_url=upstream, api_key=os.environ.get("OPENAI_API_KEY"))
+
+    def __scale__(self) -> float:
+        if not self.jitter:
+            return 1.0
+        with self.random_lock:
+            return 1.0 + self.random.uniform(-self.jitter, self.jitter)
+
+    def first_token_delay(self) -> float:
+        return self.latency * self.__scale__()
+
+    def token_delay(self) -> float:
+        return 1 / self.tokens_per_second * self.__scale__()
+
+    def respond(self, model: str, messages: list[dict]) -> tuple[str | None, bool]:
+        '''
+        :return: (응답 내용, 응답을 만드는 데 실제 API 를 사용했는지 여부)
+        '''
+        if self.upstream is None:
+            return self.book.find(model, messages), False
+
+        completion = self.upstream.chat.completions.create(model=model, messages=messages)
+        response = completion.choices[0].message.content or ""
+        self.book.record(model, messages, response)
+        return response, True
+
+    def serve(self, host: str = "127.0.0.1", port: int = 8002) -> ThreadingHTTPServer:
+        '''
+        daemon 스레드에서 서버를 실행함 (port 가 0 이면 빈 port 를 사용하며 server.server_port 로 확인함)
+        '''
+        server = _StubServer((host, port), _StubHandler)
+        server.stub = self
+        threading.Thread(target=server.serve_forever, name="openai-stub", daemon=True).start()
+        return server
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            models = [{"id": name, "object": "model", "created": 0, "owned_by": "stub"} for name in PROFILES]
+            self.__send_json__(200, {"object": "list", "data": models})
+        else:
+            self.__send_error__(404, f"Unknown path: {self.path}")
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.__send_error__(404, f"Unknown path: {self.path}")
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        model, messages = body.get("model", "gpt-3.5-turbo"), body.get("messages", [])
+
+        stub = self.server.stub
+        try:
+            text, upstream = stub.respond(model, messages)
+        except Exception as e:
+            self.__send_error__(502, f"upstream error: {e}")
+            return
+        if text is None:
+            self.__send_error__(404, "No recorded response for this request")
+            return
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        tokens = tokenize(text)
+        # 실제 API 로 받은 응답은 이미 그만큼 기다렸으므로 바로 돌려줌
+        first_delay = 0.0 if upstream else stub.first_token_delay()
+
+        if body.get("stream"):
+            self.__stream__(completion_id, model, tokens, first_delay, 0.0 if upstream else None)
+            return
+
+        time.sleep(first_delay + (0.0 if upstream else sum(stub.token_delay() for _ in tokens)))
+        prompt_tokens = sum(len(tokenize(message.get("content") or "")) for message in messages)
+        self.__send_json__(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": text},
+                "logprobs": None,
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_tokens + len(tokens),
+            },
+        })
+
+    def __stream__(self, completion_id, model, tokens, first_delay, token_delay):
+        stub = self.server.stub
+
+        def chunk(delta, finish_reason=None):
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}],
+            }
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        # HTTP/1.0 응답이므로 연결을 닫는 것으로 스트림의 끝을 알림
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        try:
+            time.sleep(first_delay)
+            self.wfile.write(chunk({"role": "assistant", "content": ""}))
+            for token in tokens:
+                time.sleep(stub.token_delay() if token_delay is None else token_delay)
+                self.wfile.write(chunk({"content": token}))
+                self.wfile.flush()
+            self.wfile.write(chunk({}, "stop"))
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # 클라이언트가 스트림을 중간에 끊음
+            pass
+
+    def __send_json__(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def __send_error__(self, status, message):
+        self.__send_json__(status, {"error": {"message": message, "type": "stub_error", "param": None, "code": None}})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8002)
+    ap.add_argument("--profile", default="gpt-3.5-turbo", choices=tuple(PROFILES))
+    ap.add_argument("--latency-ms", type=float, help="첫 토큰까지의 지연시간 (profile 값을 덮어씀)")
+    ap.add_argument("--tokens-per-second", type=float, help="토큰 생성 속도 (profile 값을 덮어씀)")
+    ap.add_argument("--jitter", type=float, default=0.0, help="지연시간의 무작위 변동 비율 (예: 0.1)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--replay", help="돌려줄 응답 기록 파일 (JSON lines)")
+    ap.add_argument("--strict", action="store_true", help="기록에 없는 요청은 404 로 응답함")
+    ap.add_argument("--record", help="upstream 의 응답을 기록할 파일")
+    ap.add_argument("--upstream", help="기록할 때 요청을 넘길 실제 API 주소 (예: https://api.openai.com/v1)")
+    args = ap.parse_args()
+
+    if bool(args.record) != bool(args.upstream):
+        ap.error("--record 와 --upstream 은 함께 사용해야 함")
+
+    stub = OpenAIStub(
+        args.profile,
+        latency=None if args.latency_ms is None else args.latency_ms / 1000,
+        tokens_per_second=args.tokens_per_second,
+        jitter=args.jitter,
+        seed=args.seed,
+        book=ResponseBook(args.record or args.replay, args.strict),
+        upstream=args.upstream,
+    )
+    server = stub.serve(args.host, args.port)
+    print(f"OpenAI stub listening on http://{args.host}:{server.server_port}/v1 "
+          f"(latency {stub.latency * 1000:.0f}ms, {stub.tokens_per_second} tokens/s)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import traceback
+from collections import OrderedDict
+from typing import Any, Callable
+
+import numpy as np
+from PIL import Image
+
+from recever.utils import metrics
+
+HASH_SIZE = 8
+_DCT_SIZE = HASH_SIZE * 4
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def perceptual_hash(image: Image) -> int:
+    '''
+    이미지의 64bit perceptual hash(pHash)를 계산함
+    재압축, 크기 변경, EXIF 제거 등에는 거의 같은 값이 나옴
+    :param image: 이미지
+    :return: 64bit 정수 해시
+    '''
+    gray = image.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.Resampling.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.float64)
+
+    # 저주파 성분 8x8 (DC 포함) 을 중앙값과 비교함
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    bits = low > np.median(low[1:])
+
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class PerceptualCache:
+    '''
+    perceptual hash 를 키로 하는 LRU 캐시
+    해시의 해밍 거리가 threshold 이하이면 같은 이미지로 보고 저장된 결과를 반환함
+    '''
+
+    def __init__(
+            self,
+            name: str,
+            capacity: int = 1024,
+            threshold: int = 4,
+            persist_path: str | None = None,
+            persist_every: int = 32):
+        self.name = name
+        self.capacity = capacity
+        self.threshold = threshold
+        self.persist_path = persist_path
+        self.persist_every = persist_every
+
+        self.hits = metrics.counter(f"{name}_cache_hits", f"{name} 캐시 적중 수")
+        self.misses = metrics.counter(f"{name}_cache_misses", f"{name} 캐시 미스 수")
+
+        self._entries: OrderedDict[int, Any] = OrderedDict()
+        self._lock = threading.Lock()
+        # 여러 스레드가 동시에 저장하지 않도록 파일 쓰기는 따로 잠금
+        self._save_lock = threading.Lock()
+        self._unsaved = 0
+        # snapshot 번호와 마지막으로 파일에 쓴 snapshot 번호
+        self._version = 0
+        self._saved_version = 0
+
+        if persist_path:
+            self.load()
+            atexit.register(self.save)
+
+    def get(self, key: int) -> tuple[bool, Any]:
+        '''
+        해시와 가까운 항목을 찾음
+        :param key: perceptual hash
+        :return: (찾았는지 여부, 값)
+        '''
+        with self._lock:
+            match = key if key in self._entries else None
+            if match is None and self.threshold > 0:
+                best = self.threshold + 1
+                for candidate in self._entries:
+                    distance = hamming_distance(key, candidate)
+                    if distance < best:
+                        match, best = candidate, distance
+
+            if match is None:
+                self.misses.inc()
+                return False, None
+
+            self._entries.move_to_end(match)
+            self.hits.inc()
+            return True, self._entries[match]
+
+    def set(self, key: int, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            snapshot = None
+            if self.persist_path and self._unsaved >= self.persist_every:
+                # 저장할 스레드를 여기서 하나만 정함
+                snapshot = self.__snapshot__()
+
+        if snapshot is not None:
+            try:
+                self.__write__(snapshot)
+            except OSError:
+                # 저장에 실패해도 계산한 결과는 반환함 (다음 저장에서 다시 시도함)
+                traceback.print_exc()
+
+    def get_or_compute(self, image: Image, compute: Callable[[], Any], key: int | None = None) -> Any:
+        '''
+        캐시에 비슷한 이미지의 결과가 있으면 반환하고, 없으면 계산하여 저장함
+        :param image: 이미지
+        :param compute: 결과를 계산하는 함수
+        :param key: 미리 계산한 perceptual hash (없으면 image 로 계산)
+        :return: 결과
+        '''
+        if key is None:
+            key = perceptual_hash(image)
+
+        found, value = self.get(key)
+        if found:
+            return value
+
+        value = compute()
+        self.set(key, value)
+        return value
+
+    def stats(self) -> dict:
+        total = self.hits.value + self.misses.value
+        return {
+            "size": len(self._entries),
+            "hits": self.hits.value,
+            "misses": self.misses.value,
+            "hit_rate": self.hits.value / total if total else 0.0,
+        }
+
+    def save(self) -> None:
+        '''
+        캐시를 persist_path 에 JSON 으로 저장함
+        '''
+        if not self.persist_path:
+            return
+
+        with self._lock:
+            snapshot = self.__snapshot__()
+        self.__write__(snapshot)
+
+    def __snapshot__(self) -> tuple[int, dict]:
+        # self._lock 을 잡은 상태에서 호출함
+        self._unsaved = 0
+        self._version += 1
+        return self._version, {format(key, "016x"): value for key, value in self._entries.items()}
+
+    def __write__(self, snapshot: tuple[int, dict]) -> None:
+        version, data = snapshot
+        directory = os.path.dirname(os.path.abspath(self.persist_path))
+        with self._save_lock:
+            # 더 새로운 snapshot 이 먼저 저장되었으면 덮어쓰지 않음
+            if version <= self._saved_version:
+                return
+
+            # 임시 파일 이름을 저장마다 다르게 해서 다른 프로세스의 저장과도 섞이지 않게 함
+            with tempfile.NamedTemporaryFile(
+                    "w", encoding="utf-8", dir=directory, prefix=f"{os.path.basename(self.persist_path)}.",
+                    suffix=".tmp", delete=False) as f:
+                temp_path = f.name
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, default=lambda o: o.item())
+                os.replace(temp_path, self.persist_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+            self._saved_version = version
+
+    def load(self) -> None:
+        if not self.persist_path or not os.path.isfile(self.persist_path):
+            return
+
+        with open(self.persist_path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        with self._lock:
+            for key, value in data.items():
+                self._entries[int(key, 16)] = value
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
@@ -0,0 +1,124 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+from recever.core.pipline.rpc import tracing
+from recever.utils import metrics
+
+
+def _timed(name: str, function: Callable, kwargs: dict, carrier: dict | None) -> tuple[Any, float]:
+    # 프로세스 워커에서도 실행되므로 module 수준 함수로 두고, trace 는 context 대신 carrier 로 넘겨받음
+    with tracing.child_of(carrier, f"stage {name}"):
+        start = time.perf_counter()
+        result = function(**kwargs)
+        return result, time.perf_counter() - start
+
+
+class StageGraph:
+    '''
+    의존 관계가 있는 단계(stage)들을 실행하는 작은 DAG 실행기
+    의존하는 단계가 모두 끝난 단계는 바로 워커에 넣으므로, 서로 의존하지 않는 단계(예: 캡션과 FER)는 동시에 실행됨
+    워커 풀은 한 번 만들어서 계속 사용하므로 요청마다 프로세스/스레드를 만드는 비용이 없음
+    '''
+
+    def __init__(
+            self,
+            name: str,
+            executor: str = "thread",
+            workers: int = 2,
+            initializer: Callable | None = None,
+            initargs: tuple = ()):
+        '''
+        :param name: 메트릭 이름에 사용할 이름
+        :param executor: "thread" 또는 "process" (process 는 단계 함수와 입력/결과를 pickle 할 수 있어야 함)
+        :param workers: 워커 수
+        :param initializer: 워커를 만들 때 한 번 실행할 함수 (process 워커에서 모델을 미리 불러올 때 사용)
+        '''
+        self.name = name
+        self.executor = executor
+        self.workers = workers
+        self.initializer = initializer
+        self.initargs = initargs
+
+        self._stages: dict[str, tuple[Callable, tuple[str, ...]]] = {}
+        self._histograms = {}
+        self._pool = None
+
+    def stage(self, name: str, function: Callable, deps: tuple[str, ...] = ()) -> "StageGraph":
+        '''
+        단계를 추가함. 단계 함수는 의존하는 단계(또는 입력)의 결과를 같은 이름의 키워드 인자로 받음
+        :param name: 단계 이름
+        :param function: 단계 함수
+        :param deps: 의존하는 단계 또는 입력 이름
+        '''
+        self._stages[name] = (function, tuple(deps))
+        self._histograms[name] = metrics.histogram(
+            f"{self.name}_{name}_seconds", f"{self.name} 의 {name} 단계 실행 시간",
+        )
+        return self
+
+    def __get_pool__(self):
+        if self._pool is None:
+            if self.executor == "process":
+                self._pool = ProcessPoolExecutor(self.workers, initializer=self.initializer, initargs=self.initargs)
+            elif self.executor == "thread":
+                self._pool = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix=self.name, initializer=self.initializer, initargs=self.initargs
+                )
+            else:
+                raise ValueError(f"Unknown executor: {self.executor}")
+        return self._pool
+
+    def start(self) -> None:
+        '''
+        워커 풀을 미리 만듦 (process 워커는 첫 작업을 넣을 때 만들어지므로 빈 작업으로 깨움)
+        '''
+        pool = self.__get_pool__()
+        wait([pool.submit(time.sleep, 0) for _ in range(self.workers)])
+
+    def run(self, **inputs) -> tuple[dict, dict]:
+        '''
+        모든 단계를 실행함
+        :param inputs: 단계들이 사용하는 입력
+        :return: (단계 이름별 결과, 단계 이름별 {"start", "seconds"} 와 "total", "sequential" 을 담은 시간(초))
+        '''
+        pool = self.__get_pool__()
+        results = dict(inputs)
+        timings = {}
+        remaining = {name: stage for name, stage in self._stages.items() if name not in results}
+        running = {}
+        carrier = tracing.inject()
+        start = time.perf_counter()
+
+        try:
+            while remaining or running:
+                for name, (function, deps) in list(remaining.items()):
+                    if all(dep in results for dep in deps):
+                        kwargs = {dep: results[dep] for dep in deps}
+                        future = pool.submit(_timed, name, function, kwargs, carrier)
+                        running[future] = (name, time.perf_counter() - start)
+                        del remaining[name]
+
+                if not running:
+                    missing = {name: deps for name, (_, deps) in remaining.items()}
+                    raise ValueError(f"unresolved stage dependencies: {missing}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, started = running.pop(future)
+                    results[name], seconds = future.result()
+                    timings[name] = {"start": started, "seconds": seconds}
+                    self._histograms[name].observe(seconds)
+        except Exception:
+            for future in running:
+                future.cancel()
+            raise
+
+        timings["total"] = time.perf_counter() - start
+        timings["sequential"] = sum(timing["seconds"] for name, timing in timings.items() if name != "total")
+        return results, timings
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
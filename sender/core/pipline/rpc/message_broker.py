@@ -1,9 +1,18 @@
 import asyncio
+import collections
+import importlib
+import inspect
+import threading
 import time
 import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-import msgpack
-from kafka import KafkaProducer, KafkaConsumer, TopicPartition
+from kafka.consumer.subscription_state import ConsumerRebalanceListener
+from kafka.structs import OffsetAndMetadata, TopicPartition
+
+from . import tracing
+from .transport import make_transport
 
 ERROR_CODE_MESSAGES = {
     -32700: "Parse error",
@@ -14,172 +23,856 @@ ERROR_CODE_MESSAGES = {
 }
 
 
+def get_error(error_code):
+    error_message = "Server error"
+    if error_code in ERROR_CODE_MESSAGES:
+        error_message = ERROR_CODE_MESSAGES[error_code]
+    return {
+        "code": error_code,
+        "message": error_message,
+    }
+
+
+def call_method(methods, request, protocol_version="2.0", emit=None):
+    '''
+    JSON RPC 요청에 해당하는 메소드를 실행하고 응답 body 를 반환함
+    워커 스레드/프로세스에서 실행될 수 있도록 producer 등 broker 상태를 사용하지 않음
+
+    메소드가 generator 를 반환하면 스트리밍 메소드로 보고, 각 조각을 순서 번호(seq)와 함께
+    {"stream": {"seq", "data"}} 메시지로 emit 에 전달한 뒤 최종 result 로 조각 수를 반환함
+    emit 이 없으면 (프로세스 워커) 조각을 body["_chunks"] 에 모아서 반환함
+
+    요청에 trace 정보가 있으면 sender 의 span 에 이어지는 span 안에서 실행하므로,
+    메소드 안에서 만든 span 도 같은 trace 로 기록됨
+    '''
+    method_name = request.get("method")
+    with tracing.extract(request.get("trace"), f"rpc.server {method_name}", method=method_name) as span:
+        body = _call_method(methods, request, protocol_version, emit)
+        if "error" in body:
+            span.set(error=body["error"]["message"])
+        return body
+
+
+def _call_method(methods, request, protocol_version, emit):
+    body = {
+        "jsonrpc": protocol_version,
+        "id": request.get("id"),
+    }
+    method = lambda x: x
+
+    try:
+        # FIXME: 임시로 주석처리함
+        # if request["method"].startswith("_"):
+        #     # Private prefix method
+        #     raise AttributeError  # Method not found
+
+        method = getattr(methods, request["method"])
+    except AttributeError:
+        traceback.print_exc()
+        body["error"] = get_error(-32601)  # Method not found
+        return body
+
+    try:
+        params = request["params"]
+        if type(params) is list:
+            result = method(*params)
+        else:
+            result = method(**params)
+
+        if inspect.isgenerator(result):
+            if emit is None:
+                body["_chunks"] = []
+                emit = body["_chunks"].append
+
+            seq = 0
+            for chunk in result:
+                emit({
+                    "jsonrpc": protocol_version,
+                    "id": request.get("id"),
+                    "stream": {"seq": seq, "data": chunk},
+                })
+                seq += 1
+            result = seq
+
+        body["result"] = result
+    except TypeError:
+        traceback.print_exc()
+        body["error"] = get_error(-32602)  # Invalid params
+    except Exception:
+        traceback.print_exc()
+        body["error"] = get_error(-32603)  # Internal error
+
+    return body
+
+
+def call_method_by_module_name(module_name, request, protocol_version="2.0"):
+    # 모듈 객체는 pickle 할 수 없으므로 프로세스 워커에서는 이름으로 다시 import 함
+    # emit 콜백도 넘길 수 없으므로 스트림 조각은 body["_chunks"] 에 모아서 반환함
+    return call_method(importlib.import_module(module_name), request, protocol_version)
+
+
+def resolve_request(methods, request):
+    '''
+    프로세스 워커로 넘기기 전에 serve 하는 프로세스에서 methods.resolve_params 로 인자를 바꾼 요청을 반환함
+    (워커 프로세스에는 없는 serve 프로세스의 상태를 참조하는 인자를 값으로 바꿀 때 사용함)
+    '''
+    resolve_params = getattr(methods, "resolve_params", None)
+    if resolve_params is None or "params" not in request:
+        return request
+    return {**request, "params": resolve_params(request["params"])}
+
+
+class CommitOnRevoke(ConsumerRebalanceListener):
+    '''
+    consumer group 의 rebalance 로 partition 을 잃기 전에, 그 partition 의 처리 완료된 offset 을 commit 함
+    (poll 안에서 호출되므로 poll 하는 스레드에서 실행됨)
+    '''
+
+    def __init__(self, broker, name):
+        self.broker = broker
+        self.name = name
+
+    def on_partitions_revoked(self, revoked):
+        offsets = self.broker.__take_commits__(self.name) or {}
+        revoked = set(revoked)
+        commit = {partition: offset for partition, offset in offsets.items() if partition in revoked}
+        if commit:
+            self.broker.consumers[self.name].commit(offsets=commit)
+
+        # 남은 partition 의 offset 은 다음 poll 에서 commit 함
+        remaining = {partition: offset for partition, offset in offsets.items() if partition not in revoked}
+        if remaining:
+            self.broker.__commit_async__(self.name, remaining)
+
+    def on_partitions_assigned(self, assigned):
+        print(f"{self.name} assigned partitions: {sorted(partition.partition for partition in assigned)}")
+
+
+class ResultDispatcher:
+    '''
+    method_results 토픽을 백그라운드 consumer 하나로 한 번만 읽고,
+    request id 를 키로 기다리고 있는 asyncio future 에 응답을 전달함
+    poll 이 max_errors 번 연속으로 실패하면 멈추고, 기다리던 요청들을 모두 그 예외로 실패시킴
+    '''
+
+    def __init__(self, transport, topic_name="method_results", partition=0, poll_timeout_ms=100, max_errors=10):
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.poll_timeout_ms = poll_timeout_ms
+        self.max_errors = max_errors
+        self.stopped = threading.Event()
+        # poll 을 멈추게 한 예외 (None 이면 동작 중)
+        self.error = None
+
+        self.consumer = transport.reply_consumer(topic_name, partition)
+
+        self.thread = threading.Thread(target=self.__run__, name="result-dispatcher", daemon=True)
+        self.thread.start()
+
+    def register(self, request_id, timeout):
+        '''
+        응답을 기다릴 future 를 등록함. 요청을 보내기 전에 호출해야 함
+        '''
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.lock:
+            self.__check__()
+            self.pending[request_id] = (loop, future, time.monotonic() + timeout, timeout)
+        return future
+
+    def register_stream(self, request_id, timeout):
+        '''
+        스트리밍 응답을 받을 queue 를 등록함. 조각 메시지와 최종 응답이 순서대로 들어감
+        timeout 은 마지막 메시지를 받은 뒤부터 다시 계산함
+        '''
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        with self.lock:
+            self.__check__()
+            self.pending[request_id] = (loop, queue, time.monotonic() + timeout, timeout)
+        return queue
+
+    def __check__(self):
+        if self.error is not None:
+            raise Exception(f"result dispatcher stopped: {self.error!r}") from self.error
+
+    def discard(self, request_id):
+        with self.lock:
+            self.pending.pop(request_id, None)
+
+    def __resolve__(self, request_id, value):
+        with self.lock:
+            entry = self.pending.get(request_id)
+            if entry is None:
+                # 이미 타임아웃 되었거나 다른 sender 프로세스의 요청
+                return
+
+            loop, target, _, timeout = entry
+            if isinstance(target, asyncio.Queue) and "stream" in value:
+                self.pending[request_id] = (loop, target, time.monotonic() + timeout, timeout)
+            else:
+                del self.pending[request_id]
+
+        if isinstance(target, asyncio.Queue):
+            callback = lambda: target.put_nowait(value)
+        else:
+            callback = lambda: target.done() or target.set_result(value)
+
+        try:
+            loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            # 요청한 이벤트 루프가 이미 닫힘
+            pass
+
+    def __sweep__(self):
+        # 타임아웃이 지났거나 취소된 요청, 닫힌 이벤트 루프의 요청을 정리함
+        now = time.monotonic()
+        with self.lock:
+            orphans = [
+                request_id
+                for request_id, (loop, target, deadline, _) in self.pending.items()
+                if deadline < now
+                or loop.is_closed()
+                or (isinstance(target, asyncio.Future) and target.done())
+            ]
+            for request_id in orphans:
+                del self.pending[request_id]
+
+    def __fail_all__(self, error):
+        # 기다리던 요청들이 rpc_timeout 까지 기다리지 않고 바로 실패하도록 예외를 전달함
+        with self.lock:
+            self.error = error
+            pending, self.pending = self.pending, {}
+
+        for loop, target, _, _ in pending.values():
+            if isinstance(target, asyncio.Queue):
+                callback = lambda target=target: target.put_nowait(error)
+            else:
+                callback = lambda target=target: target.done() or target.set_exception(error)
+            try:
+                loop.call_soon_threadsafe(callback)
+            except RuntimeError:
+                pass
+
+    def __run__(self):
+        errors = 0
+        while not self.stopped.is_set():
+            try:
+                records = self.consumer.poll(timeout_ms=self.poll_timeout_ms)
+                errors = 0
+            except Exception as e:
+                errors += 1
+                print(f"result dispatcher poll failed ({errors}/{self.max_errors}): {e!r}")
+                if errors >= self.max_errors:
+                    traceback.print_exc()
+                    self.__fail_all__(e)
+                    break
+                # 일시적인 오류 (broker 재시작 등) 는 잠시 기다렸다가 다시 poll 함
+                self.stopped.wait(min(0.1 * 2 ** (errors - 1), 5))
+                continue
+
+            for messages in records.values():
+                for message in messages:
+                    try:
+                        if message.key is None:
+                            continue
+                        if not isinstance(message.value, dict):
+                            raise ValueError(f"malformed reply for {message.key!r}: {message.value!r}")
+                        self.__resolve__(message.key.decode(), message.value)
+                    except Exception:
+                        # 형식이 잘못된 응답은 건너뜀
+                        traceback.print_exc()
+            self.__sweep__()
+
+        self.consumer.close()
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+
 class MessageBroker:
-    def __init__(self, *bootstrap_servers):
+    def __init__(
+        self,
+        *bootstrap_servers,
+        rpc_timeout=300,
+        linger_ms=5,
+        batch_size=16384,
+        compression_type=None,
+        acks=1,
+        reply_topic="method_results",
+        reply_partition=0,
+        transport="kafka",
+        socket_dir="/tmp/rpc",
+    ):
+        '''
+        :param rpc_timeout: 응답을 기다리는 최대 시간(초)
+        :param linger_ms: producer 가 batch 를 채우기 위해 기다리는 최대 시간(ms)
+        :param batch_size: partition 당 producer batch 크기(byte)
+        :param compression_type: producer 압축 방식 (None, "gzip", "snappy", "lz4", "zstd")
+        :param acks: 전송 완료로 볼 broker 응답 수 (0, 1, "all")
+        :param reply_topic: 응답을 받을 토픽
+        :param reply_partition: 응답을 받을 partition. sender 인스턴스마다 다른 값을 주면 각자 자기 응답만 읽음
+        :param transport: 메시지 전달 방식 ("kafka", "inprocess", "unix") 또는 transport 객체
+        :param socket_dir: unix transport 의 socket 폴더
+        '''
         if len(bootstrap_servers) == 0:
             bootstrap_servers = ["localhost:9092"]
 
         self.protocol_version = "2.0"
         self.bootstrap_servers = bootstrap_servers
         self.request_ids = {}
+        self.rpc_timeout = rpc_timeout
+        self.reply_topic = reply_topic
+        self.reply_partition = reply_partition
+        self.result_dispatcher = None
+        self.result_dispatcher_lock = threading.Lock()
+        # stop() 이 호출되면 serve 는 처리 중인 요청을 마치고 반환함
+        self.stopped = threading.Event()
 
-        self.producer = KafkaProducer(
-            compression_type=None,
-            bootstrap_servers=self.bootstrap_servers,
-            value_serializer=lambda x: msgpack.packb(x, use_bin_type=True),
+        if isinstance(transport, str):
+            transport = make_transport(transport, self.bootstrap_servers, socket_dir)
+        self.transport = transport
+
+        # kafka 가 아닌 transport 는 producer 설정을 사용하지 않음
+        self.producer = self.transport.producer(
+            compression_type=compression_type,
+            linger_ms=linger_ms,
+            batch_size=batch_size,
+            acks=acks,
         )
 
         self.consumers = {}
+        self.pending_commits = {}
+        self.commit_lock = threading.Lock()
+
+    def start_result_dispatcher(self):
+        '''
+        응답 consumer 를 미리 시작함 (첫 요청에서 consumer 연결을 기다리지 않도록)
+        '''
+        self.__get_result_dispatcher__()
+
+    def __get_result_dispatcher__(self):
+        with self.result_dispatcher_lock:
+            if self.result_dispatcher is None or self.result_dispatcher.error is not None:
+                # 오류로 멈춘 dispatcher 는 새로 만듦
+                self.result_dispatcher = ResultDispatcher(
+                    self.transport, self.reply_topic, self.reply_partition
+                )
+            return self.result_dispatcher
+
+    def ensure_topic(self, topic_name, num_partitions=1):
+        return self.transport.ensure_topic(topic_name, num_partitions)
+
+    def __make_request_body__(self, name, args, kwargs):
+        assert (
+            len(args) * len(kwargs) == 0
+        ), "JSON RPC 2.0 specification: You must use either args or kwargs"
+
+        return {
+            "jsonrpc": self.protocol_version,
+            "method": name,
+            "params": kwargs if len(kwargs) != 0 else args,
+            # receiver 는 이 sender 인스턴스의 partition 으로 응답을 보냄
+            "reply_to": {"topic": self.reply_topic, "partition": self.reply_partition},
+        }
+
+    def __delivery__(self, record_future):
+        '''
+        producer.send 가 반환한 future 를 전송이 확인되면 완료되는 asyncio future 로 바꿈
+        send 는 batch 에 넣기만 하고 바로 반환하므로, flush 없이 linger_ms 안에 모인 메시지와 함께 전송됨
+        '''
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(setter, value):
+            try:
+                loop.call_soon_threadsafe(lambda: future.done() or setter(value))
+            except RuntimeError:
+                # 기다리던 이벤트 루프가 이미 닫힘
+                pass
+
+        record_future.add_callback(lambda metadata: resolve(future.set_result, metadata))
+        record_future.add_errback(lambda exception: resolve(future.set_exception, exception))
+        return future
+
+    async def __produce_request__(self, topic_name, body, partition_key=None):
+        # 같은 key 의 요청은 같은 partition(같은 receiver)으로 가서 순서대로 처리됨
+        key = partition_key.encode() if isinstance(partition_key, str) else partition_key
+        await self.__delivery__(self.producer.send(f"{topic_name}_method_requests", key=key, value=body))
 
     async def __send_method_request__(
         self,
         topic_name,
         name,
         id,
+        partition_key,
         *args,
         **kwargs,
     ):
-        assert (
-            len(args) * len(kwargs) == 0
-        ), "JSON RPC 2.0 specification: You must use either args or kwargs"
+        with tracing.span(f"rpc.client {name}", topic=topic_name) as span:
+            body = self.__make_request_body__(name, args, kwargs)
+            body["trace"] = span.carrier()
 
-        body = {
-            "jsonrpc": self.protocol_version,
-            "method": name,
-            "params": kwargs if len(kwargs) != 0 else args,
-        }
+            if id:
+                body["id"] = uuid.uuid4().hex
+                dispatcher = self.__get_result_dispatcher__()
+                future = dispatcher.register(body["id"], self.rpc_timeout)
 
-        if id:
-            body["id"] = str(int(time.time() * 10_000_000))
+            try:
+                with tracing.span("rpc.produce"):
+                    await self.__produce_request__(topic_name, body, partition_key)
 
-        check = self.producer.send(f"{topic_name}_method_requests", value=body)
-        self.producer.flush()
-        check.get()
+                if not id:
+                    return
 
-        if id:
-            message = await self.__recv_message__(
-                "method_results",
-                key=body["id"].encode(),
-            )
-            response = message.value
+                with tracing.span("rpc.wait_reply"):
+                    response = await asyncio.wait_for(future, self.rpc_timeout)
+                if "error" in response:
+                    span.set(error=response["error"].get("message"))
+            finally:
+                if id:
+                    dispatcher.discard(body["id"])
 
-            if "result" in response:
-                return response["result"]
-            elif "error" in response:
-                raise Exception(f"get error on json rpc: {response['error']}")
-            else:
-                raise Exception(f"response message format error: {message}")
+        if "result" in response:
+            return response["result"]
+        elif "error" in response:
+            raise Exception(f"get error on json rpc: {response['error']}")
+        else:
+            raise Exception(f"response message format error: {response}")
+
+    async def __send_stream_request__(self, topic_name, name, partition_key, *args, **kwargs):
+        # async generator 는 값을 내보낼 때마다 다른 context 에서 재개될 수 있으므로 현재 span 으로 두지 않음
+        span = tracing.span(f"rpc.client {name}", topic=topic_name, stream=True)
+        body = self.__make_request_body__(name, args, kwargs)
+        body["id"] = uuid.uuid4().hex
+        body["trace"] = span.carrier()
+
+        dispatcher = self.__get_result_dispatcher__()
+        queue = dispatcher.register_stream(body["id"], self.rpc_timeout)
+
+        seq = 0
+        error = None
+        try:
+            await self.__produce_request__(topic_name, body, partition_key)
+            span.set(produced=time.time() - span.start)
+
+            while True:
+                response = await asyncio.wait_for(queue.get(), self.rpc_timeout)
+
+                if isinstance(response, Exception):
+                    # result dispatcher 가 멈춤
+                    raise response
+                if "stream" in response:
+                    if response["stream"]["seq"] != seq:
+                        raise Exception(f"stream chunk out of order: {response['stream']['seq']} != {seq}")
+                    seq += 1
+                    yield response["stream"]["data"]
+                elif "error" in response:
+                    raise Exception(f"get error on json rpc: {response['error']}")
+                elif "result" in response:
+                    if response["result"] != seq:
+                        raise Exception(f"stream ended with {seq} of {response['result']} chunks")
+                    return
+                else:
+                    raise Exception(f"response message format error: {response}")
+        except BaseException as exception:
+            error = exception
+            raise
+        finally:
+            dispatcher.discard(body["id"])
+            span.set(chunks=seq)
+            span.end(error)
 
     def __get_error__(self, error_code):
-        error_message = "Server error"
-        if error_code in ERROR_CODE_MESSAGES:
-            error_message = ERROR_CODE_MESSAGES[error_code]
-        return {
-            "code": error_code,
-            "message": error_message,
-        }
+        return get_error(error_code)
+
+    def __send_result__(self, request, body):
+        # 워커 스레드에서도 호출되므로 producer future 를 그대로 반환함
+        if request.get("id"):
+            # reply_to 가 없는 요청은 이전과 같이 method_results 의 0번 partition 으로 보냄
+            reply_to = request.get("reply_to") or {"topic": "method_results", "partition": 0}
+            return self.producer.send(
+                reply_to["topic"], key=request["id"].encode(), value=body, partition=reply_to["partition"]
+            )
+
+    async def __deliver_result__(self, request, body):
+        record_future = self.__send_result__(request, body)
+        if record_future is not None:
+            with tracing.child_of(request.get("trace"), "rpc.reply"):
+                await self.__delivery__(record_future)
 
     async def __recv_method_request__(self, methods, message):
+        '''
+        요청을 처리하고 응답을 보냄
+        :return: 응답 전송이 확인되면 완료되는 future (응답이 없는 요청은 None)
+        '''
         request = message.value
-        body = {
-            "jsonrpc": self.protocol_version,
-            "id": request["id"],
-        }
-        method = lambda x: x
-
+        emit = lambda chunk: self.__send_result__(request, chunk)
         try:
-            # FIXME: 임시로 주석처리함
-            # if request["method"].startswith("_"):
-            #     # Private prefix method
-            #     raise AttributeError  # Method not found
+            record_future = self.__send_result__(request, call_method(methods, request, self.protocol_version, emit))
+        except Exception as e:
+            # 응답을 보내지 못한 요청은 실패한 delivery 로 돌려줘서 offset 을 commit 하지 않게 함
+            failed = asyncio.get_running_loop().create_future()
+            failed.set_exception(e)
+            return failed
+        return self.__delivery__(record_future) if record_future is not None else None
 
-            method = getattr(methods, request["method"])
-        except AttributeError:
-            traceback.print_exc()
-            body["error"] = self.__get_error__(-32601)  # Method not found
+    async def __dispatch_method_request__(self, pool, methods, message, after=None):
+        request = message.value
+        loop = asyncio.get_running_loop()
 
-        try:
-            params = request["params"]
-            if type(params) is list:
-                body["result"] = method(*params)
+        if after is not None:
+            # 같은 partition 의 앞선 요청이 끝난 뒤에 실행함
+            await asyncio.wait([after])
+
+        if isinstance(pool, ProcessPoolExecutor) and request.get("method") in getattr(methods, "LOCAL_METHODS", ()):
+            # 프로세스의 상태를 바꾸는 메소드 (예: 조각 저장) 는 serve 하는 프로세스에서 바로 실행함
+            # 이벤트 루프에서 실행하므로 LOCAL_METHODS 는 오래 걸리지 않아야 함
+            body = call_method(methods, request, self.protocol_version)
+        elif isinstance(pool, ProcessPoolExecutor):
+            try:
+                worker_request = await asyncio.to_thread(resolve_request, methods, request)
+            except Exception:
+                traceback.print_exc()
+                body = {"jsonrpc": self.protocol_version, "id": request.get("id"), "error": get_error(-32603)}
             else:
-                body["result"] = method(**params)
-        except TypeError:
-            traceback.print_exc()
-            body["error"] = self.__get_error__(-32602)  # Invalid params
-        except Exception:
-            traceback.print_exc()
-            body["error"] = self.__get_error__(-32603)  # Internal error
-        finally:
-            if request["id"]:
-                self.producer.send(
-                    "method_results", key=request["id"].encode(), value=body
+                body = await loop.run_in_executor(
+                    pool, call_method_by_module_name, methods.__name__, worker_request, self.protocol_version
                 )
+        else:
+            emit = lambda chunk: self.__send_result__(request, chunk)
+            body = await loop.run_in_executor(
+                pool, call_method, methods, request, self.protocol_version, emit
+            )
 
-    async def __recv_message__(
-        self, topic_name, group_id="default", key=None, partition=0
-    ):
+        # 프로세스 워커는 스트리밍 조각을 모아서 돌려주므로 최종 응답 전에 순서대로 보냄
+        for chunk in body.pop("_chunks", []):
+            self.__send_result__(request, chunk)
+        # 응답 전송이 확인되어야 batch 의 offset 을 commit 할 수 있음
+        await self.__deliver_result__(request, body)
+
+    def __get_consumer__(self, topic_name, group_id="default", partition=None):
         name = f"{topic_name}.{group_id}"
 
         if name not in self.consumers:
-            self.consumers[name] = KafkaConsumer(
-                bootstrap_servers=self.bootstrap_servers,
-                auto_offset_reset="earliest",
-                enable_auto_commit=False,
-                group_id=group_id,
-                value_deserializer=lambda x: msgpack.unpackb(x, raw=False),
-                consumer_timeout_ms=100,
+            self.consumers[name] = self.transport.request_consumer(
+                topic_name, group_id, partition, listener=CommitOnRevoke(self, name)
             )
 
-            if partition is not None:
-                self.consumers[name].assign(
-                    [
-                        TopicPartition(topic_name, partition),
-                    ]
-                )
-            else:
-                self.consumers[name].subscribe(topic_name)
+        return name, self.consumers[name]
 
-        while True:
-            for message in self.consumers[name]:
-                if message.key != key:
-                    continue
+    def __commit_async__(self, name, offsets):
+        '''
+        처리가 끝난 offset 을 commit 대기 목록에 넣음
+        consumer 는 thread-safe 하지 않으므로 실제 commit 은 다음 poll 직전에 poll 하는 스레드에서 함
+        '''
+        with self.commit_lock:
+            self.pending_commits.setdefault(name, {}).update(offsets)
+
+    def __take_commits__(self, name):
+        with self.commit_lock:
+            return self.pending_commits.pop(name, None)
+
+    def __on_commit__(self, offsets, response):
+        if isinstance(response, Exception):
+            # 다음 batch 의 commit 이 더 큰 offset 을 다시 commit 함 (at-least-once)
+            print(f"offset commit failed: {response}")
 
-                self.consumers[name].commit()
-                return message
+    def __record_failures__(self, failed, messages, results):
+        '''
+        처리나 응답 전송에 실패한 요청의 offset 을 partition 별로 failed 에 기록함
+        실패한 요청이 다시 전달되어 성공하면 기록을 지움
+        :param failed: partition 별 실패한 첫 요청의 offset (serve 하는 동안 유지함)
+        :param messages: 처리한 요청
+        :param results: 요청별 결과 (실패하면 예외)
+        '''
+        for message, result in zip(messages, results):
+            partition = TopicPartition(message.topic, message.partition)
+            if isinstance(result, Exception):
+                if partition not in failed or message.offset < failed[partition]:
+                    failed[partition] = message.offset
+                    print(
+                        f"request {message.topic}[{message.partition}]@{message.offset} failed: "
+                        f"offsets from here are not committed until it is redelivered"
+                    )
+            elif failed.get(partition) == message.offset:
+                del failed[partition]
+
+    def __limit_offsets__(self, failed, offsets):
+        # 실패한 요청이 있는 partition 은 그 요청까지만 commit 해서 재시작이나 rebalance 뒤에 다시 전달되게 함 (at-least-once)
+        return {
+            partition: OffsetAndMetadata(min(offset.offset, failed[partition]), None) if partition in failed else offset
+            for partition, offset in offsets.items()
+        }
+
+    def __assigned_offsets__(self, consumer, offsets):
+        # rebalance 로 다른 receiver 에게 넘어간 partition 의 offset 은 commit 하지 않음
+        assignment = consumer.assignment()
+        return {partition: offset for partition, offset in (offsets or {}).items() if partition in assignment}
+
+    def __commit_pending__(self, name):
+        # 종료할 때 아직 commit 하지 않은 offset 을 동기로 commit 함
+        if not name:
+            return
+        offsets = self.__assigned_offsets__(self.consumers[name], self.__take_commits__(name))
+        if offsets:
+            self.consumers[name].commit(offsets=offsets)
+
+    async def __recv_messages__(
+        self,
+        topic_name,
+        group_id="default",
+        key=None,
+        partition=None,
+        max_records=32,
+        timeout_ms=100,
+    ):
+        '''
+        메시지를 최대 max_records 개씩 묶어서 가져옴
+        :param key: None 이 아니면 key 가 일치하는 메시지만 반환함
+        :param partition: None 이면 consumer group 으로 구독하고, 숫자이면 해당 partition 만 읽음
+        :return: (consumer 이름, key 가 일치하는 메시지 리스트, batch 처리 후 commit 할 partition 별 offset)
+        '''
+        name, consumer = self.__get_consumer__(topic_name, group_id, partition)
+
+        def poll():
+            offsets = self.__assigned_offsets__(consumer, self.__take_commits__(name))
+            if offsets:
+                consumer.commit_async(offsets=offsets, callback=self.__on_commit__)
+            return consumer.poll(timeout_ms=timeout_ms, max_records=max_records)
 
-    async def serve_async(self, methods, topic_name, group_id="default"):
         while True:
-            message = await self.__recv_message__(
-                f"{topic_name}_method_requests",
-                group_id,
-            )
-            await self.__recv_method_request__(methods, message)
+            # poll 은 blocking 이므로 이벤트 루프(워커 결과 전송 등)를 막지 않도록 스레드에서 기다림
+            records = await asyncio.to_thread(poll)
+            if not records:
+                if self.stopped.is_set():
+                    # stop() 이 호출되었으면 빈 batch 를 반환해서 serve 가 멈출 수 있게 함
+                    return name, [], {}
+                continue
 
-    def serve(self, methods, topic_name, group_id="default"):
+            offsets = {
+                partition: OffsetAndMetadata(messages[-1].offset + 1, None)
+                for partition, messages in records.items()
+            }
+            messages = [
+                message
+                for partition_messages in records.values()
+                for message in partition_messages
+                if key is None or message.key == key
+            ]
+            return name, messages, offsets
+
+    async def serve_async(
+        self,
+        methods,
+        topic_name,
+        group_id="default",
+        batch_size=32,
+        poll_timeout_ms=100,
+        partition=None,
+    ):
+        name = None
+        # partition 별 실패한 첫 요청의 offset
+        failed = {}
         try:
-            future = self.serve_async(methods, topic_name, group_id)
+            while not self.stopped.is_set():
+                name, messages, offsets = await self.__recv_messages__(
+                    f"{topic_name}_method_requests",
+                    group_id,
+                    partition=partition,
+                    max_records=batch_size,
+                    timeout_ms=poll_timeout_ms,
+                )
+                deliveries = []
+                for message in messages:
+                    delivery = await self.__recv_method_request__(methods, message)
+                    deliveries.append(delivery if delivery is not None else asyncio.sleep(0))
+
+                # 응답이 실제로 전송된 뒤에 offset 을 commit 해야 at-least-once 가 보장됨
+                results = await asyncio.gather(*deliveries, return_exceptions=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        traceback.print_exception(result)
+                self.__record_failures__(failed, messages, results)
+                self.__commit_async__(name, self.__limit_offsets__(failed, offsets))
+        finally:
+            self.__commit_pending__(name)
+
+    async def serve_pool_async(
+        self,
+        methods,
+        topic_name,
+        group_id="default",
+        workers=4,
+        executor="thread",
+        max_in_flight=None,
+        batch_size=32,
+        poll_timeout_ms=100,
+        partition=None,
+        ordered=False,
+    ):
+        '''
+        메소드 호출을 스레드/프로세스 풀에서 실행하는 RPC 서버
+        처리 중인 요청이 max_in_flight 개에 도달하면 하나가 끝날 때까지 다음 메시지를 가져오지 않음
+        offset 은 batch 의 모든 요청이 처리되고 응답이 전송된 뒤, 먼저 가져온 batch 부터 순서대로 commit 함
+        처리나 응답 전송에 실패한 요청이 있으면 그 partition 은 실패한 요청의 offset 까지만 commit 함
+        ordered 이면 같은 partition 의 요청은 순서대로 하나씩, 다른 partition 의 요청은 동시에 처리함
+        '''
+        if executor == "process":
+            pool = ProcessPoolExecutor(max_workers=workers)
+        elif executor == "thread":
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rpc-worker")
+        else:
+            raise ValueError(f"Unknown executor: {executor}")
+
+        in_flight = asyncio.Semaphore(max_in_flight or workers * 2)
+        tasks = set()
+        finishers = set()
+        # partition 별 마지막 요청 task (ordered 일 때)
+        tails = {}
+        # [offsets, 완료 여부] 를 가져온 순서대로 가짐
+        batches = collections.deque()
+        # partition 별 실패한 첫 요청의 offset
+        failed = {}
+        name = None
+
+        def on_done(task):
+            tasks.discard(task)
+            in_flight.release()
+            for partition in [partition for partition, tail in tails.items() if tail is task]:
+                del tails[partition]
+            if not task.cancelled() and task.exception() is not None:
+                traceback.print_exception(task.exception())
+
+        async def finish_batch(entry, batch_messages, batch_tasks):
+            # 각 task 는 응답 전송이 확인된 뒤에 끝남
+            results = await asyncio.gather(*batch_tasks, return_exceptions=True)
+            self.__record_failures__(failed, batch_messages, results)
+            entry[1] = True
+
+            offsets = {}
+            while batches and batches[0][1]:
+                offsets.update(batches.popleft()[0])
+            if offsets:
+                self.__commit_async__(name, self.__limit_offsets__(failed, offsets))
+
+        try:
+            while not self.stopped.is_set():
+                name, messages, offsets = await self.__recv_messages__(
+                    f"{topic_name}_method_requests",
+                    group_id,
+                    partition=partition,
+                    max_records=batch_size,
+                    timeout_ms=poll_timeout_ms,
+                )
+
+                batch_tasks = []
+                for message in messages:
+                    await in_flight.acquire()
+                    partition_key = (message.topic, message.partition)
+                    task = asyncio.create_task(
+                        self.__dispatch_method_request__(
+                            pool, methods, message, tails.get(partition_key) if ordered else None
+                        )
+                    )
+                    if ordered:
+                        tails[partition_key] = task
+                    tasks.add(task)
+                    task.add_done_callback(on_done)
+                    batch_tasks.append(task)
+
+                entry = [offsets, False]
+                batches.append(entry)
+                finisher = asyncio.create_task(finish_batch(entry, messages, batch_tasks))
+                finishers.add(finisher)
+                finisher.add_done_callback(finishers.discard)
+        finally:
+            if tasks or finishers:
+                await asyncio.gather(*tasks, *finishers, return_exceptions=True)
+            pool.shutdown(wait=True)
+            self.__commit_pending__(name)
+
+    def serve(
+        self,
+        methods,
+        topic_name,
+        group_id="default",
+        workers=0,
+        executor="thread",
+        max_in_flight=None,
+        batch_size=32,
+        poll_timeout_ms=100,
+        partition=None,
+        ordered=False,
+    ):
+        '''
+        RPC 서버를 실행함
+        :param workers: 0 이면 요청을 하나씩 순서대로 처리하고, 1 이상이면 해당 크기의 워커 풀에서 동시에 처리함
+        :param executor: 워커 풀 종류 ("thread" 또는 "process")
+                         process 이면 methods.LOCAL_METHODS 의 메소드는 serve 하는 프로세스에서 실행하고,
+                         다른 요청의 인자는 methods.resolve_params 가 있으면 serve 하는 프로세스에서 바꿔서 워커에 넘김
+        :param max_in_flight: 동시에 처리할 최대 요청 수 (기본값: workers * 2)
+        :param batch_size: 한 번의 poll 로 가져올 최대 메시지 수
+        :param poll_timeout_ms: 메시지가 없을 때 poll 이 기다리는 시간(ms)
+        :param partition: None 이면 group_id 의 consumer group 으로 구독하여 같은 group 의 receiver 들이 partition 을 나눠 읽음
+        :param ordered: 워커 풀에서 같은 partition 의 요청을 순서대로 처리할지 여부
+        '''
+        try:
+            if workers > 0:
+                future = self.serve_pool_async(
+                    methods, topic_name, group_id, workers, executor, max_in_flight,
+                    batch_size, poll_timeout_ms, partition, ordered,
+                )
+            else:
+                future = self.serve_async(methods, topic_name, group_id, batch_size, poll_timeout_ms, partition)
             asyncio.run(future)
         except KeyboardInterrupt:
             print("KeyboardInterrupt")
 
-    async def rpc_async(self, topic_name, name, *args, **kwargs):
+    def stop(self):
+        '''
+        serve 를 멈춤 (다음 poll 전에 멈추므로 최대 poll_timeout_ms 뒤에 반환됨)
+        '''
+        self.stopped.set()
+
+    def close(self):
+        if self.result_dispatcher is not None:
+            self.result_dispatcher.close()
+        for consumer in self.consumers.values():
+            consumer.close()
+        self.producer.flush()
+        self.producer.close()
+
+    async def rpc_async(self, topic_name, name, *args, partition_key=None, **kwargs):
+        '''
+        메소드를 호출하고 결과를 기다림
+        :param partition_key: 요청 partition 을 정하는 key (같은 key 는 같은 receiver 로 감, 없으면 임의의 partition)
+        '''
         return await self.__send_method_request__(
             topic_name,
             name,
             True,
+            partition_key,
             *args,
             **kwargs,
         )
 
+    def rpc_stream_async(self, topic_name, name, *args, partition_key=None, **kwargs):
+        '''
+        스트리밍 메소드를 호출하고, 응답 조각을 순서대로 내보내는 async generator 를 반환함
+        '''
+        return self.__send_stream_request__(topic_name, name, partition_key, *args, **kwargs)
+
     async def rpc_print_async(self, topic_name, name, *args, **kwargs):
         print(await self.rpc_async(topic_name, name, *args, **kwargs))
 
-    async def rpc_oneway_async(self, topic_name, name, *args, **kwargs):
+    async def rpc_oneway_async(self, topic_name, name, *args, partition_key=None, **kwargs):
         return await self.__send_method_request__(
             topic_name,
             name,
             False,
+            partition_key,
             *args,
             **kwargs,
         )
@@ -0,0 +1,174 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+
+_current = contextvars.ContextVar("rpc_span", default=None)
+_exporter = None
+_listeners = []
+_service = os.path.basename(os.getcwd())
+
+
+class JsonLinesExporter:
+    '''
+    끝난 span 을 한 줄에 하나씩 JSON 으로 파일에 추가함
+    여러 프로세스가 같은 파일에 써도 줄이 섞이지 않도록 한 줄을 한 번의 write 로 씀
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def export(self, record: dict) -> None:
+        line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        with self.lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+
+def configure(path: str | None = None, service: str | None = None) -> None:
+    '''
+    span 을 내보낼 JSON lines 파일과 서비스 이름을 정함 (path 가 없으면 파일로 내보내지 않음)
+    '''
+    global _exporter, _service
+    _exporter = JsonLinesExporter(path) if path else None
+    if service:
+        _service = service
+
+
+def add_listener(listener) -> None:
+    '''
+    span 이 끝날 때마다 호출할 함수를 등록함 (예: 단계별 latency 메트릭)
+    :param listener: span 기록(dict)을 받는 함수
+    '''
+    _listeners.append(listener)
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str | None = None, parent_id: str | None = None, **attrs):
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.time()
+        self._start = time.perf_counter()
+        self._token = None
+        self._ended = False
+
+    def set(self, **attrs) -> "Span":
+        self.attrs.update(attrs)
+        return self
+
+    def carrier(self) -> dict:
+        '''
+        JSON-RPC body 에 넣어 다른 서비스로 전달할 trace 정보
+        '''
+        return {"trace_id": self.trace_id, "parent_id": self.span_id, "sent_at": time.time()}
+
+    def end(self, error: BaseException | None = None) -> None:
+        if self._ended:
+            return
+        self._ended = True
+
+        record = {
+            "service": _service,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": time.perf_counter() - self._start,
+            "attrs": self.attrs,
+        }
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+
+        if _exporter is not None:
+            _exporter.export(record)
+        for listener in _listeners:
+            listener(record)
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.end(exc)
+        return False
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def span(name: str, **attrs) -> Span:
+    '''
+    현재 span 의 자식 span 을 만듦 (현재 span 이 없으면 새 trace 를 시작함)
+    with 문으로 사용하면 그 안에서 만든 span 의 부모가 됨
+    '''
+    parent = _current.get()
+    if parent is None:
+        return Span(name, **attrs)
+    return Span(name, parent.trace_id, parent.span_id, **attrs)
+
+
+def child_of(carrier: dict | None, name: str, **attrs) -> Span:
+    '''
+    다른 서비스에서 받은 trace 정보(carrier)의 span 을 부모로 하는 span 을 만듦
+    '''
+    if not carrier:
+        return span(name, **attrs)
+    return Span(name, carrier.get("trace_id"), carrier.get("parent_id"), **attrs)
+
+
+def extract(carrier: dict | None, name: str, **attrs) -> Span:
+    '''
+    child_of 와 같지만, carrier 에 보낸 시각이 있으면 받기까지 기다린 시간을 queued 속성으로 기록함
+    (Kafka 전송, partition 에서의 대기, 워커 풀에서의 대기를 합친 시간)
+    '''
+    if carrier and "sent_at" in carrier:
+        attrs["queued"] = max(0.0, time.time() - carrier["sent_at"])
+    return child_of(carrier, name, **attrs)
+
+
+def inject() -> dict | None:
+    current = _current.get()
+    return current.carrier() if current is not None else None
+
+
+def traced(name: str | None = None):
+    '''
+    함수 실행을 span 으로 기록하는 decorator
+    generator 함수는 모든 값을 내보낼 때까지를 하나의 span 으로 기록함
+    '''
+
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                with span(span_name):
+                    yield from function(*args, **kwargs)
+
+            return generator_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,22 +1,33 @@
-import os
 import re
 import json
 import hashlib
 
-from pathlib import Path
-from fastapi import APIRouter, UploadFile, Response, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request, UploadFile, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from starlette.config import Config
 
 from sender.core.pipline.rpc.message_broker import MessageBroker
-
-host = "localhost"
-port = 9092
-
-broker = MessageBroker(f"{host}:{port}")
+from sender.utils.image_payload import ImagePayload
+from sender.utils.upload_store import ResultCache, UploadStore
 
 config = Config('../.env')
 
+upload_store = UploadStore(
+    root=config('UPLOAD_DIR', default="./file"),
+    max_bytes=config('UPLOAD_MAX_BYTES', cast=int, default=1024 * 1024 * 1024),
+    ttl=config('UPLOAD_TTL_SECONDS', cast=float, default=24 * 60 * 60),
+)
+image_payload = ImagePayload(
+    upload_store,
+    mode=config('RPC_IMAGE_TRANSPORT', default="path"),
+    inline_max_bytes=config('RPC_INLINE_IMAGE_MAX_BYTES', cast=int, default=512 * 1024),
+    chunk_bytes=config('RPC_BLOB_CHUNK_BYTES', cast=int, default=512 * 1024),
+)
+result_cache = ResultCache(
+    max_entries=config('RESULT_CACHE_SIZE', cast=int, default=1024),
+    ttl=config('RESULT_CACHE_TTL_SECONDS', cast=float, default=60 * 60),
+)
+
 router = APIRouter(
     prefix="/tasks",
     tags=["tasks"],
@@ -24,13 +35,20 @@ router = APIRouter(
 )
 
 
-def get_path(file_name: str):
-    Path("./file").mkdir(parents=True, exist_ok=True)
-    h = hashlib.new('sha256')
-    h.update(file_name.encode("utf-8"))
+def get_broker(request: Request) -> MessageBroker:
+    return request.app.state.broker
+
 
-    return os.path.abspath(f"./file/{h.hexdigest()}")
-    # return os.path.abspath(f'./file/{file_name}')
+async def to_sse(chunks):
+    '''
+    RPC 스트리밍 응답을 Server-Sent Events 형식으로 변환함
+    '''
+    try:
+        async for text in chunks:
+            yield f"data: {json.dumps(text, ensure_ascii=False)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps(str(e), ensure_ascii=False)}\n\n"
 
 
 def extract_json(text):
@@ -41,7 +59,7 @@ def extract_json(text):
 
 
 @router.post("/", status_code=201)
-def run_all_task(file: UploadFile, story: str) -> JSONResponse:
+async def run_all_task(file: UploadFile, story: str, broker: MessageBroker = Depends(get_broker)) -> JSONResponse:
     '''
     Run a new task.
     :param file: UploadFile
@@ -71,21 +89,25 @@ def run_all_task(file: UploadFile, story: str) -> JSONResponse:
             async def upload_file(data: str):
                 # Base64 디코딩 및 파일 처리 로직
     '''
-    img_path = get_path(file.filename)
-
-    with open(img_path, "wb") as buffer:
-        buffer.write(file.file.read())
-    
-    try:
-        data = broker.rpc(config('TOPIC_NAME'), "get_gpt_response_from_image", img_path, story)
-    except:
-        raise HTTPException(status_code=400, detail="잘못된 파일")
+    digest, source = await image_payload.prepare(file)
+
+    cache_key = ("run_all_task", digest, hashlib.sha256(story.encode("utf-8")).hexdigest())
+    data = result_cache.get(cache_key)
+    if data is None:
+        try:
+            img_path = await image_payload.argument(digest, source, broker, config('TOPIC_NAME'))
+            data = await broker.rpc_async(
+                config('TOPIC_NAME'), "get_gpt_response_from_image", img_path, story, partition_key=digest
+            )
+        except:
+            raise HTTPException(status_code=400, detail="잘못된 파일")
+        result_cache.set(cache_key, data)
 
     return extract_json(data)
 
 
 @router.post("/img", status_code=201)
-def get_image_info(file: UploadFile):
+async def get_image_info(file: UploadFile, broker: MessageBroker = Depends(get_broker)):
     '''
     Get image info.
     :param file: UploadFile
@@ -95,18 +117,23 @@ def get_image_info(file: UploadFile):
         이미지를 제공하면 사진 내 사람에 대한 감정 분석 및 사진의 캡션을 생성합니다.
     '''
 
-    img_path = get_path(file.filename)
+    # 같은 이미지는 digest 를 key 로 같은 receiver 에 보내서 receiver 의 이미지 캐시를 재사용함
+    digest, source = await image_payload.prepare(file)
 
-    with open(img_path, "wb") as buffer:
-        buffer.write(file.file.read())
+    cache_key = ("get_image_info", digest)
+    info = result_cache.get(cache_key)
+    if info is None:
+        try:
+            img_path = await image_payload.argument(digest, source, broker, config('TOPIC_NAME'))
+            info = await broker.rpc_async(config('TOPIC_NAME'), "get_image_info", img_path, partition_key=digest)
+        except:
+            raise HTTPException(status_code=400, detail="잘못된 파일")
+        result_cache.set(cache_key, info)
 
-    try:
-        return broker.rpc(config('TOPIC_NAME'), "get_image_info", img_path)
-    except:
-        raise HTTPException(status_code=400, detail="잘못된 파일")
+    return info
 
 @router.post("/gpt", status_code=201)
-def get_gpt_response(story: str, img_caption: str) -> JSONResponse:
+async def get_gpt_response(story: str, img_caption: str, broker: MessageBroker = Depends(get_broker)) -> JSONResponse:
     '''
     Get GPT response.
     :param story:
@@ -117,6 +144,44 @@ def get_gpt_response(story: str, img_caption: str) -> JSONResponse:
     description:
         이미지 캡션, 감정 및 사용자 텍스트를 사용하여 GPT-API를 사용하여 응답을 생성합니다.
     '''
-    data = broker.rpc(config('TOPIC_NAME'), "get_gpt_response", story, img_caption)
+    data = await broker.rpc_async(config('TOPIC_NAME'), "get_gpt_response", story, img_caption)
     
     return extract_json(data)
+
+
+@router.post("/stream", status_code=201)
+async def run_all_task_stream(file: UploadFile, story: str, broker: MessageBroker = Depends(get_broker)) -> StreamingResponse:
+    '''
+    Run a new task and stream the GPT response.
+    :param file: UploadFile
+    :param story: str
+    :return: StreamingResponse (text/event-stream)
+
+    description:
+        run_all_task 와 같은 작업을 수행하지만, GPT 응답을 생성되는 대로 Server-Sent Events 로 전달합니다.
+        각 이벤트의 data 는 JSON 문자열 조각이며, 마지막에 done 이벤트(실패 시 error 이벤트)를 보냅니다.
+    '''
+    digest, source = await image_payload.prepare(file)
+    try:
+        img_path = await image_payload.argument(digest, source, broker, config('TOPIC_NAME'))
+    except:
+        raise HTTPException(status_code=400, detail="잘못된 파일")
+
+    chunks = broker.rpc_stream_async(
+        config('TOPIC_NAME'), "get_gpt_response_from_image_stream", img_path, story, partition_key=digest
+    )
+
+    return StreamingResponse(to_sse(chunks), media_type="text/event-stream")
+
+
+@router.post("/gpt/stream", status_code=201)
+async def get_gpt_response_stream(story: str, img_caption: str, broker: MessageBroker = Depends(get_broker)) -> StreamingResponse:
+    '''
+    Get GPT response as Server-Sent Events.
+    :param story:
+    :param img_caption:
+    :return: StreamingResponse (text/event-stream)
+    '''
+    chunks = broker.rpc_stream_async(config('TOPIC_NAME'), "get_gpt_response_stream", story, img_caption)
+
+    return StreamingResponse(to_sse(chunks), media_type="text/event-stream")
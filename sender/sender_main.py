@@ -1,20 +1,83 @@
 import os
 import sys
+import threading
 from contextlib import asynccontextmanager
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from starlette.config import Config
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from routes import routers
+from sender.core.pipline.rpc import tracing
+from sender.core.pipline.rpc.message_broker import MessageBroker
+from sender.utils import metrics
+
+config = Config('../.env')
+
+tracing.configure(config('TRACE_FILE', default=None), service="sender")
+tracing.add_listener(metrics.observe_span)
+
+host = "localhost"
+port = 9092
+
+
+def start_inprocess_receiver():
+    '''
+    RPC_TRANSPORT=inprocess 이면 receiver 를 같은 프로세스의 스레드에서 실행함 (개발, 테스트용)
+    in-process transport 의 메시지 저장소는 모듈 단위이므로 sender 와 같은 MessageBroker 클래스를 사용해야 함
+    :return: (receiver broker, serve 를 실행하는 스레드)
+    '''
+    from recever.core.pipline.rpc import tracing as receiver_tracing
+    from recever.utils import methods
+    from recever.utils import metrics as receiver_metrics
+
+    # receiver 의 utils 는 recever 쪽 tracing 모듈에 span 을 기록함
+    receiver_tracing.configure(config('TRACE_FILE', default=None), service="recever")
+    receiver_tracing.add_listener(receiver_metrics.observe_span)
+
+    receiver = MessageBroker(transport="inprocess")
+    thread = threading.Thread(
+        target=receiver.serve,
+        args=(methods, config('TOPIC_NAME')),
+        kwargs={"workers": config('RPC_WORKERS', cast=int, default=4)},
+        name="inprocess-receiver",
+        daemon=True,
+    )
+    thread.start()
+    return receiver, thread
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    pass
+    # 앱 전체에서 하나의 broker 를 공유함
+    app.state.broker = MessageBroker(
+        f"{host}:{port}",
+        linger_ms=config('KAFKA_LINGER_MS', cast=int, default=5),
+        batch_size=config('KAFKA_BATCH_SIZE', cast=int, default=16384),
+        compression_type=config('KAFKA_COMPRESSION', default=None),
+        acks=config('KAFKA_ACKS', cast=lambda v: v if v == "all" else int(v), default=1),
+        reply_topic=config('RPC_REPLY_TOPIC', default="method_results"),
+        reply_partition=config('RPC_REPLY_PARTITION', cast=int, default=0),
+        transport=config('RPC_TRANSPORT', default="kafka"),
+        socket_dir=config('RPC_SOCKET_DIR', default="/tmp/rpc"),
+    )
+    receiver = None
+    if config('RPC_TRANSPORT', default="kafka") == "inprocess":
+        receiver, receiver_thread = start_inprocess_receiver()
+    # sender 인스턴스마다 RPC_REPLY_PARTITION 을 다르게 주면 각자 자기 응답 partition 만 읽음
+    app.state.broker.ensure_topic(app.state.broker.reply_topic, app.state.broker.reply_partition + 1)
+    app.state.broker.start_result_dispatcher()
     yield
-    pass
+    if receiver is not None:
+        # 처리 중인 요청을 마치고 serve 가 반환한 뒤에 broker 를 닫음
+        receiver.stop()
+        receiver_thread.join()
+        receiver.close()
+    app.state.broker.close()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -32,6 +95,22 @@ app.add_middleware(
 )
 
 
+
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    # 요청마다 trace 를 시작하므로, 라우터와 broker 에서 만든 span 은 모두 이 span 의 자식이 됨
+    with tracing.span(f"http {request.method} {request.url.path}") as span:
+        response = await call_next(request)
+        span.set(status=response.status_code)
+        return response
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 for router in routers:
     app.include_router(router, prefix="/api")
 
@@ -0,0 +1,66 @@
+import uuid
+
+from fastapi import UploadFile
+
+from sender.core.pipline.rpc import tracing
+from sender.core.pipline.rpc.message_broker import MessageBroker
+from sender.utils.upload_store import UploadStore
+
+IMAGE_TRANSPORTS = ("path", "bytes")
+
+
+class ImagePayload:
+    '''
+    업로드 이미지를 RPC 인자로 만드는 방법을 정함
+    path: sender 에 파일로 저장하고 경로를 보냄 (sender 와 receiver 가 파일 시스템을 공유해야 함)
+    bytes: 이미지 데이터를 msgpack bin 으로 요청에 넣어 보냄. inline_max_bytes 보다 크면
+           chunk_bytes 크기의 조각으로 나눠 put_blob_chunk 로 먼저 보내고 요청에는 {"blob": id} 를 넣음
+    '''
+
+    def __init__(
+            self,
+            store: UploadStore,
+            mode: str = "path",
+            inline_max_bytes: int = 512 * 1024,
+            chunk_bytes: int = 512 * 1024):
+        if mode not in IMAGE_TRANSPORTS:
+            raise ValueError(f"Unknown image transport: {mode} (available: {', '.join(IMAGE_TRANSPORTS)})")
+
+        self.store = store
+        self.mode = mode
+        self.inline_max_bytes = inline_max_bytes
+        self.chunk_bytes = chunk_bytes
+
+    async def prepare(self, file: UploadFile) -> tuple[str, str | bytes]:
+        '''
+        업로드 파일을 읽음 (path 모드는 파일로 저장하고, bytes 모드는 메모리로만 읽음)
+        :param file: 업로드 파일
+        :return: (sha256 해시, 파일 경로 또는 파일 내용)
+        '''
+        with tracing.span("upload", mode=self.mode):
+            if self.mode == "path":
+                return await self.store.save(file)
+            return await self.store.read(file)
+
+    async def argument(self, digest: str, source: str | bytes, broker: MessageBroker, topic_name: str) -> str | bytes | dict:
+        '''
+        prepare 의 결과를 RPC 인자로 만듦
+        조각은 이미지 해시를 partition key 로 보내므로, 같은 key 로 보내는 요청과 같은 receiver 에 도착함
+        :param digest: sha256 해시
+        :param source: 파일 경로 또는 파일 내용
+        :param broker: 조각을 보낼 broker
+        :param topic_name: RPC 토픽
+        :return: 파일 경로, 파일 내용 또는 blob 참조
+        '''
+        if isinstance(source, str) or len(source) <= self.inline_max_bytes:
+            return source
+
+        # 같은 이미지의 요청이 동시에 들어와도 receiver 가 각자 따로 가져가도록 요청마다 다른 id 를 씀
+        blob_id = f"{digest}.{uuid.uuid4().hex[:8]}"
+        chunks = [source[i:i + self.chunk_bytes] for i in range(0, len(source), self.chunk_bytes)]
+        for seq, chunk in enumerate(chunks):
+            await broker.rpc_oneway_async(
+                topic_name, "put_blob_chunk", blob_id, seq, len(chunks), chunk, partition_key=digest
+            )
+
+        return {"blob": blob_id, "size": len(source)}
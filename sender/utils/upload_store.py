@@ -0,0 +1,149 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import anyio
+from fastapi import UploadFile
+
+
+class UploadStore:
+    '''
+    업로드된 파일을 내용의 sha256 해시를 이름으로 저장하는 저장소
+    같은 내용의 파일은 한 번만 저장되며, 전체 크기와 보관 기간을 넘으면 오래 사용하지 않은 파일부터 삭제함
+    '''
+
+    def __init__(
+            self,
+            root: str = "./file",
+            max_bytes: int = 1024 * 1024 * 1024,
+            ttl: float = 24 * 60 * 60,
+            chunk_size: int = 1024 * 1024):
+        self.root = Path(root).absolute()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self._evict_lock = threading.Lock()
+
+    def path_of(self, digest: str) -> str:
+        return str(self.root / digest)
+
+    async def save(self, file: UploadFile) -> tuple[str, str]:
+        '''
+        업로드 파일을 스트리밍으로 읽으면서 해시를 계산하고 저장함
+        이미 같은 내용의 파일이 있으면 새로 쓰지 않음
+        :param file: 업로드 파일
+        :return: (sha256 해시, 저장된 파일의 절대 경로)
+        '''
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        h = hashlib.sha256()
+        part = anyio.Path(self.root / f".{uuid.uuid4().hex}.part")
+        async with await anyio.open_file(part, "wb") as buffer:
+            while chunk := await file.read(self.chunk_size):
+                h.update(chunk)
+                await buffer.write(chunk)
+
+        digest = h.hexdigest()
+        path = self.path_of(digest)
+
+        if await anyio.to_thread.run_sync(self.__store__, str(part), path):
+            await anyio.to_thread.run_sync(self.evict)
+
+        return digest, path
+
+    def __store__(self, part: str, path: str) -> bool:
+        '''
+        임시 파일을 path 로 옮김. 같은 내용의 파일이 이미 있으면 임시 파일을 지우고 최근에 사용한 파일로 표시함 (LRU)
+        evict 와 같은 잠금 안에서 확인하므로, 확인한 파일이 그 사이에 지워지지 않음
+        :return: 새로 저장했는지 여부
+        '''
+        with self._evict_lock:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                os.replace(part, path)
+                return True
+
+            os.remove(part)
+            return False
+
+    async def read(self, file: UploadFile) -> tuple[str, bytes]:
+        '''
+        업로드 파일을 저장하지 않고 메모리로 읽으면서 해시를 계산함
+        :param file: 업로드 파일
+        :return: (sha256 해시, 파일 내용)
+        '''
+        h = hashlib.sha256()
+        data = bytearray()
+        while chunk := await file.read(self.chunk_size):
+            h.update(chunk)
+            data += chunk
+
+        return h.hexdigest(), bytes(data)
+
+    def evict(self) -> None:
+        '''
+        보관 기간이 지난 파일을 지우고, 전체 크기가 max_bytes 를 넘으면 가장 오래 사용하지 않은 파일부터 지움
+        '''
+        with self._evict_lock:
+            now = time.time()
+            entries = []
+            for entry in os.scandir(self.root):
+                if not entry.is_file() or entry.name.startswith("."):
+                    continue
+                stat = entry.stat()
+                if now - stat.st_mtime > self.ttl:
+                    _remove(entry.path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                _remove(path)
+                total -= size
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ResultCache:
+    '''
+    RPC 결과를 보관하는 LRU + TTL 캐시
+    '''
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 60 * 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
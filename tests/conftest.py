@@ -0,0 +1,5 @@
+import os
+import sys
+
+# recever / sender 패키지를 저장소 루트 기준으로 import 함
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
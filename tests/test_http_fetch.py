@@ -0,0 +1,71 @@
+'''
+원격 이미지 요청이 호출마다 같은 keep-alive 연결을 재사용하고, 호스트별 제한이 한없이 늘어나지 않는지 확인함
+'''
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from recever.utils import http_fetch
+from recever.utils.http_fetch import HostLimits, fetch_many, fetch_many_async
+
+BODY = b"image" * 100
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.connections = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_many_reuses_connection(server):
+    url = f"http://127.0.0.1:{server.server_port}/image.jpg"
+
+    assert fetch_many([url]) == [BODY]
+    # 다른 이벤트 루프에서 호출해도 같은 클라이언트와 연결을 사용함
+    assert asyncio.run(fetch_many_async([url])) == [BODY]
+    assert fetch_many([url]) == [BODY]
+
+    assert len(server.connections) == 1
+
+
+def test_host_limits_evicts_idle_hosts():
+    limits = HostLimits(limit=2, max_hosts=3)
+
+    with limits.hold("busy") as busy:
+        for i in range(10):
+            with limits.hold(f"host{i}"):
+                pass
+        assert len(limits) == 3
+
+        # 요청 중인 호스트는 지우지 않으므로 같은 semaphore 를 계속 사용함
+        with limits.hold("busy") as again:
+            assert again is busy
+
+
+def test_fetch_many_keeps_host_limits_bounded(server, monkeypatch):
+    monkeypatch.setattr(http_fetch, "_async_host_limits", HostLimits(2, max_hosts=1, semaphore=asyncio.Semaphore))
+    urls = [f"http://127.0.0.1:{server.server_port}/{i}" for i in range(3)] + [f"http://localhost:{server.server_port}/"]
+
+    assert fetch_many(urls) == [BODY] * 4
+    assert len(http_fetch._async_host_limits) == 1
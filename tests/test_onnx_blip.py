@@ -0,0 +1,93 @@
+'''
+ONNX Runtime 캡션 경로가 HF(PyTorch) generate 와 같은 캡션을 만드는지 확인함
+기본은 작은 BLIP 을 무작위로 초기화해서 사용함 (BLIP_TEST_MODEL 로 실제 체크포인트 경로를 줄 수 있음)
+'''
+import os
+
+import pytest
+import torch
+from PIL import Image
+
+pytest.importorskip("onnxruntime")
+
+from transformers import BertTokenizer, BlipConfig, BlipForConditionalGeneration, BlipImageProcessor, BlipProcessor
+
+from recever.utils.ImageCaption.onnx_blip import OnnxBlipCaptioner, export_onnx
+
+MODEL_NAME = os.environ.get("BLIP_TEST_MODEL")
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def _tiny_blip(output_dir: str) -> str:
+    '''
+    단어 100개짜리 작은 BLIP 을 무작위로 초기화해서 저장함
+    logits 가 거의 균등하면 beam 순서가 오차에 따라 달라지므로 초기화 범위를 키우고,
+    [SEP] 이 생성 중간에 나와서 beam 종료 규칙을 거치도록 [SEP] 의 bias 를 조정함
+    '''
+    words = ["[PAD]", "[UNK]", "[SEP]", "[CLS]", "[MASK]"] + [f"w{i}" for i in range(94)] + ["[DEC]"]
+    vocab_file = os.path.join(output_dir, "vocab.txt")
+    with open(vocab_file, "w") as f:
+        f.write("\n".join(words) + "\n")
+
+    config = BlipConfig(
+        text_config=dict(vocab_size=len(words), hidden_size=32, num_hidden_layers=2, num_attention_heads=4,
+                         intermediate_size=64, bos_token_id=99, sep_token_id=2, pad_token_id=0, initializer_range=0.5),
+        vision_config=dict(hidden_size=32, num_hidden_layers=2, num_attention_heads=4, intermediate_size=64,
+                           image_size=64, patch_size=16, initializer_range=1.0),
+    )
+    torch.manual_seed(0)
+    model = BlipForConditionalGeneration(config).eval()
+    with torch.no_grad():
+        model.text_decoder.cls.predictions.decoder.bias[config.text_config.sep_token_id] = 0.2
+
+    model_dir = os.path.join(output_dir, "model")
+    model.save_pretrained(model_dir)
+    tokenizer = BertTokenizer(vocab_file, bos_token="[DEC]")
+    BlipProcessor(BlipImageProcessor(size={"height": 64, "width": 64}), tokenizer).save_pretrained(model_dir)
+    return model_dir
+
+
+@pytest.fixture(scope="module")
+def models(tmp_path_factory):
+    model_name = MODEL_NAME or _tiny_blip(str(tmp_path_factory.mktemp("blip_model")))
+    try:
+        processor = BlipProcessor.from_pretrained(model_name, local_files_only=True)
+        model = BlipForConditionalGeneration.from_pretrained(model_name, local_files_only=True).eval()
+    except OSError:
+        pytest.skip(f"BLIP model {model_name} is not available locally")
+
+    onnx_dir = export_onnx(model_name, str(tmp_path_factory.mktemp("blip_onnx")))
+    return processor, model, OnnxBlipCaptioner(onnx_dir)
+
+
+@pytest.fixture(scope="module")
+def images():
+    return [Image.open(os.path.join(IMAGE_DIR, name)).convert("RGB")
+            for name in ("astronaut.jpg", "coffee.jpg", "chelsea.jpg")]
+
+
+@pytest.mark.parametrize("prompt, num_beams", [
+    (None, 1), ("a picture of", 1), (None, 3), ("a picture of", 3), (None, 4),
+])
+def test_onnx_captions_match_hf(models, images, prompt, num_beams):
+    processor, model, captioner = models
+
+    inputs = processor(images=images, text=[prompt] * len(images) if prompt else None, return_tensors="pt")
+    with torch.no_grad():
+        expected = processor.batch_decode(model.generate(**inputs, num_beams=num_beams), skip_special_tokens=True)
+
+    assert captioner.decode(captioner.encode(images), prompt=prompt, num_beams=num_beams) == expected
+
+
+@pytest.mark.parametrize("length_penalty, early_stopping", [(2.0, False), (0.5, True), (1.5, "never"), (-1.0, "never")])
+def test_onnx_beam_search_options_match_hf(models, images, length_penalty, early_stopping):
+    processor, model, captioner = models
+
+    inputs = processor(images=images, return_tensors="pt")
+    with torch.no_grad():
+        sequences = model.generate(**inputs, num_beams=3, length_penalty=length_penalty, early_stopping=early_stopping)
+    expected = processor.batch_decode(sequences, skip_special_tokens=True)
+
+    sequences = captioner.beam_search(captioner.encode(images), 3,
+                                      length_penalty=length_penalty, early_stopping=early_stopping)
+    assert processor.batch_decode(sequences, skip_special_tokens=True) == expected
@@ -0,0 +1,37 @@
+'''
+여러 스레드가 동시에 PerceptualCache 에 저장해도 저장 파일이 깨지지 않는지 확인함
+'''
+import json
+import os
+import threading
+
+from recever.utils.phash_cache import PerceptualCache
+
+
+def test_concurrent_saves_keep_file_valid(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = PerceptualCache("test_concurrent_save", capacity=4096, threshold=0, persist_path=path, persist_every=1)
+    errors = []
+
+    def worker(offset):
+        try:
+            for i in range(200):
+                cache.set(offset * 1000 + i, {"caption": f"image {offset} {i}"})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cache.save()
+
+    assert errors == []
+    with open(path, encoding="utf-8") as f:
+        assert len(json.load(f)) == 8 * 200
+    # 임시 파일이 남지 않음
+    assert os.listdir(tmp_path) == ["cache.json"]
+
+    reloaded = PerceptualCache("test_concurrent_load", threshold=0, capacity=4096, persist_path=path)
+    assert reloaded.get(7 * 1000 + 199) == (True, {"caption": "image 7 199"})
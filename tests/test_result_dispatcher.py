@@ -0,0 +1,85 @@
+'''
+ResultDispatcher 가 poll 오류와 형식이 잘못된 응답에도 계속 동작하고,
+계속 실패하면 기다리던 요청을 rpc_timeout 까지 기다리지 않고 바로 실패시키는지 확인함
+'''
+import asyncio
+import queue
+
+import pytest
+
+from recever.core.pipline.rpc.message_broker import ResultDispatcher
+from recever.core.pipline.rpc.transport import Record
+
+
+class FakeConsumer:
+    '''
+    poll 할 때마다 steps 에서 하나씩 꺼내서, 예외이면 raise 하고 아니면 응답 목록으로 돌려줌
+    '''
+
+    def __init__(self):
+        self.steps = queue.Queue()
+
+    def poll(self, timeout_ms=0, max_records=None):
+        try:
+            step = self.steps.get(timeout=timeout_ms / 1000)
+        except queue.Empty:
+            return {}
+        if isinstance(step, Exception):
+            raise step
+        return {"results": step}
+
+    def close(self):
+        pass
+
+
+class FakeTransport:
+    def __init__(self, consumer):
+        self.consumer = consumer
+
+    def reply_consumer(self, topic_name, partition):
+        return self.consumer
+
+
+def reply(request_id, value):
+    return Record("method_results", 0, request_id.encode() if isinstance(request_id, str) else request_id, value, 0)
+
+
+def test_dispatcher_survives_poll_errors_and_bad_replies():
+    consumer = FakeConsumer()
+    dispatcher = ResultDispatcher(FakeTransport(consumer), poll_timeout_ms=10)
+
+    async def run():
+        future = dispatcher.register("a", timeout=5)
+        consumer.steps.put(ConnectionError("broker unavailable"))
+        consumer.steps.put([reply(b"\xff", {"result": 0}), reply("a", None)])
+        consumer.steps.put([reply("a", {"jsonrpc": "2.0", "id": "a", "result": 1})])
+        return await asyncio.wait_for(future, 5)
+
+    try:
+        assert asyncio.run(run())["result"] == 1
+        assert dispatcher.error is None
+    finally:
+        dispatcher.close()
+
+
+def test_dispatcher_fails_pending_requests_after_repeated_errors():
+    consumer = FakeConsumer()
+    dispatcher = ResultDispatcher(FakeTransport(consumer), poll_timeout_ms=10, max_errors=2)
+
+    async def run():
+        future = dispatcher.register("a", timeout=300)
+        stream = dispatcher.register_stream("b", timeout=300)
+        for _ in range(2):
+            consumer.steps.put(ConnectionError("broker unavailable"))
+
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(future, 5)
+        assert isinstance(await asyncio.wait_for(stream.get(), 5), ConnectionError)
+
+        with pytest.raises(Exception, match="result dispatcher stopped"):
+            dispatcher.register("c", timeout=300)
+
+    try:
+        asyncio.run(run())
+    finally:
+        dispatcher.close()
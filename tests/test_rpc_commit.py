@@ -0,0 +1,66 @@
+'''
+처리나 응답 전송에 실패한 요청이 있으면 그 요청 뒤의 offset 을 commit 하지 않는지 확인함 (at-least-once)
+'''
+import sys
+import threading
+import time
+import uuid
+
+import pytest
+
+from recever.core.pipline.rpc.message_broker import MessageBroker
+
+handled = []
+
+
+def echo(value):
+    handled.append(value)
+    return value
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_failed_request_is_not_committed(workers):
+    topic_name = f"test_{uuid.uuid4().hex[:8]}"
+    handled.clear()
+
+    client = MessageBroker(transport="inprocess")
+    for value in range(5):
+        client.rpc_oneway(topic_name, "echo", value)
+
+    receiver = MessageBroker(transport="inprocess")
+    commits = []
+    receiver.__commit_async__ = lambda name, offsets: commits.append(offsets)
+
+    deliver_result = receiver.__deliver_result__
+    send_result = receiver.__send_result__
+
+    async def failing_deliver_result(request, body):
+        if request["params"] == [2]:
+            raise RuntimeError("delivery failed")
+        await deliver_result(request, body)
+
+    def failing_send_result(request, body):
+        if request["params"] == [2]:
+            raise RuntimeError("delivery failed")
+        return send_result(request, body)
+
+    # workers=0 은 __send_result__ 로, 워커 풀은 __deliver_result__ 로 응답을 보냄
+    receiver.__deliver_result__ = failing_deliver_result
+    receiver.__send_result__ = failing_send_result
+
+    thread = threading.Thread(
+        target=receiver.serve, args=(sys.modules[__name__], topic_name), kwargs={"workers": workers}, daemon=True
+    )
+    thread.start()
+    deadline = time.monotonic() + 10
+    while len(handled) < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    receiver.stop()
+    thread.join()
+    receiver.close()
+    client.close()
+
+    assert sorted(handled) == [0, 1, 2, 3, 4]
+    committed = [offset.offset for offsets in commits for offset in offsets.values()]
+    assert committed and max(committed) == 2
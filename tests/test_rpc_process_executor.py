@@ -0,0 +1,109 @@
+'''
+프로세스 워커(executor="process")로 RPC 와 이미지 파이프라인을 실행할 때 큰 이미지의 blob 조각이
+serve 하는 프로세스에 모이고, {"blob": id} 인자가 데이터로 바뀌어 워커에 전달되는지 확인함
+'''
+import asyncio
+import io
+import os
+import sys
+import threading
+import uuid
+
+import pytest
+from PIL import Image
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from recever.core.pipline.rpc.message_broker import MessageBroker
+from recever.utils import methods
+from recever.utils.image_util import get_image_from_url
+from recever.utils.pipeline import StageGraph
+
+# 이 모듈을 RPC 메소드 모듈로 사용함 (프로세스 워커는 모듈 이름으로 다시 import 함)
+LOCAL_METHODS = methods.LOCAL_METHODS
+put_blob_chunk = methods.put_blob_chunk
+resolve_params = methods.resolve_params
+
+
+def image_size(img_path):
+    return list(get_image_from_url(img_path, max_side=None).size)
+
+
+def size_stage(image):
+    return list(image.size)
+
+
+def mode_stage(image):
+    return image.mode
+
+
+def png_bytes(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 40, 40)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def split(data, chunk_bytes):
+    return [data[i:i + chunk_bytes] for i in range(0, len(data), chunk_bytes)]
+
+
+@pytest.fixture
+def receiver():
+    topic_name = f"test_{uuid.uuid4().hex[:8]}"
+    receiver = MessageBroker(transport="inprocess")
+    thread = threading.Thread(
+        target=receiver.serve,
+        args=(sys.modules[__name__], topic_name),
+        kwargs={"workers": 2, "executor": "process"},
+        daemon=True,
+    )
+    thread.start()
+    yield topic_name
+
+    receiver.stop()
+    thread.join()
+    receiver.close()
+
+
+def test_blob_request_with_process_executor(receiver):
+    async def run():
+        client = MessageBroker(transport="inprocess", reply_topic=f"{receiver}_results")
+        client.ensure_topic(client.reply_topic, 1)
+        client.start_result_dispatcher()
+        try:
+            # 워커 프로세스를 조각을 보내기 전에 먼저 만들어둠
+            assert await client.rpc_async(receiver, "image_size", png_bytes(8, 6)) == [8, 6]
+
+            data = png_bytes(64, 48)
+            blob_id = uuid.uuid4().hex
+            chunks = split(data, 64)
+            for seq, chunk in enumerate(chunks):
+                await client.rpc_oneway_async(receiver, "put_blob_chunk", blob_id, seq, len(chunks), chunk)
+            return await client.rpc_async(receiver, "image_size", {"blob": blob_id, "size": len(data)})
+        finally:
+            client.close()
+
+    assert asyncio.run(run()) == [64, 48]
+
+
+def test_image_pipeline_resolves_blob_with_process_executor(monkeypatch):
+    graph = (
+        StageGraph("test_image_info", executor="process", workers=1)
+        .stage("image", get_image_from_url, deps=("url",))
+        .stage("caption", size_stage, deps=("image",))
+        .stage("emotions", mode_stage, deps=("image",))
+    )
+    # 워커 프로세스를 조각을 받기 전에 먼저 만들어둠
+    graph.start()
+    monkeypatch.setattr(methods, "image_info_pipeline", graph)
+
+    try:
+        data = png_bytes(32, 16)
+        blob_id = uuid.uuid4().hex
+        chunks = split(data, 50)
+        for seq, chunk in enumerate(chunks):
+            methods.put_blob_chunk(blob_id, seq, len(chunks), chunk)
+
+        assert methods.get_image_info({"blob": blob_id}) == {"caption": [32, 16], "emotions": "RGB"}
+    finally:
+        graph.close()
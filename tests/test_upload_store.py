@@ -0,0 +1,47 @@
+'''
+같은 파일의 업로드와 evict 가 동시에 실행되어도 업로드가 실패하지 않는지 확인함
+'''
+import asyncio
+import os
+import threading
+
+from sender.utils.upload_store import UploadStore
+
+
+class FakeUpload:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def read(self, size: int = -1) -> bytes:
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+
+def test_save_while_evicting_same_file(tmp_path):
+    # max_bytes=0 이므로 evict 는 저장된 파일을 모두 지움
+    store = UploadStore(str(tmp_path), max_bytes=0)
+    data = b"image" * 1000
+    stop = threading.Event()
+
+    def evict_loop():
+        while not stop.is_set():
+            store.evict()
+
+    async def run():
+        digests = set()
+        for _ in range(50):
+            results = await asyncio.gather(*(store.save(FakeUpload(data)) for _ in range(8)))
+            digests.update(digest for digest, _ in results)
+        return digests
+
+    thread = threading.Thread(target=evict_loop)
+    thread.start()
+    try:
+        digests = asyncio.run(run())
+    finally:
+        stop.set()
+        thread.join()
+
+    assert len(digests) == 1
+    # 임시 파일이 남지 않음
+    assert [name for name in os.listdir(tmp_path) if name.startswith(".")] == []